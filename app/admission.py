@@ -0,0 +1,208 @@
+import asyncio
+import math
+import time
+from collections import Counter, deque, namedtuple
+from typing import Optional
+
+from starlette.responses import PlainTextResponse
+
+from app.config import (
+    ADMISSION_ENABLED,
+    ADMISSION_INITIAL_LIMIT,
+    ADMISSION_MAX_LIMIT,
+    ADMISSION_MIN_LIMIT,
+    ADMISSION_RETRY_AFTER_SEC,
+    ADMISSION_TOLERANCE,
+)
+
+# share: fraction of the limit the class may fill, so lower classes leave
+# headroom for higher ones; wait: how long a request may queue for a slot;
+# queue: queue length allowed, as a multiple of the current limit
+Priority = namedtuple("Priority", ("share", "wait", "queue"))
+CLASSES = {
+    "critical": Priority(1.0, 2.0, 4.0),
+    "marketing": Priority(0.8, 0.5, 1.0),
+    "admin": Priority(0.5, 0.1, 0.25),
+}
+ORDER = tuple(CLASSES)
+# first match wins; None = not limited (how overload gets watched and profiled)
+ROUTES = (
+    ("/r/", "critical"),
+    ("/u/", "critical"),
+    ("/api/pages", "critical"),
+    ("/og/", "critical"),
+    ("/api/health", None),
+    ("/admin/metrics", None),
+    ("/admin/profile", None),
+    ("/admin", "admin"),
+)
+WINDOW_SEC = 0.5
+WINDOW_MIN_SAMPLES = 5
+
+
+def classify(path: str) -> Optional[str]:
+    for prefix, cls in ROUTES:
+        if path.startswith(prefix):
+            return cls
+    return "marketing"
+
+
+class AdaptiveLimiter:
+    # concurrency limit found from latency, gradient style: while requests
+    # finish about as fast as the long-run baseline the limit grows by
+    # ~sqrt(limit) per window; once they slow past `tolerance` times the
+    # baseline it shrinks in proportion. Runs on one event loop, no locks.
+    def __init__(self, initial: int = ADMISSION_INITIAL_LIMIT, min_limit: int = ADMISSION_MIN_LIMIT,
+                 max_limit: int = ADMISSION_MAX_LIMIT, tolerance: float = ADMISSION_TOLERANCE, smoothing: float = 0.2):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.inflight = 0
+        self.baseline = None
+        self.waiters = {cls: deque() for cls in ORDER}
+        self.counts = {cls: Counter() for cls in ORDER}
+        self._window = [0.0, 0, 0, time.monotonic()]  # latency sum, samples, peak inflight, start
+
+    def _cap(self, cls: str) -> int:
+        return max(1, int(self.limit * CLASSES[cls].share))
+
+    def _ahead(self, cls: str) -> bool:
+        for other in ORDER:
+            if self.waiters[other]:
+                return True
+            if other == cls:
+                return False
+        return False
+
+    def _take(self, cls: str):
+        self.inflight += 1
+        self.counts[cls]["inflight"] += 1
+        self._window[2] = max(self._window[2], self.inflight)
+
+    async def acquire(self, cls: str) -> bool:
+        self.counts[cls]["requests"] += 1
+        if self.inflight < self._cap(cls) and not self._ahead(cls):
+            self._take(cls)
+            return True
+        queue = self.waiters[cls]
+        if len(queue) >= max(1, int(self.limit * CLASSES[cls].queue)):
+            self.counts[cls]["shed"] += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self.counts[cls]["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, CLASSES[cls].wait)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return True  # granted just as the wait ran out
+            self.counts[cls]["shed"] += 1
+            return False
+        except asyncio.CancelledError:
+            # client went away; hand back a slot granted in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release(cls, None)
+            raise
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+
+    def release(self, cls: str, latency: Optional[float]):
+        self.inflight -= 1
+        self.counts[cls]["inflight"] -= 1
+        if latency is not None:
+            self._observe(latency)
+        self._wake()
+
+    def _wake(self):
+        for cls in ORDER:
+            queue = self.waiters[cls]
+            while queue and self.inflight < self._cap(cls):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self._take(cls)
+                waiter.set_result(True)
+            if queue:
+                return  # keep lower classes behind a waiting higher one
+
+    def _observe(self, latency: float):
+        window = self._window
+        window[0] += latency
+        window[1] += 1
+        now = time.monotonic()
+        if window[1] < WINDOW_MIN_SAMPLES or now - window[3] < WINDOW_SEC:
+            return
+        sample = window[0] / window[1]
+        peak = window[2]
+        self._window = [0.0, 0, self.inflight, now]
+        if self.baseline is None:
+            self.baseline = sample
+        else:
+            self.baseline = self.baseline * 0.95 + sample * 0.05
+            if self.baseline > sample * 2:
+                self.baseline = sample  # the service got faster; don't keep an old slow baseline
+        gradient = max(0.5, min(1.0, self.tolerance * self.baseline / sample))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        if peak < self.limit / 2:
+            target = min(target, self.limit)  # not using the limit: no evidence it could be higher
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = min(self.max_limit, max(self.min_limit, limit))
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 1),
+            "inflight": self.inflight,
+            "baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+            "classes": {
+                cls: {
+                    "inflight": self.counts[cls]["inflight"],
+                    "queue_depth": len(self.waiters[cls]),
+                    "requests": self.counts[cls]["requests"],
+                    "queued": self.counts[cls]["queued"],
+                    "shed": self.counts[cls]["shed"],
+                }
+                for cls in ORDER
+            },
+        }
+
+
+limiter = AdaptiveLimiter()
+
+
+class AdmissionMiddleware:
+    # admits requests under the adaptive limit by priority class; what can't
+    # get a slot within its class's wait is shed with 503 and Retry-After
+    def __init__(self, app, limiter: AdaptiveLimiter = limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        cls = classify(scope["path"]) if scope["type"] == "http" and ADMISSION_ENABLED else None
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+        if not await self.limiter.acquire(cls):
+            response = PlainTextResponse(
+                "Server busy, retry shortly", status_code=503,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SEC)},
+            )
+            await response(scope, receive, send)
+            return
+        start = time.monotonic()
+        latency = None
+        try:
+            await self.app(scope, receive, send)
+            # admin work (exports, reports) is slow by nature and would drag
+            # the baseline; only the other classes steer the limit
+            if cls != "admin":
+                latency = time.monotonic() - start
+        finally:
+            self.limiter.release(cls, latency)
+
+
+def admission_stats() -> dict:
+    return limiter.stats()
@@ -0,0 +1,304 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.analytics_db import partition_conns, totals_conn
+from app.config import SERIES_CACHE_MAX, UNIQUES_CACHE_MAX
+from app.db import get_conn
+from app.replica import report_as_of
+from app.hll import HyperLogLog, hash64
+
+EVENT_TYPES = {"views": "view", "clicks": "click"}
+BUCKET_EXPR = {
+    "hour": "bucket",
+    "day": "substr(bucket, 1, 10)",
+    "week": "date(substr(bucket, 1, 10), 'weekday 0', '-6 days')",
+    "hour_of_day": "substr(bucket, 12, 2)",
+}
+
+# page_id 0 holds the site-wide sketch for the day
+ALL_PAGES = 0
+# decay time constants for the trending leaderboards
+TRENDING_PERIODS = {"24h": 86400.0, "7d": 7 * 86400.0}
+TRENDING_EPOCH = 1704067200.0  # 2024-01-01T00:00:00Z
+
+_series_cache = OrderedDict()
+_series_lock = threading.Lock()
+# sketches this process has seen; always a lower bound of the stored row,
+# so an add that doesn't raise a local register can skip the database
+_sketches = OrderedDict()
+_sketch_lock = threading.Lock()
+
+
+def hour_key(ts: datetime) -> str:
+    return ts.strftime("%Y-%m-%dT%H")
+
+
+def ceil_hour(ts: datetime) -> datetime:
+    floor = ts.replace(minute=0, second=0, microsecond=0)
+    return floor if floor == ts else floor + timedelta(hours=1)
+
+
+def bump_rollup(conn, page_id: int, link_id: Optional[int], event_type: str, created_at: str):
+    conn.execute(
+        """
+        INSERT INTO analytics_hourly (page_id, event_type, bucket, link_id, count) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(page_id, event_type, bucket, link_id) DO UPDATE SET count=count+1
+        """,
+        (page_id, event_type, created_at[:13], link_id or 0),
+    )
+
+
+def bump_country(conn, page_id: int, event_type: str, country: Optional[str], created_at: str):
+    # daily rather than hourly: the breakdown is only ever asked for by day
+    # ranges, and country multiplies the row count
+    conn.execute(
+        """
+        INSERT INTO analytics_countries (page_id, event_type, day, country, count) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(page_id, event_type, day, country) DO UPDATE SET count=count+1
+        """,
+        (page_id, event_type, created_at[:10], country or ""),
+    )
+
+
+def top_countries(page_id: int, start_day: str, event_type: str = "view", n: int = 5) -> list:
+    # "" collects visits the range table had no answer for
+    counts = {}
+    for _, conn in partition_conns(start_day[:7]):
+        for r in conn.execute(
+            "SELECT country, SUM(count) c FROM analytics_countries WHERE page_id=? AND event_type=? AND day>=? GROUP BY country",
+            (page_id, event_type, start_day),
+        ):
+            counts[r["country"]] = counts.get(r["country"], 0) + r["c"]
+    ranked = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+    return [{"country": country, "c": c} for country, c in ranked]
+
+
+def floor_bucket(ts: datetime, bucket: str) -> datetime:
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if bucket == "hour":
+        return ts
+    ts = ts.replace(hour=0)
+    if bucket == "week":
+        ts -= timedelta(days=ts.weekday())
+    return ts
+
+
+def bucket_labels(start: datetime, end: datetime, bucket: str) -> list:
+    if bucket == "hour_of_day":
+        return [f"{h:02d}" for h in range(24)]
+    step = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(days=7)}[bucket]
+    fmt = "%Y-%m-%dT%H" if bucket == "hour" else "%Y-%m-%d"
+    labels = []
+    cur = floor_bucket(start, bucket)
+    while cur < end:
+        labels.append(cur.strftime(fmt))
+        cur += step
+    return labels
+
+
+def _query_counts(page_id: int, event_type: str, start: datetime, end: datetime, bucket: str, link_id: Optional[int]) -> dict:
+    sql = f"""
+        SELECT {BUCKET_EXPR[bucket]} b, SUM(count) c
+        FROM analytics_hourly
+        WHERE page_id=? AND event_type=? AND bucket>=? AND bucket<?
+    """
+    params = [page_id, event_type, hour_key(start), hour_key(ceil_hour(end))]
+    if link_id is not None:
+        sql += " AND link_id=?"
+        params.append(link_id)
+    sql += " GROUP BY b"
+    counts = {}
+    # a week or hour-of-day bucket can span months, so partials are summed
+    for _, conn in partition_conns(params[2][:7], params[3][:7]):
+        for r in conn.execute(sql, params):
+            counts[r["b"]] = counts.get(r["b"], 0) + r["c"]
+    return counts
+
+
+def _cached_counts(key, loader) -> dict:
+    with _series_lock:
+        hit = _series_cache.get(key)
+        if hit is not None:
+            _series_cache.move_to_end(key)
+            return hit
+    counts = loader()
+    with _series_lock:
+        _series_cache[key] = counts
+        while len(_series_cache) > SERIES_CACHE_MAX:
+            _series_cache.popitem(last=False)
+    return counts
+
+
+def series(page_id: int, metric: str, start: datetime, end: datetime, bucket: str = "day", link_id: Optional[int] = None, now: Optional[datetime] = None) -> list:
+    event_type = EVENT_TYPES[metric]
+    if now is None:
+        # with a reporting snapshot, hours are only final up to its copy time
+        as_of = report_as_of()
+        now = datetime.fromisoformat(as_of) if as_of else datetime.utcnow()
+    # closed hours never change, so they are cached under a key that moves
+    # forward as hours close; only the open hour is read live
+    closed_end = min(end, floor_bucket(now, "hour"))
+    counts = {}
+    if closed_end > start:
+        key = (page_id, event_type, bucket, link_id, hour_key(start), hour_key(closed_end))
+        counts.update(_cached_counts(key, lambda: _query_counts(page_id, event_type, start, closed_end, bucket, link_id)))
+    if end > closed_end:
+        for b, c in _query_counts(page_id, event_type, max(start, closed_end), end, bucket, link_id).items():
+            counts[b] = counts.get(b, 0) + c
+    return [{"bucket": b, "count": counts.get(b, 0)} for b in bucket_labels(start, end, bucket)]
+
+
+def totals(page_id: int, since: Optional[datetime] = None) -> dict:
+    sql = "SELECT event_type, SUM(count) c FROM analytics_hourly WHERE page_id=?"
+    params = [page_id]
+    if since is not None:
+        sql += " AND bucket>=?"
+        params.append(hour_key(since))
+    sql += " GROUP BY event_type"
+    rows = {}
+    for _, conn in partition_conns(hour_key(since)[:7] if since is not None else None):
+        for r in conn.execute(sql, params):
+            rows[r["event_type"]] = rows.get(r["event_type"], 0) + r["c"]
+    return {"views": rows.get("view", 0), "clicks": rows.get("click", 0)}
+
+
+def site_totals() -> dict:
+    rows = {}
+    for _, conn in partition_conns():
+        for r in conn.execute("SELECT event_type, SUM(count) c FROM analytics_hourly GROUP BY event_type"):
+            rows[r["event_type"]] = rows.get(r["event_type"], 0) + r["c"]
+    return {"views": rows.get("view", 0), "clicks": rows.get("click", 0)}
+
+
+def visitor_fingerprint(ip: str, ua: str) -> int:
+    return hash64(f"{ip}|{ua}")
+
+
+def _load_sketch(conn, page_id: int, day: str) -> HyperLogLog:
+    row = conn.execute("SELECT sketch FROM page_uniques WHERE page_id=? AND day=?", (page_id, day)).fetchone()
+    return HyperLogLog.from_bytes(row["sketch"]) if row else HyperLogLog()
+
+
+def _add_to_sketch(conn, page_id: int, day: str, h: int):
+    key = (page_id, day)
+    with _sketch_lock:
+        sketch = _sketches.get(key)
+        if sketch is not None:
+            _sketches.move_to_end(key)
+    if sketch is None:
+        sketch = _load_sketch(conn, page_id, day)
+    with _sketch_lock:
+        _sketches[key] = sketch
+        while len(_sketches) > UNIQUES_CACHE_MAX:
+            _sketches.popitem(last=False)
+        changed = sketch.add_hash(h)
+    if not changed:
+        return
+    merged = _load_sketch(conn, page_id, day).merge(sketch)
+    conn.execute(
+        "INSERT INTO page_uniques (page_id, day, sketch) VALUES (?, ?, ?) ON CONFLICT(page_id, day) DO UPDATE SET sketch=excluded.sketch",
+        (page_id, day, merged.to_bytes()),
+    )
+
+
+def add_unique(conn, page_id: int, h: int, created_at: str):
+    day = created_at[:10]
+    _add_to_sketch(conn, page_id, day, h)
+    _add_to_sketch(conn, ALL_PAGES, day, h)
+
+
+def unique_visitors(page_id: int, start_day: str, end_day: str) -> int:
+    sketch = HyperLogLog()
+    found = False
+    for _, conn in partition_conns(start_day[:7], end_day[:7]):
+        for r in conn.execute(
+            "SELECT sketch FROM page_uniques WHERE page_id=? AND day>=? AND day<=?",
+            (page_id, start_day, end_day),
+        ):
+            sketch.merge(HyperLogLog.from_bytes(r["sketch"]))
+            found = True
+    return sketch.count() if found else 0
+
+
+def bump_link_click(conn, page_id: int, link_id: int):
+    conn.execute(
+        """
+        INSERT INTO link_clicks (link_id, page_id, clicks) VALUES (?, ?, 1)
+        ON CONFLICT(link_id) DO UPDATE SET clicks=clicks+1, page_id=excluded.page_id
+        """,
+        (link_id, page_id),
+    )
+
+
+def top_links(page_id: int, n: int = 5) -> list:
+    # counts and link rows live in different databases; a page has few
+    # links, so both sides are read whole and joined here
+    with totals_conn() as conn:
+        clicks = conn.execute(
+            "SELECT link_id, clicks FROM link_clicks WHERE page_id=? ORDER BY clicks DESC",
+            (page_id,),
+        ).fetchall()
+    if not clicks:
+        return []
+    with get_conn() as conn:
+        links = {l["id"]: l for l in conn.execute("SELECT id, title, url FROM links WHERE page_id=?", (page_id,)).fetchall()}
+    ranked = [(links[r["link_id"]], r["clicks"]) for r in clicks if r["link_id"] in links][:n]
+    return [{"id": l["id"], "title": l["title"], "url": l["url"], "c": c} for l, c in ranked]
+
+
+def bump_trending(conn, page_id: int, ts: Optional[float] = None):
+    # scores are kept as log(sum(exp((t_i - epoch) / tau))): adding an event
+    # is a logaddexp and the ordering matches the decayed score at any time,
+    # so the top N is a plain index scan with no periodic decay pass
+    # conn comes from ingest_conn, which registers logaddexp
+    ts = ts if ts is not None else time.time()
+    for period, tau in TRENDING_PERIODS.items():
+        conn.execute(
+            """
+            INSERT INTO page_trending (period, page_id, score) VALUES (?, ?, ?)
+            ON CONFLICT(period, page_id) DO UPDATE SET score=logaddexp(score, excluded.score)
+            """,
+            (period, page_id, (ts - TRENDING_EPOCH) / tau),
+        )
+
+
+def trending_pages(period: str = "24h", n: int = 10, now: Optional[float] = None) -> list:
+    now = now if now is not None else time.time()
+    offset = (now - TRENDING_EPOCH) / TRENDING_PERIODS[period]
+    found = []
+    seen = 0
+    # scores and pages live in different databases: walk the score index in
+    # pages, skipping unpublished pages, until n are found
+    while len(found) < n:
+        with totals_conn() as conn:
+            scores = conn.execute(
+                "SELECT page_id, score FROM page_trending WHERE period=? ORDER BY score DESC LIMIT ? OFFSET ?",
+                (period, n * 2, seen),
+            ).fetchall()
+        if not scores:
+            break
+        seen += len(scores)
+        marks = ",".join("?" * len(scores))
+        with get_conn() as conn:
+            pages = {
+                p["id"]: p
+                for p in conn.execute(
+                    f"SELECT id, slug, display_name, bio FROM pages WHERE id IN ({marks}) AND is_published=1",
+                    [r["page_id"] for r in scores],
+                ).fetchall()
+            }
+        found.extend((pages[r["page_id"]], r["score"]) for r in scores if r["page_id"] in pages)
+    return [
+        {
+            "page_id": p["id"],
+            "slug": p["slug"],
+            "display_name": p["display_name"],
+            "bio": p["bio"],
+            "score": round(math.exp(score - offset), 2),
+        }
+        for p, score in found[:n]
+    ]
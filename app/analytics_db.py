@@ -0,0 +1,472 @@
+import math
+import os
+import re
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from app.config import (
+    ANALYTICS_CLOSE_GRACE_SEC,
+    ANALYTICS_DIR,
+    DB_PATH,
+    REPORTING_MODE,
+)
+from app.db import backup_database
+from app.querylog import connect
+from app.replica import ensure_snapshot, snapshot_path
+
+# analytics live outside the main database so page views never queue behind
+# bot edits or voucher redemptions for its write lock:
+#   analytics.db          running totals: link_clicks, page_trending
+#   events-YYYY-MM.db     one month of events and its time-bucketed rollups
+# Only the current month takes writes. Past months are closed (checkpointed,
+# made read-only) and dropped for retention as whole files.
+TOTALS_FILE = "analytics.db"
+_PARTITION_RE = re.compile(r"^events-(\d{4}-\d{2})\.db$")
+
+TOTALS_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS link_clicks (
+        link_id INTEGER PRIMARY KEY,
+        page_id INTEGER NOT NULL,
+        clicks INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_link_clicks_page ON link_clicks(page_id, clicks DESC)",
+    """
+    CREATE TABLE IF NOT EXISTS page_trending (
+        period TEXT NOT NULL,
+        page_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (period, page_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_page_trending_score ON page_trending(period, score DESC)",
+)
+PARTITION_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS analytics_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_id INTEGER NOT NULL,
+        link_id INTEGER,
+        event_type TEXT NOT NULL,
+        ip TEXT,
+        user_agent TEXT,
+        created_at TEXT NOT NULL,
+        country TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_hourly (
+        page_id INTEGER NOT NULL,
+        event_type TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        link_id INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (page_id, event_type, bucket, link_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_countries (
+        page_id INTEGER NOT NULL,
+        event_type TEXT NOT NULL,
+        day TEXT NOT NULL,
+        country TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (page_id, event_type, day, country)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS page_uniques (
+        page_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        sketch BLOB NOT NULL,
+        PRIMARY KEY (page_id, day)
+    ) WITHOUT ROWID
+    """,
+)
+# tables that used to live in the main database, and where they go now
+MOVED_TABLES = {
+    "analytics_events": "substr(created_at, 1, 7)",
+    "analytics_hourly": "substr(bucket, 1, 7)",
+    "analytics_countries": "substr(day, 1, 7)",
+    "page_uniques": "substr(day, 1, 7)",
+    "link_clicks": None,
+    "page_trending": None,
+}
+
+_ready = set()
+_ready_lock = threading.Lock()
+
+
+def totals_path() -> str:
+    return os.path.join(ANALYTICS_DIR, TOTALS_FILE)
+
+
+def partition_path(month: str) -> str:
+    return os.path.join(ANALYTICS_DIR, f"events-{month}.db")
+
+
+def first_event_id(month: str) -> int:
+    # event ids start each month at (months since year 0) << 32, so they stay
+    # unique and increasing across files and the export cursor keeps working
+    year, mon = int(month[:4]), int(month[5:7])
+    return (year * 12 + mon - 1) << 32
+
+
+def _connect(path: str, **kwargs) -> sqlite3.Connection:
+    conn = connect(path, timeout=15, uri=True, **kwargs)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _create(path: str, schema, month: Optional[str] = None):
+    with _ready_lock:
+        if path in _ready:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = _connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for sql in schema:
+                conn.execute(sql)
+            if month is not None:
+                conn.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT 'analytics_events', ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name='analytics_events')",
+                    (first_event_id(month),),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        _ready.add(path)
+
+
+class MonthClosed(PermissionError):
+    pass
+
+
+def ensure_partition(month: str) -> str:
+    path = partition_path(month)
+    if path not in _ready:
+        if is_closed(month):
+            # readers open closed months as immutable; the mode bits alone
+            # don't stop a process running as root
+            raise MonthClosed(f"analytics month {month} is closed")
+        _create(path, PARTITION_SCHEMA, month)
+    return path
+
+
+def ensure_totals() -> str:
+    path = totals_path()
+    if path not in _ready:
+        _create(path, TOTALS_SCHEMA)
+    return path
+
+
+# idle ingest connections: ((totals path, partition path), month, conn)
+INGEST_POOL_MAX = 8
+_pool = []
+_pool_lock = threading.Lock()
+_ingest = {"opened": 0, "dropped": 0}
+
+
+def _logaddexp(a: float, b: float) -> float:
+    hi, lo = (a, b) if a >= b else (b, a)
+    return hi + math.log1p(math.exp(lo - hi))
+
+
+def _reset_pool():
+    # the parent's connections belong to the parent
+    global _pool, _pool_lock
+    _pool = []
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+
+def _open_ingest(totals: str, path: str) -> sqlite3.Connection:
+    conn = _connect(totals, check_same_thread=False)
+    try:
+        conn.create_function("logaddexp", 2, _logaddexp, deterministic=True)
+        conn.execute("ATTACH DATABASE ? AS p", (path,))
+    except BaseException:
+        conn.close()
+        raise
+    _ingest["opened"] += 1
+    return conn
+
+
+def _take_pooled(totals: str, month: str, path: str) -> Optional[sqlite3.Connection]:
+    # hands out an idle connection for this month, and closes those left on
+    # an earlier one: an open attachment would stop that month being closed
+    found = None
+    stale = []
+    with _pool_lock:
+        keep = []
+        for entry in _pool:
+            if entry[0] == (totals, path) and found is None:
+                found = entry[2]
+            elif entry[0][0] != totals or entry[1] < month:
+                stale.append(entry[2])
+            else:
+                keep.append(entry)
+        _pool[:] = keep
+    for conn in stale:
+        conn.close()
+    return found
+
+
+def discard_pooled(path: str):
+    with _pool_lock:
+        gone = [entry[2] for entry in _pool if path in entry[0]]
+        _pool[:] = [entry for entry in _pool if path not in entry[0]]
+    for conn in gone:
+        conn.close()
+
+
+@contextmanager
+def ingest_conn(created_at: str):
+    # totals as main with the event's month attached as "p"; no table name
+    # is in both, so the rollup helpers write unqualified names. Connections
+    # are pooled per process with their month attached, so recording an
+    # event is no connect, function registration or ATTACH; one is used by
+    # one thread at a time. Raises MonthClosed for a month already closed.
+    month = created_at[:7]
+    totals = ensure_totals()
+    path = ensure_partition(month)
+    conn = _take_pooled(totals, month, path) or _open_ingest(totals, path)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.close()
+        raise
+    with _pool_lock:
+        if len(_pool) < INGEST_POOL_MAX:
+            _pool.append(((totals, path), month, conn))
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def note_dropped():
+    _ingest["dropped"] += 1
+
+
+def ingest_stats() -> dict:
+    # per worker
+    return {"pooled": len(_pool), "opened": _ingest["opened"], "dropped_closed_month": _ingest["dropped"]}
+
+
+def partitions(start_month: Optional[str] = None, end_month: Optional[str] = None) -> list:
+    try:
+        names = os.listdir(ANALYTICS_DIR)
+    except FileNotFoundError:
+        return []
+    months = sorted(m.group(1) for m in map(_PARTITION_RE.match, names) if m)
+    return [m for m in months if (start_month is None or m >= start_month) and (end_month is None or m <= end_month)]
+
+
+def is_closed(month: str) -> bool:
+    try:
+        return not os.stat(partition_path(month)).st_mode & stat.S_IWUSR
+    except FileNotFoundError:
+        return False
+
+
+def live_paths() -> list:
+    # the files still taking writes: what a reporting snapshot has to copy
+    return [ensure_totals()] + [partition_path(m) for m in partitions() if not is_closed(m)]
+
+
+def report_paths() -> list:
+    # what a reporting snapshot copies: those files plus the main database,
+    # so the admin lists of users, pages and vouchers are off the primary too
+    return [DB_PATH] + live_paths()
+
+
+def _read(path: str, closed: bool = False, **kwargs) -> sqlite3.Connection:
+    if closed:
+        # nothing writes a closed partition again: no locks, no WAL lookups
+        conn = connect(f"file:{path}?mode=ro&immutable=1", uri=True, **kwargs)
+        conn.row_factory = sqlite3.Row
+        return conn
+    if not REPORTING_MODE:
+        return _connect(path, **kwargs)
+    ensure_snapshot(report_paths())
+    conn = connect(f"file:{snapshot_path(path)}?mode=ro", uri=True, timeout=15, **kwargs)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@contextmanager
+def totals_conn():
+    conn = _read(ensure_totals())
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def main_db_conn():
+    # read-only use of the main database for reports
+    conn = _read(DB_PATH)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def partition_conns(start_month: Optional[str] = None, end_month: Optional[str] = None, threaded: bool = False):
+    # fan-out: one read connection per month in range that has a file, oldest
+    # first; months with no file hold no data and are skipped. threaded: the
+    # caller may use a connection from several threads in turn, as a
+    # streamed response pulling each chunk on a different pool thread does
+    for month in partitions(start_month, end_month):
+        conn = _read(partition_path(month), closed=is_closed(month), check_same_thread=not threaded)
+        try:
+            yield month, conn
+        finally:
+            conn.close()
+
+
+def _month_end(month: str) -> float:
+    year, mon = int(month[:4]), int(month[5:7])
+    nxt = datetime(year + mon // 12, mon % 12 + 1, 1)
+    return (nxt - datetime(1970, 1, 1)).total_seconds()
+
+
+def close_partitions(now: Optional[float] = None) -> list:
+    # months past their end plus a grace period for in-flight writes:
+    # fold the WAL back in, switch to a rollback journal and drop write
+    # permission, so the file is a plain immutable copy from then on
+    now = now if now is not None else time.time()
+    closed = []
+    for month in partitions():
+        if is_closed(month) or _month_end(month) + ANALYTICS_CLOSE_GRACE_SEC > now:
+            continue
+        path = partition_path(month)
+        discard_pooled(path)
+        conn = _connect(path)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            conn.close()
+        os.chmod(path, 0o444)
+        with _ready_lock:
+            _ready.discard(path)
+        closed.append(month)
+    return closed
+
+
+def drop_partitions(keep_months: int, now: Optional[datetime] = None) -> list:
+    # retention: whole closed files older than the newest keep_months months
+    if keep_months <= 0:
+        return []
+    now = now or datetime.utcnow()
+    index = now.year * 12 + now.month - 1 - (keep_months - 1)
+    oldest_kept = f"{index // 12:04d}-{index % 12 + 1:02d}"
+    dropped = []
+    for month in partitions(end_month=oldest_kept):
+        if month == oldest_kept or not is_closed(month):
+            continue
+        os.remove(partition_path(month))
+        dropped.append(month)
+    return dropped
+
+
+def backup_analytics(dest_dir: str):
+    os.makedirs(dest_dir, exist_ok=True)
+    for month in partitions():
+        if is_closed(month):
+            shutil.copy2(partition_path(month), dest_dir)
+        else:
+            backup_database(os.path.join(dest_dir, os.path.basename(partition_path(month))), src_path=partition_path(month))
+    backup_database(os.path.join(dest_dir, TOTALS_FILE), src_path=ensure_totals())
+
+
+def _migrate_from_main():
+    # one-off move of the analytics tables out of the main database; the
+    # copies replace rows by key, so a migration cut short can simply rerun
+    main = sqlite3.connect(DB_PATH, timeout=600, isolation_level=None)
+    try:
+        main.execute("BEGIN IMMEDIATE")
+        present = {r[0] for r in main.execute("SELECT name FROM sqlite_master WHERE type='table'")} & set(MOVED_TABLES)
+        if not present:
+            main.execute("ROLLBACK")
+            return
+        months = set()
+        for table, month_expr in MOVED_TABLES.items():
+            if table in present and month_expr:
+                months.update(r[0] for r in main.execute(f"SELECT DISTINCT {month_expr} FROM {table}"))
+        source = f"file:{os.path.abspath(DB_PATH)}?mode=ro"
+        for month in sorted(m for m in months if m):
+            _copy_month(month, present, source)
+        conn = _connect(ensure_totals())
+        try:
+            conn.execute("ATTACH DATABASE ? AS old", (source,))
+            for table in ("link_clicks", "page_trending"):
+                if table in present:
+                    conn.execute(f"INSERT OR REPLACE INTO {table} SELECT * FROM old.{table}")
+            if "link_clicks" not in present and "analytics_events" in present:
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO link_clicks (link_id, page_id, clicks)
+                    SELECT link_id, MIN(page_id), COUNT(*) FROM old.analytics_events
+                    WHERE event_type='click' AND link_id IS NOT NULL
+                    GROUP BY link_id
+                    """
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        for table in present:
+            main.execute(f"DROP TABLE {table}")
+        main.execute("COMMIT")
+    finally:
+        main.close()
+
+
+def _copy_month(month: str, present: set, source: str):
+    conn = _connect(ensure_partition(month))
+    try:
+        conn.execute("ATTACH DATABASE ? AS old", (source,))
+        if "analytics_events" in present:
+            cols = {r[1] for r in conn.execute("PRAGMA old.table_info(analytics_events)")}
+            country = "country" if "country" in cols else "NULL"
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO analytics_events (id, page_id, link_id, event_type, ip, user_agent, created_at, country)
+                SELECT id, page_id, link_id, event_type, ip, user_agent, created_at, {country}
+                FROM old.analytics_events WHERE {MOVED_TABLES['analytics_events']}=?
+                """,
+                (month,),
+            )
+        for table in ("analytics_hourly", "analytics_countries", "page_uniques"):
+            if table in present:
+                conn.execute(f"INSERT OR REPLACE INTO {table} SELECT * FROM old.{table} WHERE {MOVED_TABLES[table]}=?", (month,))
+        if "analytics_hourly" not in present and "analytics_events" in present:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO analytics_hourly (page_id, event_type, bucket, link_id, count)
+                SELECT page_id, event_type, substr(created_at, 1, 13), COALESCE(link_id, 0), COUNT(*)
+                FROM analytics_events
+                GROUP BY page_id, event_type, substr(created_at, 1, 13), COALESCE(link_id, 0)
+                """
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def init_analytics():
+    ensure_totals()
+    _migrate_from_main()
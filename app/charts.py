@@ -0,0 +1,39 @@
+import importlib.util
+import io
+
+CHART_SIZE = (900, 420)
+
+
+def charts_available() -> bool:
+    # optional, text-only stats without Pillow
+    return importlib.util.find_spec("PIL") is not None
+
+
+def render_bar_chart(points: list, title: str, color: str = "#0f172a") -> bytes:
+    from PIL import Image, ImageDraw, ImageFont
+
+    w, h = CHART_SIZE
+    left, right, top, bottom = 60, 20, 50, 50
+    img = Image.new("RGB", CHART_SIZE, "white")
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    draw.text((left, 18), title, fill="#0f172a", font=font)
+    peak = max([p["count"] for p in points] + [1])
+    plot_w, plot_h = w - left - right, h - top - bottom
+    draw.line((left, top + plot_h, w - right, top + plot_h), fill="#cbd5e1")
+    draw.text((8, top - 6), str(peak), fill="#64748b", font=font)
+    draw.text((8, top + plot_h - 6), "0", fill="#64748b", font=font)
+    if points:
+        slot = plot_w / len(points)
+        bar = max(1, int(slot * 0.7))
+        for i, p in enumerate(points):
+            x = left + int(i * slot + (slot - bar) / 2)
+            bar_h = int(plot_h * p["count"] / peak)
+            if bar_h:
+                draw.rectangle((x, top + plot_h - bar_h, x + bar - 1, top + plot_h), fill=color)
+        step = max(1, len(points) // 6)
+        for i in range(0, len(points), step):
+            draw.text((left + int(i * slot), top + plot_h + 8), points[i]["bucket"][5:], fill="#64748b", font=font)
+    out = io.BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
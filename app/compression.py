@@ -0,0 +1,200 @@
+import gzip
+import hashlib
+import mimetypes
+import stat
+import threading
+from collections import OrderedDict
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import COMPRESS_CACHE_BYTES, COMPRESS_CACHE_MAX, COMPRESS_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+)
+PRECOMPRESSED_EXT = {"br": ".br", "gzip": ".gz"}
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "uncached": 0}
+
+
+def accepted_encodings(accept_encoding: str) -> list:
+    # the client's accepted encodings we have, best first
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            accepted[token] = q
+    return [e for e in ("br", "gzip") if accepted.get(e, 0) > 0]
+
+
+def pick_encoding(accept_encoding: str):
+    # for compressing on the fly, which needs the brotli module for br
+    for encoding in accepted_encodings(accept_encoding):
+        if encoding != "br" or brotli is not None:
+            return encoding
+    return None
+
+
+def _compress_raw(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def compress(body: bytes, encoding: str, cache: bool = True) -> bytes:
+    # cache=False for bodies that differ per request: caching them would only
+    # churn out the entries worth keeping
+    global _cache_bytes
+    if not cache:
+        with _cache_lock:
+            _stats["uncached"] += 1
+        return _compress_raw(body, encoding)
+    key = (hashlib.sha1(body).digest(), encoding)
+    with _cache_lock:
+        out = _cache.get(key)
+        if out is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return out
+    out = _compress_raw(body, encoding)
+    with _cache_lock:
+        _stats["misses"] += 1
+        # bounded by entries and by bytes; a body over an eighth of the
+        # budget would flush most of the cache for one entry, so it isn't kept
+        if key not in _cache and len(out) <= COMPRESS_CACHE_BYTES // 8:
+            _cache[key] = out
+            _cache_bytes += len(out)
+        while _cache and (len(_cache) > COMPRESS_CACHE_MAX or _cache_bytes > COMPRESS_CACHE_BYTES):
+            _, old = _cache.popitem(last=False)
+            _cache_bytes -= len(old)
+    return out
+
+
+def compression_stats() -> dict:
+    with _cache_lock:
+        return {**_stats, "entries": len(_cache), "bytes": _cache_bytes}
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    # each encoding is its own byte sequence, so it gets its own strong tag;
+    # render.etag_matches strips the suffix again
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def is_strong(etag: str) -> bool:
+    return etag.endswith('"') and not etag.startswith("W/")
+
+
+def add_vary(headers: MutableHeaders):
+    vary = headers.get("vary", "")
+    if "accept-encoding" not in vary.lower():
+        headers["vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = pick_encoding(request_headers.get("accept-encoding", ""))
+        if scope["method"] == "HEAD":
+            encoding = None
+        if_none_match = request_headers.get("if-none-match", "")
+        start = None
+        chunks = []
+
+        async def wrapped_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if message["status"] == 304:
+                    # a 304 carries the tag of the representation validated:
+                    # the encoded one if that is what the client holds
+                    etag = headers.get("etag")
+                    if encoding and etag and is_strong(etag) and encoded_etag(etag, encoding) in if_none_match:
+                        headers["etag"] = encoded_etag(etag, encoding)
+                        add_vary(headers)
+                    await send(message)
+                    return
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type", "")):
+                    await send(message)
+                    return
+                add_vary(headers)
+                if message["status"] != 200 or encoding is None:
+                    await send(message)
+                    return
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            if len(body) >= COMPRESS_MIN_SIZE:
+                etag = headers.get("etag")
+                # an ETag marks a body that repeats (static, marketing and
+                # version-keyed page bodies); others are compressed uncached
+                body = compress(body, encoding, cache=bool(etag))
+                headers["content-encoding"] = encoding
+                if etag and is_strong(etag):
+                    headers["etag"] = encoded_etag(etag, encoding)
+            headers["content-length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, wrapped_send)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        encodings = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        response = None
+        if encodings and scope["method"] in ("GET", "HEAD"):
+            _, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                # the best accepted encoding that has a sibling file
+                for encoding in encodings:
+                    gz_path, gz_stat = await anyio.to_thread.run_sync(self.lookup_path, path + PRECOMPRESSED_EXT[encoding])
+                    if gz_stat and stat.S_ISREG(gz_stat.st_mode):
+                        response = self.file_response(gz_path, gz_stat, scope)
+                        if response.status_code == 200:
+                            response.headers["content-type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                            response.headers["content-encoding"] = encoding
+                        break
+        if response is None:
+            response = await super().get_response(path, scope)
+        add_vary(response.headers)
+        return response
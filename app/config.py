@@ -14,6 +14,66 @@ BOT_USERNAME = os.getenv("BOT_USERNAME", "YourBotUsername")
 SUPPORT_TELEGRAM = os.getenv("SUPPORT_TELEGRAM", "https://t.me/YourBotUsername")
 BUSINESS_EMAIL = os.getenv("BUSINESS_EMAIL", "business@pety.company")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/var/www/linkat/uploads" if APP_ENV == "prod" else "./data/uploads")
+UPLOAD_GC_GRACE_SEC = int(os.getenv("UPLOAD_GC_GRACE_SEC", "86400"))
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "./data/template_cache")
+STATIC_PAGE_MAX_AGE = int(os.getenv("STATIC_PAGE_MAX_AGE", "300"))
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "512"))
+COMPRESS_CACHE_MAX = int(os.getenv("COMPRESS_CACHE_MAX", "2048"))
+COMPRESS_CACHE_BYTES = int(os.getenv("COMPRESS_CACHE_BYTES", str(16 * 1024 * 1024)))
+OG_CACHE_DIR = os.getenv("OG_CACHE_DIR", "./data/og_cache")
+OG_FONT_PATH = os.getenv("OG_FONT_PATH", "")
+OG_RENDER_WORKERS = int(os.getenv("OG_RENDER_WORKERS", "2"))
+ABUSE_MISS_LIMIT = int(os.getenv("ABUSE_MISS_LIMIT", "30"))
+ABUSE_WINDOW_SEC = int(os.getenv("ABUSE_WINDOW_SEC", "60"))
+SERIES_CACHE_MAX = int(os.getenv("SERIES_CACHE_MAX", "1024"))
+UNIQUES_CACHE_MAX = int(os.getenv("UNIQUES_CACHE_MAX", "2000"))
+DEDUP_WINDOW_SEC = float(os.getenv("DEDUP_WINDOW_SEC", "30"))
+DEDUP_MAX_KEYS = int(os.getenv("DEDUP_MAX_KEYS", "100000"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "./data/analytics")
+ANALYTICS_CLOSE_GRACE_SEC = int(os.getenv("ANALYTICS_CLOSE_GRACE_SEC", "3600"))
+ANALYTICS_RETENTION_MONTHS = int(os.getenv("ANALYTICS_RETENTION_MONTHS", "0"))
+REPORTING_MODE = os.getenv("REPORTING_MODE", "0") == "1"
+REPORT_DIR = os.getenv("REPORT_DIR", "")
+REPORT_MAX_STALENESS_SEC = int(os.getenv("REPORT_MAX_STALENESS_SEC", "300"))
+SLUG_INDEX_REFRESH_SEC = float(os.getenv("SLUG_INDEX_REFRESH_SEC", "1"))
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "200"))
+ADMISSION_TOLERANCE = float(os.getenv("ADMISSION_TOLERANCE", "2.0"))
+ADMISSION_RETRY_AFTER_SEC = int(os.getenv("ADMISSION_RETRY_AFTER_SEC", "2"))
+DOMAIN_INDEX_REFRESH_SEC = float(os.getenv("DOMAIN_INDEX_REFRESH_SEC", "1"))
+DOMAIN_VERIFY_TIMEOUT = float(os.getenv("DOMAIN_VERIFY_TIMEOUT", "10"))
+DOMAIN_DNS_URL = os.getenv("DOMAIN_DNS_URL", "https://cloudflare-dns.com/dns-query")
+SNAPSHOT_CACHE_MAX = int(os.getenv("SNAPSHOT_CACHE_MAX", "4096"))
+SNAPSHOT_REFRESH_SEC = float(os.getenv("SNAPSHOT_REFRESH_SEC", "1"))
+LINK_PAGE_CACHE_MAX = int(os.getenv("LINK_PAGE_CACHE_MAX", "100000"))
+API_PAGE_MAX_AGE = int(os.getenv("API_PAGE_MAX_AGE", "60"))
+API_BATCH_MAX = int(os.getenv("API_BATCH_MAX", "50"))
+PAGE_HTML_CACHE_MAX = int(os.getenv("PAGE_HTML_CACHE_MAX", "2048"))
+LINK_CHECK_INTERVAL_SEC = int(os.getenv("LINK_CHECK_INTERVAL_SEC", "86400"))
+LINK_CHECK_RETRY_SEC = int(os.getenv("LINK_CHECK_RETRY_SEC", "900"))
+LINK_CHECK_CONCURRENCY = int(os.getenv("LINK_CHECK_CONCURRENCY", "100"))
+LINK_CHECK_PER_HOST = int(os.getenv("LINK_CHECK_PER_HOST", "2"))
+LINK_CHECK_TIMEOUT = float(os.getenv("LINK_CHECK_TIMEOUT", "10"))
+LINK_CHECK_BATCH = int(os.getenv("LINK_CHECK_BATCH", "2000"))
+LINK_CHECK_ALLOW_PRIVATE = os.getenv("LINK_CHECK_ALLOW_PRIVATE", "0") == "1"
+GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH", "./data/geoip.bin")
+GEOIP_RECHECK_SEC = float(os.getenv("GEOIP_RECHECK_SEC", "60"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "50"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+PROFILE_MAX_SEC = int(os.getenv("PROFILE_MAX_SEC", "60"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+RATE_LIMIT_SLOTS = int(os.getenv("RATE_LIMIT_SLOTS", "65536"))
+WEB_HOST = os.getenv("WEB_HOST", "127.0.0.1")
+WEB_PORT = int(os.getenv("WEB_PORT", os.getenv("PORT", "8000")))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0")) or os.cpu_count() or 1
+WEB_GRACEFUL_TIMEOUT = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+RESERVED_SLUGS = {
+    "admin", "api", "static", "uploads", "u", "r", "og", "www", "linkat",
+    "pricing", "examples", "faq", "contact", "help", "support", "login",
+} | {s.strip().lower() for s in os.getenv("BLOCKED_SLUGS", "").split(",") if s.strip()}
 
 PAYMENT_METHODS_TEXT = """طرق الدفع للحصول على كود التفعيل:
 - سيرياتيل كاش
@@ -1,9 +1,16 @@
+import os
 import sqlite3
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional
 
 from app.config import DB_PATH
+from app.querylog import connect
+
+
+# page versions come from one counter across all pages, so they are both
+# monotonic per page and a high-water mark that workers can poll for changes
+NEXT_PAGE_VERSION = "(SELECT COALESCE(MAX(version), 0) + 1 FROM pages)"
 
 
 def utcnow() -> str:
@@ -12,7 +19,7 @@ def utcnow() -> str:
 
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH, timeout=15)
+    conn = connect(DB_PATH, timeout=15)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
@@ -21,8 +28,27 @@ def get_conn():
         conn.close()
 
 
+def backup_database(dest_path: str, pages: int = 1024, src_path: str = DB_PATH):
+    # online backup: copies a consistent snapshot in steps while writers keep going
+    tmp = f"{dest_path}.tmp"
+    src = sqlite3.connect(src_path, timeout=15)
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst, pages=pages, sleep=0.005)
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp, dest_path)
+
+
+def checkpoint_wal():
+    with get_conn() as conn:
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+
 def init_db():
     with get_conn() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
         c = conn.cursor()
         c.execute(
             """
@@ -53,10 +79,14 @@ def init_db():
                 is_published INTEGER DEFAULT 0,
                 created_at TEXT NOT NULL,
                 updated_at TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
                 FOREIGN KEY(user_id) REFERENCES users(id)
             )
             """
         )
+        if "version" not in {r["name"] for r in c.execute("PRAGMA table_info(pages)").fetchall()}:
+            c.execute("ALTER TABLE pages ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pages_version ON pages(version)")
         c.execute(
             """
             CREATE TABLE IF NOT EXISTS links (
@@ -90,16 +120,79 @@ def init_db():
         )
         c.execute(
             """
-            CREATE TABLE IF NOT EXISTS analytics_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CREATE TABLE IF NOT EXISTS slug_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                slug TEXT NOT NULL,
                 page_id INTEGER NOT NULL,
-                link_id INTEGER,
-                event_type TEXT NOT NULL,
-                ip TEXT,
-                user_agent TEXT,
                 created_at TEXT NOT NULL,
-                FOREIGN KEY(page_id) REFERENCES pages(id),
-                FOREIGN KEY(link_id) REFERENCES links(id)
+                FOREIGN KEY(page_id) REFERENCES pages(id)
+            )
+            """
+        )
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS url_health (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'unknown',
+                status_code INTEGER,
+                error TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                failures INTEGER NOT NULL DEFAULT 0,
+                checked_at TEXT,
+                failing_since TEXT,
+                next_check_at TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS idx_url_health_due ON url_health(next_check_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_links_url ON links(url)")
+        # pending claims, one per page; several pages may claim a host until
+        # one proves it owns it and moves into custom_domains
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS domain_claims (
+                page_id INTEGER PRIMARY KEY,
+                host TEXT NOT NULL,
+                token TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                checked_at TEXT,
+                last_error TEXT,
+                FOREIGN KEY(page_id) REFERENCES pages(id)
+            )
+            """
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS idx_domain_claims_host ON domain_claims(host)")
+        # verified hosts only
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS custom_domains (
+                host TEXT PRIMARY KEY,
+                page_id INTEGER UNIQUE NOT NULL,
+                token TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                verified_at TEXT NOT NULL,
+                FOREIGN KEY(page_id) REFERENCES pages(id)
+            )
+            """
+        )
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS domain_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                host TEXT NOT NULL,
+                page_id INTEGER,
+                created_at TEXT NOT NULL
+            )
+            """
+        )
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                path TEXT PRIMARY KEY,
+                refs INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL
             )
             """
         )
@@ -160,4 +253,6 @@ def redeem_voucher_for_user(user_id: int, code: str):
             "UPDATE users SET plan_type=?, plan_expires_at=? WHERE id=?",
             (v["plan_type"], expires_at, user_id),
         )
+        # the plan decides the watermark, so the rendered page changes too
+        conn.execute(f"UPDATE pages SET version={NEXT_PAGE_VERSION} WHERE user_id=?", (user_id,))
         return True, f"تم تفعيل الباقة {v['plan_type']} حتى {expires_at[:10]}"
@@ -0,0 +1,53 @@
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from app.config import DEDUP_WINDOW_SEC, DEDUP_MAX_KEYS
+from app.hll import hash64
+from app.shared import shared_buffer
+
+# key hash, monotonic time it was first seen
+_SLOT = struct.Struct("<Qd")
+
+
+class SharedDedup:
+    # recent keys in a fixed table of max_keys slots indexed by key hash, in
+    # a mapping shared by every forked worker so a refresh storm spread over
+    # workers is still caught. A repeat within window_sec of the first hit is
+    # suppressed. Another key landing on the same slot replaces it, which can
+    # let a repeat through but never drops a first hit; memory stays at
+    # max_keys slots whatever the traffic.
+    def __init__(self, window_sec: float, max_keys: int):
+        self.window_sec = window_sec
+        self.max_keys = max(max_keys, 1)
+        self.suppressed = defaultdict(int)  # per worker
+        self._buf = shared_buffer(self.max_keys * _SLOT.size)
+        self._lock = threading.Lock()
+
+    def seen(self, kind: str, key) -> bool:
+        if self.window_sec <= 0:
+            return False
+        h = hash64(repr(key))
+        offset = (h % self.max_keys) * _SLOT.size
+        with self._lock:
+            now = time.monotonic()
+            stored, first_seen = _SLOT.unpack_from(self._buf, offset)
+            if stored == h and now - first_seen < self.window_sec:
+                self.suppressed[kind] += 1
+                return True
+            _SLOT.pack_into(self._buf, offset, h, now)
+            return False
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            keys = sum(1 for h, t in _SLOT.iter_unpack(self._buf) if h and now - t < self.window_sec)
+            return {
+                "window_sec": self.window_sec,
+                "keys": keys,
+                "suppressed": dict(self.suppressed),
+            }
+
+
+ingest_dedup = SharedDedup(DEDUP_WINDOW_SEC, DEDUP_MAX_KEYS)
@@ -0,0 +1,255 @@
+import re
+import secrets
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import anyio
+import httpx
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse
+
+from app.config import BASE_URL, DOMAIN_DNS_URL, DOMAIN_INDEX_REFRESH_SEC, DOMAIN_VERIFY_TIMEOUT
+from app.db import get_conn, utcnow
+
+TXT_PREFIX = "_linkat"
+# paths a custom domain serves besides its page at "/"
+PASS_THROUGH = ("/r/", "/static/", "/uploads/", "/og/")
+OWN_HOST = (urlsplit(BASE_URL).hostname or "").lower()
+_HOST = re.compile(r"^(?=.{4,253}$)(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})$")
+
+# verified host -> (page id, slug); refreshed from domain_log, like the slug
+# index, so a domain verified from the bot is served without a per-request
+# lookup
+_hosts = {}
+_state = {"seq": -1, "checked_at": 0.0}
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+class DomainTaken(Exception):
+    pass
+
+
+def normalize_host(value: str) -> Optional[str]:
+    # "https://Shop.Example.com/" -> "shop.example.com"; None if not a
+    # usable public hostname or one of ours
+    value = (value or "").strip().lower()
+    if "://" in value:
+        value = urlsplit(value).hostname or ""
+    host = value.split("/", 1)[0].rstrip(".")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+    if not _HOST.match(host) or host == OWN_HOST or host.endswith("." + OWN_HOST):
+        return None
+    return host
+
+
+def load_domain_index():
+    with get_conn() as conn:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) s FROM domain_log").fetchone()["s"]
+        rows = conn.execute(
+            "SELECT d.host, d.page_id, p.slug FROM custom_domains d JOIN pages p ON p.id=d.page_id "
+            "WHERE p.slug IS NOT NULL"
+        ).fetchall()
+    with _lock:
+        _hosts.clear()
+        _hosts.update((r["host"], (r["page_id"], r["slug"])) for r in rows)
+        _state["seq"] = seq
+        _state["checked_at"] = time.monotonic()
+
+
+def refresh_domain_index():
+    if _state["seq"] < 0:
+        load_domain_index()
+        return
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT l.seq, l.host, l.page_id, p.slug FROM domain_log l LEFT JOIN pages p ON p.id=l.page_id "
+            "WHERE l.seq>? ORDER BY l.seq",
+            (_state["seq"],),
+        ).fetchall()
+    with _lock:
+        for r in rows:
+            if r["page_id"] is None or r["slug"] is None:
+                _hosts.pop(r["host"], None)
+            else:
+                _hosts[r["host"]] = (r["page_id"], r["slug"])
+            _state["seq"] = max(_state["seq"], r["seq"])
+        _state["checked_at"] = time.monotonic()
+
+
+def refresh_due() -> bool:
+    return _state["seq"] < 0 or time.monotonic() - _state["checked_at"] >= DOMAIN_INDEX_REFRESH_SEC
+
+
+def maybe_refresh_domains():
+    if refresh_due() and _refresh_lock.acquire(blocking=False):
+        try:
+            refresh_domain_index()
+        finally:
+            _refresh_lock.release()
+
+
+def resolve_host(host: str) -> Optional[tuple]:
+    return _hosts.get(host)
+
+
+def domain_index_size() -> int:
+    return len(_hosts)
+
+
+def _log(conn, host: str, page_id: Optional[int]):
+    conn.execute("INSERT INTO domain_log (host, page_id, created_at) VALUES (?, ?, ?)", (host, page_id, utcnow()))
+
+
+def domain_for_page(page_id: int):
+    # the page's verified domain, else its pending claim (verified_at NULL)
+    with get_conn() as conn:
+        row = conn.execute("SELECT * FROM custom_domains WHERE page_id=?", (page_id,)).fetchone()
+        if row:
+            return row
+        return conn.execute(
+            "SELECT host, page_id, token, created_at, NULL verified_at FROM domain_claims WHERE page_id=?",
+            (page_id,),
+        ).fetchone()
+
+
+def txt_name(host: str) -> str:
+    return f"{TXT_PREFIX}.{host}"
+
+
+def _drop_verified(conn, page_id: int, keep: Optional[str] = None):
+    old = conn.execute("SELECT host FROM custom_domains WHERE page_id=?", (page_id,)).fetchone()
+    if old and old["host"] != keep:
+        conn.execute("DELETE FROM custom_domains WHERE host=?", (old["host"],))
+        _log(conn, old["host"], None)
+
+
+def attach_domain(page_id: int, host: str):
+    # claims host for the page, replacing any domain it had; returns the
+    # claim with the token to publish. A host verified by another page is
+    # refused; other pages' pending claims on it are left alone, since only
+    # the one whose token is in the host's DNS can verify.
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        current = conn.execute("SELECT * FROM custom_domains WHERE host=?", (host,)).fetchone()
+        if current and current["page_id"] == page_id:
+            return current
+        if current:
+            raise DomainTaken(host)
+        _drop_verified(conn, page_id)
+        claim = conn.execute("SELECT * FROM domain_claims WHERE page_id=? AND host=?", (page_id, host)).fetchone()
+        if not claim:
+            conn.execute(
+                "INSERT OR REPLACE INTO domain_claims (page_id, host, token, created_at) VALUES (?, ?, ?, ?)",
+                (page_id, host, secrets.token_urlsafe(18), utcnow()),
+            )
+    return domain_for_page(page_id)
+
+
+def detach_domain(page_id: int) -> Optional[str]:
+    row = domain_for_page(page_id)
+    if not row:
+        return None
+    with get_conn() as conn:
+        conn.execute("DELETE FROM domain_claims WHERE page_id=?", (page_id,))
+        _drop_verified(conn, page_id)
+    return row["host"]
+
+
+def _txt_values(answer: list) -> list:
+    # TXT data comes back quoted, long values split into several strings
+    values = []
+    for record in answer:
+        if record.get("type") != 16:
+            continue
+        data = record.get("data", "")
+        parts = re.findall(r'"((?:[^"\\]|\\.)*)"', data)
+        values.append("".join(parts) if parts else data)
+    return values
+
+
+async def lookup_txt(name: str, transport=None) -> list:
+    # asks a fixed DNS-over-HTTPS resolver, never the claimed host itself
+    async with httpx.AsyncClient(timeout=DOMAIN_VERIFY_TIMEOUT, follow_redirects=False, transport=transport) as client:
+        resp = await client.get(DOMAIN_DNS_URL, params={"name": name, "type": "TXT"}, headers={"Accept": "application/dns-json"})
+    resp.raise_for_status()
+    body = resp.json()
+    if body.get("Status") not in (0, 3):  # NOERROR, NXDOMAIN
+        raise httpx.HTTPError(f"dns status {body.get('Status')}")
+    return _txt_values(body.get("Answer") or [])
+
+
+async def verify_domain(page_id: int, transport=None) -> tuple:
+    # the host is the page's once its DNS holds a TXT record _linkat.<host>
+    # with this page's token, which only whoever controls the zone can add.
+    # Returns (ok, error); errors are fixed codes, safe to show the user.
+    row = domain_for_page(page_id)
+    if not row:
+        return False, "no_domain"
+    if row["verified_at"]:
+        return True, None
+    error = None
+    try:
+        if row["token"] not in await lookup_txt(txt_name(row["host"]), transport):
+            error = "token_missing"
+    except (httpx.HTTPError, ValueError):
+        error = "dns_error"
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if not error and conn.execute("SELECT 1 FROM custom_domains WHERE host=?", (row["host"],)).fetchone():
+            error = "taken"
+        if error:
+            conn.execute(
+                "UPDATE domain_claims SET checked_at=?, last_error=? WHERE page_id=?", (utcnow(), error, page_id)
+            )
+            return False, error
+        claim = conn.execute(
+            "SELECT created_at FROM domain_claims WHERE page_id=? AND host=? AND token=?",
+            (page_id, row["host"], row["token"]),
+        ).fetchone()
+        if not claim:
+            return False, "no_domain"  # detached or replaced meanwhile
+        _drop_verified(conn, page_id)
+        conn.execute(
+            "INSERT INTO custom_domains (host, page_id, token, created_at, verified_at) VALUES (?, ?, ?, ?, ?)",
+            (row["host"], page_id, row["token"], claim["created_at"], utcnow()),
+        )
+        # the host is settled; other pages' claims on it can never verify
+        conn.execute("DELETE FROM domain_claims WHERE host=?", (row["host"],))
+        _log(conn, row["host"], page_id)
+    return True, None
+
+
+def host_of(scope) -> str:
+    host = Headers(scope=scope).get("host", "")
+    if host.startswith("["):
+        return ""
+    return host.rsplit(":", 1)[0].lower().rstrip(".")
+
+
+class CustomDomainMiddleware:
+    # a verified custom host serves its page at "/" by handing the request to
+    # the /u/{slug} route, so it shares that route's caches, ETags and view
+    # counting; its links, assets and cards keep their normal paths
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            if refresh_due():
+                await anyio.to_thread.run_sync(maybe_refresh_domains)
+            target = resolve_host(host_of(scope)) if _hosts else None
+            if target is not None:
+                if scope["path"] == "/":
+                    path = f"/u/{target[1]}"
+                    scope.setdefault("state", {})["custom_domain"] = host_of(scope)
+                    scope = dict(scope, path=path, raw_path=path.encode("utf-8"))
+                elif not scope["path"].startswith(PASS_THROUGH):
+                    await PlainTextResponse("Not found", status_code=404)(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
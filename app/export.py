@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import zlib
+from typing import Optional
+
+from app.config import EXPORT_CHUNK_SIZE
+from app.analytics_db import partition_conns
+
+EXPORT_COLUMNS = ("id", "page_id", "link_id", "event_type", "ip", "user_agent", "created_at", "country")
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv.gz": "application/gzip"}
+
+
+def export_high_water() -> int:
+    high = 0
+    for _, conn in partition_conns():
+        high = max(high, conn.execute("SELECT COALESCE(MAX(id), 0) m FROM analytics_events").fetchone()["m"])
+    return high
+
+
+def iter_event_chunks(since_id: int, until_id: Optional[int] = None, limit: Optional[int] = None, chunk_size: Optional[int] = None):
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    if until_id is None:
+        until_id = export_high_water()
+    remaining = limit or None
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM analytics_events WHERE id>? AND id<=? ORDER BY id"
+    # ids grow across monthly partitions, so walking them oldest first keeps
+    # the cursor order. The connections outlive each yield, and the next
+    # chunk may be pulled on another thread.
+    for _, conn in partition_conns(threaded=True):
+        if remaining is not None and remaining <= 0:
+            break
+        conn.execute("BEGIN")
+        if remaining is None:
+            cur = conn.execute(sql, (since_id, until_id))
+        else:
+            cur = conn.execute(sql + " LIMIT ?", (since_id, until_id, remaining))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            if remaining is not None:
+                remaining -= len(rows)
+            yield [tuple(r) for r in rows]
+
+
+def iter_ndjson(since_id: int, **kwargs):
+    for rows in iter_event_chunks(since_id, **kwargs):
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, r)), ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+
+
+def iter_csv_gz(since_id: int, **kwargs):
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_event_chunks(since_id, **kwargs):
+        writer.writerows(rows)
+        out = gz.compress(buf.getvalue().encode("utf-8"))
+        buf.seek(0)
+        buf.truncate()
+        if out:
+            yield out
+    yield gz.compress(buf.getvalue().encode("utf-8")) + gz.flush()
+
+
+def iter_export(fmt: str, since_id: int, **kwargs):
+    if fmt == "csv.gz":
+        return iter_csv_gz(since_id, **kwargs)
+    return iter_ndjson(since_id, **kwargs)
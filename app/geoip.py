@@ -0,0 +1,191 @@
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Optional
+
+from app.config import GEOIP_DB_PATH, GEOIP_RECHECK_SEC
+
+# magic, IPv4 range count, IPv6 range count
+_HEADER = struct.Struct("<8sII")
+MAGIC = b"LKGEOIP1"
+_V4_MAPPED = b"\x00" * 10 + b"\xff\xff"
+
+_state = {"table": None, "path": None, "mtime": None, "checked_at": 0.0}
+_load_lock = threading.Lock()
+
+
+class _Ranges:
+    # n sorted, non-overlapping ranges of width-byte big-endian addresses
+    # laid out as three arrays (starts, ends, 2-letter codes) in the mapping;
+    # big-endian bytes compare like the numbers they hold, so the search
+    # compares slices without decoding them
+    def __init__(self, buf, offset: int, count: int, width: int):
+        self.buf = buf
+        self.count = count
+        self.width = width
+        self.starts = offset
+        self.ends = offset + count * width
+        self.codes = self.ends + count * width
+
+    def find(self, key: bytes) -> Optional[str]:
+        buf, w, starts = self.buf, self.width, self.starts
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if buf[starts + mid * w:starts + mid * w + w] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        i = lo - 1
+        if i < 0 or buf[self.ends + i * w:self.ends + i * w + w] < key:
+            return None
+        return buf[self.codes + i * 2:self.codes + i * 2 + 2].decode("ascii")
+
+
+class GeoTable:
+    # the range file mapped read-only: pages live in the OS page cache, so
+    # every worker (and the launcher they fork from) shares one copy and a
+    # lookup touches a few dozen bytes of it
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n4, n6 = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or len(self._map) != _HEADER.size + n4 * 10 + n6 * 34:
+            self._map.close()
+            raise ValueError(f"{path} is not a geoip range table")
+        self.v4 = _Ranges(self._map, _HEADER.size, n4, 4)
+        self.v6 = _Ranges(self._map, _HEADER.size + n4 * 10, n6, 16)
+
+    def __len__(self) -> int:
+        return self.v4.count + self.v6.count
+
+    def lookup(self, ip: str) -> Optional[str]:
+        try:
+            if ":" not in ip:
+                return self.v4.find(socket.inet_pton(socket.AF_INET, ip))
+            packed = socket.inet_pton(socket.AF_INET6, ip.split("%", 1)[0])
+        except (OSError, ValueError):
+            return None
+        if packed[:12] == _V4_MAPPED:
+            return self.v4.find(packed[12:])
+        return self.v6.find(packed)
+
+    def close(self):
+        self._map.close()
+
+
+def _address(text: str):
+    # dotted/colon notation or the plain integers IP2Location-style files use;
+    # IPv4-mapped IPv6 is folded into the IPv4 table
+    text = text.strip()
+    if text.isdigit():
+        value = int(text)
+        if value <= 0xFFFFFFFF:
+            return 4, value
+        version = 6
+    else:
+        addr = ipaddress.ip_address(text)
+        version, value = addr.version, int(addr)
+    if version == 6 and value >> 32 == 0xFFFF:
+        return 4, value & 0xFFFFFFFF
+    return version, value
+
+
+def parse_range_row(row: list):
+    # "network/prefix,CC,..." or "start,end,CC,..."; None for headers,
+    # unassigned space ("-") and anything else that isn't a range
+    try:
+        if "/" in row[0]:
+            net = ipaddress.ip_network(row[0].strip(), strict=False)
+            first, last = _address(str(net[0])), _address(str(net[-1]))
+            code = row[1]
+        else:
+            first, last = _address(row[0]), _address(row[1])
+            code = row[2]
+    except (IndexError, ValueError):
+        return None
+    code = code.strip().upper()
+    if len(code) != 2 or not code.isalpha() or first[0] != last[0] or first[1] > last[1]:
+        return None
+    return first[0], first[1], last[1], code
+
+
+def build_ranges(rows) -> tuple:
+    # sorts, drops ranges overlapping an earlier one and merges neighbours
+    # with the same country; returns (v4, v6, skipped)
+    tables = {4: [], 6: []}
+    skipped = 0
+    for row in rows:
+        parsed = parse_range_row(row)
+        if parsed is None:
+            skipped += 1
+            continue
+        tables[parsed[0]].append(parsed[1:])
+    for version, ranges in tables.items():
+        ranges.sort()
+        merged = []
+        for start, end, code in ranges:
+            if merged and start <= merged[-1][1]:
+                skipped += 1
+                continue
+            if merged and start == merged[-1][1] + 1 and code == merged[-1][2]:
+                merged[-1] = (merged[-1][0], end, code)
+            else:
+                merged.append((start, end, code))
+        tables[version] = merged
+    return tables[4], tables[6], skipped
+
+
+def write_table(path: str, v4: list, v6: list):
+    # v4/v6: sorted, non-overlapping (start, end, code) with int addresses
+    tmp = f"{path}.{os.getpid()}.new"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(v4), len(v6)))
+        for ranges, width in ((v4, 4), (v6, 16)):
+            f.write(b"".join(r[0].to_bytes(width, "big") for r in ranges))
+            f.write(b"".join(r[1].to_bytes(width, "big") for r in ranges))
+            f.write(b"".join(r[2].encode("ascii") for r in ranges))
+    os.replace(tmp, path)
+
+
+def load_geoip(path: Optional[str] = None):
+    # called before the launcher forks; afterwards each worker only stats the
+    # file now and then and remaps when the importer has replaced it
+    with _load_lock:
+        path = path or _state["path"] or GEOIP_DB_PATH
+        _state["checked_at"] = time.monotonic()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if path == _state["path"] and mtime == _state["mtime"]:
+            return
+        table = None
+        if mtime is not None:
+            try:
+                table = GeoTable(path)
+            except (OSError, ValueError, struct.error):
+                table = None
+        # the old mapping is left to the collector: a lookup in another thread
+        # may still be reading it
+        _state["table"] = table
+        _state["path"] = path
+        _state["mtime"] = mtime
+
+
+def country_for_ip(ip: str) -> Optional[str]:
+    if not ip:
+        return None
+    if time.monotonic() - _state["checked_at"] >= GEOIP_RECHECK_SEC:
+        load_geoip()
+    table = _state["table"]
+    return table.lookup(ip) if table is not None else None
+
+
+def geoip_size() -> int:
+    table = _state["table"]
+    return len(table) if table is not None else 0
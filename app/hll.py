@@ -0,0 +1,53 @@
+import hashlib
+import math
+import zlib
+
+# 2^11 one-byte registers: 2 KiB per sketch (less once zlib-compressed),
+# standard error 1.04 / sqrt(2048) ~= 2.3%
+P = 11
+M = 1 << P
+ALPHA = 0.7213 / (1 + 1.079 / M)
+STANDARD_ERROR = 1.04 / math.sqrt(M)
+_TAIL_BITS = 64 - P
+_TAIL_MASK = (1 << _TAIL_BITS) - 1
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    __slots__ = ("registers",)
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers is not None else bytearray(M)
+
+    def add_hash(self, h: int) -> bool:
+        idx = h >> _TAIL_BITS
+        rank = _TAIL_BITS - (h & _TAIL_MASK).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+            return True
+        return False
+
+    def add(self, value: str) -> bool:
+        return self.add_hash(hash64(value))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        estimate = ALPHA * M * M / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * M:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = M * math.log(M / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers), 6)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "HyperLogLog":
+        return cls(zlib.decompress(blob))
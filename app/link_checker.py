@@ -0,0 +1,194 @@
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from app.config import (
+    APP_NAME,
+    BASE_URL,
+    LINK_CHECK_ALLOW_PRIVATE,
+    LINK_CHECK_BATCH,
+    LINK_CHECK_CONCURRENCY,
+    LINK_CHECK_PER_HOST,
+    LINK_CHECK_TIMEOUT,
+)
+from app.link_health import due_urls, save_results, sync_urls
+
+USER_AGENT = f"{APP_NAME}-LinkCheck/1.0 (+{BASE_URL})"
+MAX_REDIRECTS = 5
+DEAD_STATUS = {404, 410}
+BLOCKED_STATUS = {401, 403}
+
+
+class UnsafeTarget(Exception):
+    pass
+
+
+class HostLimiter:
+    # at most per_host requests in flight to one host, plus a cool-down
+    # when a host answers 429/503 with Retry-After
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self._sems = {}
+        self._resume_at = {}
+        self.peak = defaultdict(int)
+        self._active = defaultdict(int)
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        sem = self._sems.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with sem:
+            wait = self._resume_at.get(host, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._active[host] += 1
+            self.peak[host] = max(self.peak[host], self._active[host])
+            try:
+                yield
+            finally:
+                self._active[host] -= 1
+
+    def cool_down(self, host: str, seconds: float):
+        self._resume_at[host] = max(self._resume_at.get(host, 0), time.monotonic() + min(seconds, 600))
+
+
+def make_client(transport=None) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=LINK_CHECK_CONCURRENCY, max_keepalive_connections=LINK_CHECK_CONCURRENCY)
+    return httpx.AsyncClient(
+        timeout=LINK_CHECK_TIMEOUT,
+        limits=limits,
+        headers={"User-Agent": USER_AGENT},
+        follow_redirects=False,
+        transport=transport,
+    )
+
+
+async def check_public(url: str):
+    if LINK_CHECK_ALLOW_PRIVATE:
+        return
+    parts = urlsplit(url)
+    infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    if not all(ipaddress.ip_address(info[4][0]).is_global for info in infos):
+        raise UnsafeTarget(parts.hostname)
+
+
+async def _fetch(client: httpx.AsyncClient, method: str, url: str, headers: dict) -> httpx.Response:
+    # redirects are followed by hand so every hop passes the address check
+    for _ in range(MAX_REDIRECTS + 1):
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise UnsafeTarget(url)
+        await check_public(url)
+        resp = await client.send(client.build_request(method, url, headers=headers), stream=True)
+        await resp.aclose()  # status and headers are all we need
+        if not resp.has_redirect_location:
+            return resp
+        url = urljoin(url, resp.headers["location"])
+        headers = {}
+    raise httpx.TooManyRedirects("too many redirects", request=resp.request)
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    value = resp.headers.get("retry-after")
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def check_url(client: httpx.AsyncClient, limiter: HostLimiter, url: str, prev) -> dict:
+    host = urlsplit(url).hostname or ""
+    headers = {}
+    if prev and prev["etag"]:
+        headers["If-None-Match"] = prev["etag"]
+    if prev and prev["last_modified"]:
+        headers["If-Modified-Since"] = prev["last_modified"]
+    result = {"url": url, "status_code": None, "error": None, "etag": None, "last_modified": None}
+    try:
+        async with limiter.slot(host):
+            resp = await _fetch(client, "HEAD", url, headers)
+            # plenty of servers mishandle HEAD; a GET settles it
+            if resp.status_code >= 400 and resp.status_code != 429:
+                resp = await _fetch(client, "GET", url, headers)
+    except UnsafeTarget:
+        return dict(result, state="dead", error="unsafe target")
+    except socket.gaierror as e:
+        return dict(result, state="dead" if e.errno == socket.EAI_NONAME else "error", error="dns")
+    except httpx.TooManyRedirects:
+        return dict(result, state="dead", error="redirect loop")
+    except httpx.HTTPError as e:
+        return dict(result, state="error", error=type(e).__name__)
+
+    code = resp.status_code
+    if code in (429, 503):
+        delay = _retry_after(resp)
+        if delay:
+            limiter.cool_down(host, delay)
+    if code == 304 and prev:
+        return dict(result, state="ok", status_code=prev["status_code"], etag=prev["etag"], last_modified=prev["last_modified"])
+    if code < 400:
+        state = "ok"
+    elif code in DEAD_STATUS:
+        state = "dead"
+    elif code in BLOCKED_STATUS:
+        state = "blocked"
+    else:
+        state = "error"
+    return dict(
+        result,
+        state=state,
+        status_code=code,
+        etag=resp.headers.get("etag") if state == "ok" else None,
+        last_modified=resp.headers.get("last-modified") if state == "ok" else None,
+    )
+
+
+def interleave_by_host(rows: list) -> list:
+    # round-robin over hosts so one big host's backlog doesn't park every
+    # worker on its semaphore while other hosts sit idle
+    by_host = defaultdict(list)
+    for r in rows:
+        by_host[urlsplit(r["url"]).hostname or ""].append(r)
+    queues = list(by_host.values())
+    out = []
+    for i in range(max((len(q) for q in queues), default=0)):
+        out.extend(q[i] for q in queues if i < len(q))
+    return out
+
+
+async def check_batch(client: httpx.AsyncClient, limiter: HostLimiter, rows: list) -> list:
+    sem = asyncio.Semaphore(LINK_CHECK_CONCURRENCY)
+
+    async def one(row):
+        async with sem:
+            return await check_url(client, limiter, row["url"], row)
+
+    return await asyncio.gather(*(one(r) for r in interleave_by_host(rows)))
+
+
+async def sweep(max_urls: Optional[int] = None, transport=None, limiter: Optional[HostLimiter] = None) -> dict:
+    sync_urls()
+    limiter = limiter or HostLimiter(LINK_CHECK_PER_HOST)
+    counts = defaultdict(int)
+    async with make_client(transport) as client:
+        while max_urls is None or counts["checked"] < max_urls:
+            batch = LINK_CHECK_BATCH if max_urls is None else min(LINK_CHECK_BATCH, max_urls - counts["checked"])
+            rows = due_urls(batch)
+            if not rows:
+                break
+            results = await check_batch(client, limiter, rows)
+            save_results(results, {r["url"]: r for r in rows})
+            counts["checked"] += len(results)
+            for r in results:
+                counts[r["state"]] += 1
+    return dict(counts)
@@ -0,0 +1,108 @@
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config import LINK_CHECK_INTERVAL_SEC, LINK_CHECK_RETRY_SEC
+from app.db import get_conn, utcnow
+
+# transient errors are only reported once they repeat; "blocked" (401/403)
+# usually means the site turns bots away, so it is never reported
+WARN_AFTER_FAILURES = 3
+
+
+def sync_urls():
+    # track every url a visitor can reach, drop the ones nothing points to any more
+    with get_conn() as conn:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO url_health (url)
+            SELECT url FROM links WHERE is_active=1
+            UNION SELECT offer_url FROM pages WHERE offer_url IS NOT NULL AND offer_url != ''
+            """
+        )
+        conn.execute(
+            """
+            DELETE FROM url_health
+            WHERE url NOT IN (SELECT url FROM links WHERE is_active=1)
+              AND url NOT IN (SELECT offer_url FROM pages WHERE offer_url IS NOT NULL)
+            """
+        )
+
+
+def due_urls(limit: int, now: Optional[str] = None) -> list:
+    with get_conn() as conn:
+        return conn.execute(
+            "SELECT * FROM url_health WHERE next_check_at<=? ORDER BY next_check_at LIMIT ?",
+            (now or utcnow(), limit),
+        ).fetchall()
+
+
+def next_check(state: str, failures: int, now: datetime) -> datetime:
+    if state == "ok":
+        delay = LINK_CHECK_INTERVAL_SEC * random.uniform(0.9, 1.1)  # spread sweeps out
+    else:
+        delay = min(LINK_CHECK_INTERVAL_SEC, LINK_CHECK_RETRY_SEC * 2 ** min(failures - 1, 16))
+    return now + timedelta(seconds=delay)
+
+
+def save_results(results: list, prev: dict):
+    now = datetime.utcnow()
+    rows = []
+    for r in results:
+        p = prev.get(r["url"])
+        ok = r["state"] == "ok"
+        failures = 0 if ok else (p["failures"] if p else 0) + 1
+        failing_since = None if ok else (p["failing_since"] if p and p["failing_since"] else now.isoformat())
+        rows.append((
+            r["state"], r["status_code"], r["error"], r["etag"], r["last_modified"], failures,
+            now.isoformat(), failing_since, next_check(r["state"], failures, now).isoformat(), r["url"],
+        ))
+    with get_conn() as conn:
+        conn.executemany(
+            """
+            UPDATE url_health SET state=?, status_code=?, error=?, etag=?, last_modified=?, failures=?,
+                checked_at=?, failing_since=?, next_check_at=?
+            WHERE url=?
+            """,
+            rows,
+        )
+
+
+def is_warning(row) -> bool:
+    return row["state"] == "dead" or (row["state"] == "error" and row["failures"] >= WARN_AFTER_FAILURES)
+
+
+def link_warnings(page_id: int) -> dict:
+    with get_conn() as conn:
+        rows = conn.execute(
+            """
+            SELECT h.url, h.state, h.status_code, h.failures FROM url_health h
+            WHERE h.url IN (SELECT url FROM links WHERE page_id=? AND is_active=1)
+               OR h.url IN (SELECT offer_url FROM pages WHERE id=?)
+            """,
+            (page_id, page_id),
+        ).fetchall()
+    return {r["url"]: r for r in rows if is_warning(r)}
+
+
+def dead_link_report(limit: int = 100) -> list:
+    with get_conn() as conn:
+        return conn.execute(
+            """
+            SELECT p.id page_id, p.slug, l.id link_id, l.title, h.url, h.state, h.status_code, h.error,
+                   h.failures, h.failing_since, h.checked_at
+            FROM url_health h
+            JOIN links l ON l.url=h.url AND l.is_active=1
+            JOIN pages p ON p.id=l.page_id
+            WHERE h.state='dead' OR (h.state='error' AND h.failures>=?)
+            UNION ALL
+            SELECT p.id, p.slug, NULL, p.offer_title, h.url, h.state, h.status_code, h.error,
+                   h.failures, h.failing_since, h.checked_at
+            FROM url_health h
+            JOIN pages p ON p.offer_url=h.url
+            WHERE h.state='dead' OR (h.state='error' AND h.failures>=?)
+            ORDER BY failing_since
+            LIMIT ?
+            """,
+            (WARN_AFTER_FAILURES, WARN_AFTER_FAILURES, limit),
+        ).fetchall()
@@ -1,33 +1,91 @@
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
+import hashlib
+import json
+import os
 import secrets
 
-from fastapi import FastAPI, HTTPException, Request, Depends, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Request, Depends, Form, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 
 from app.config import (
     APP_NAME,
+    API_BATCH_MAX,
+    API_PAGE_MAX_AGE,
     ADMIN_USERNAME,
     ADMIN_PASSWORD,
+    BASE_URL,
     BOT_USERNAME,
     SUPPORT_TELEGRAM,
     BUSINESS_EMAIL,
     PAYMENT_METHODS_TEXT,
+    PROFILE_MAX_SEC,
     UPLOAD_DIR,
 )
-from app.db import init_db, get_conn
+from app.admission import AdmissionMiddleware, admission_stats
+from app.analytics import (
+    ALL_PAGES,
+    BUCKET_EXPR,
+    EVENT_TYPES,
+    floor_bucket,
+    series,
+    site_totals,
+    trending_pages,
+    unique_visitors,
+)
+from app.analytics_db import ingest_stats, init_analytics, main_db_conn
+from app.compression import CompressionMiddleware, PrecompressedStaticFiles, compression_stats
+from app.db import checkpoint_wal, init_db, get_conn
+from app.dedup import ingest_dedup
+from app.link_health import dead_link_report
+from app.geoip import geoip_size, load_geoip
+from app.export import EXPORT_FORMATS, export_high_water, iter_export
+from app.profiler import ProfilerBusy, folded, sample
+from app.querylog import slow_queries
+from app.og_image import OG_FORMATS, ensure_card, og_available, shutdown_pool
+from app.render import (
+    templates,
+    precompile_templates,
+    static_page_response,
+    warm_static_pages,
+    page_etag,
+    page_response,
+    render_page_json,
+    etag_matches,
+)
 from app.security import check_rate_limit, valid_http_url
+from app.replica import report_as_of, wait_for_refresh
+from app.slug_index import load_slug_index, resolve_slug, slug_index_size
+from app.domains import CustomDomainMiddleware, domain_index_size, load_domain_index
+from app.snapshot import get_link, get_snapshot, get_snapshots, snapshot_cache_size, snapshot_flight_stats
+from app.traffic import TrafficClassifierMiddleware, note_miss, is_bot, traffic_counters
 from app.services import record_view, record_click, gen_code
+from app.uploads import UploadFiles, upload_stats
 
 app = FastAPI(title=APP_NAME)
+# set by scripts.serve once it has warmed the app before forking workers
+app.state.preloaded = False
 security = HTTPBasic()
 BASE_DIR = Path(__file__).resolve().parent.parent
 Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
-app.mount("/uploads", StaticFiles(directory=str(Path(UPLOAD_DIR))), name="uploads")
-templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(TrafficClassifierMiddleware)
+# inside the domain middleware, so a custom host's page counts as a public page
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(CustomDomainMiddleware)
+app.mount("/static", PrecompressedStaticFiles(directory=str(BASE_DIR / "static")), name="static")
+app.mount("/uploads", UploadFiles(directory=str(Path(UPLOAD_DIR))), name="uploads")
+
+STATIC_PAGE_CONTEXTS = {
+    "/": {"bot_link": f"https://t.me/{BOT_USERNAME}", "support_telegram": SUPPORT_TELEGRAM},
+    "/pricing": {"payment_text": PAYMENT_METHODS_TEXT, "bot_link": f"https://t.me/{BOT_USERNAME}"},
+    "/examples": lambda: {"trending": trending_pages("7d", 6)},
+    "/faq": {},
+    "/contact": {"support_telegram": SUPPORT_TELEGRAM, "business_email": BUSINESS_EMAIL},
+}
 
 
 def prefix_of(request: Request) -> str:
@@ -45,9 +103,29 @@ def admin_auth(credentials: HTTPBasicCredentials = Depends(security)):
     return True
 
 
+def warm_up():
+    init_db()
+    init_analytics()
+    load_geoip()
+    load_slug_index()
+    load_domain_index()
+    precompile_templates()
+    warm_static_pages(STATIC_PAGE_CONTEXTS)
+
+
 @app.on_event("startup")
 def startup():
-    init_db()
+    if not app.state.preloaded:
+        warm_up()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    # uvicorn has drained in-flight requests by now; analytics rows are
+    # written inside the request, so what remains is background work
+    shutdown_pool()
+    wait_for_refresh(timeout=10)
+    checkpoint_wal()
 
 
 @app.get("/api/health")
@@ -55,49 +133,79 @@ def health():
     return {"status": "ok"}
 
 
+def api_response(request: Request, body: bytes, etag: str) -> Response:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={API_PAGE_MAX_AGE}, stale-while-revalidate={API_PAGE_MAX_AGE * 5}",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def api_ip_check(request: Request) -> str:
+    ip = request.client.host if request.client else "unknown"
+    if not check_rate_limit(f"api:{ip}", limit=240, period_sec=60):
+        raise HTTPException(status_code=429, detail="Too many requests")
+    return ip
+
+
+@app.get("/api/pages")
+def api_pages(request: Request, slugs: str = Query("")):
+    api_ip_check(request)
+    wanted = list(dict.fromkeys(s.strip() for s in slugs.split(",") if s.strip()))
+    if not wanted or len(wanted) > API_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Pass 1 to {API_BATCH_MAX} comma-separated slugs")
+    prefix = prefix_of(request)
+    ids = {slug: resolve_slug(slug) for slug in wanted}
+    found = get_snapshots({slug: page_id for slug, page_id in ids.items() if page_id is not None})
+    pages = [found[slug] for slug in wanted if slug in found]
+    missing = [slug for slug in wanted if slug not in found]
+    # the batch is only as fresh as its members, so its tag is built from their versions
+    tag_src = prefix + "|" + ",".join(page_etag(p, "") for p in pages) + "|" + ",".join(missing)
+    etag = '"' + hashlib.sha1(tag_src.encode("utf-8")).hexdigest()[:20] + '"'
+    body = b'{"pages":[' + b",".join(render_page_json(p, prefix) for p in pages) + b'],"missing":' + json.dumps(missing).encode("utf-8") + b"}"
+    return api_response(request, body, etag)
+
+
+@app.get("/api/pages/{slug}")
+def api_page(slug: str, request: Request):
+    ip = api_ip_check(request)
+    page_id = resolve_slug(slug)
+    if page_id is None:
+        note_miss(ip)
+        raise HTTPException(status_code=404, detail="Page not found")
+    snap = get_snapshot(page_id)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    prefix = prefix_of(request)
+    return api_response(request, render_page_json(snap, prefix), page_etag(snap, prefix))
+
+
 @app.get("/", response_class=HTMLResponse)
 def site_home(request: Request, lang: str = "ar"):
-    prefix = prefix_of(request)
-    return templates.TemplateResponse("site_home.html", {
-        "request": request,
-        "lang": lang,
-        "prefix": prefix,
-        "bot_link": f"https://t.me/{BOT_USERNAME}",
-        "support_telegram": SUPPORT_TELEGRAM,
-    })
+    return static_page_response(request, "/", lang, prefix_of(request), STATIC_PAGE_CONTEXTS["/"])
 
 
 @app.get("/pricing", response_class=HTMLResponse)
 def site_pricing(request: Request, lang: str = "ar"):
-    prefix = prefix_of(request)
-    return templates.TemplateResponse("site_pricing.html", {
-        "request": request,
-        "lang": lang,
-        "prefix": prefix,
-        "payment_text": PAYMENT_METHODS_TEXT,
-        "bot_link": f"https://t.me/{BOT_USERNAME}",
-    })
+    return static_page_response(request, "/pricing", lang, prefix_of(request), STATIC_PAGE_CONTEXTS["/pricing"])
 
 
 @app.get("/examples", response_class=HTMLResponse)
 def site_examples(request: Request, lang: str = "ar"):
-    return templates.TemplateResponse("site_examples.html", {"request": request, "lang": lang, "prefix": prefix_of(request)})
+    return static_page_response(request, "/examples", lang, prefix_of(request), STATIC_PAGE_CONTEXTS["/examples"])
 
 
 @app.get("/faq", response_class=HTMLResponse)
 def site_faq(request: Request, lang: str = "ar"):
-    return templates.TemplateResponse("site_faq.html", {"request": request, "lang": lang, "prefix": prefix_of(request)})
+    return static_page_response(request, "/faq", lang, prefix_of(request), STATIC_PAGE_CONTEXTS["/faq"])
 
 
 @app.get("/contact", response_class=HTMLResponse)
 def site_contact(request: Request, lang: str = "ar"):
-    return templates.TemplateResponse("site_contact.html", {
-        "request": request,
-        "lang": lang,
-        "prefix": prefix_of(request),
-        "support_telegram": SUPPORT_TELEGRAM,
-        "business_email": BUSINESS_EMAIL,
-    })
+    return static_page_response(request, "/contact", lang, prefix_of(request), STATIC_PAGE_CONTEXTS["/contact"])
 
 
 @app.get("/u/{slug}", response_class=HTMLResponse)
@@ -107,27 +215,38 @@ def public_page(slug: str, request: Request):
     if not check_rate_limit(f"u:{ip}", limit=180, period_sec=60):
         raise HTTPException(status_code=429, detail="Too many requests")
 
-    with get_conn() as conn:
-        page = conn.execute("SELECT * FROM pages WHERE slug=? AND is_published=1", (slug,)).fetchone()
-        if not page:
-            raise HTTPException(status_code=404, detail="Page not found")
-        links = conn.execute("SELECT * FROM links WHERE page_id=? AND is_active=1 ORDER BY position ASC", (page["id"],)).fetchall()
-        user = conn.execute("SELECT * FROM users WHERE id=?", (page["user_id"],)).fetchone()
-    record_view(page["id"], ip, request.headers.get("user-agent", ""))
-    show_watermark = True
-    if user and user["plan_type"] != "FREE" and user["plan_expires_at"]:
-        show_watermark = False
-    return templates.TemplateResponse(
-        "public_page.html",
-        {
-            "request": request,
-            "app_name": APP_NAME,
-            "page": page,
-            "links": links,
-            "show_watermark": show_watermark,
-            "prefix": prefix,
-        },
-    )
+    page_id = resolve_slug(slug)
+    if page_id is None:
+        note_miss(ip)
+        raise HTTPException(status_code=404, detail="Page not found")
+    snap = get_snapshot(page_id)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    if getattr(request.state, "custom_domain", None) and snap.watermark:
+        # custom domains are a paid feature; a lapsed plan falls back to the main site
+        return RedirectResponse(f"{BASE_URL}/u/{snap.slug}", status_code=302)
+    if getattr(request.state, "traffic_class", "human") == "preview":
+        return page_response(request, snap, prefix, "og_page.html")
+    if not is_bot(request):
+        record_view(page_id, ip, request.headers.get("user-agent", ""))
+    return page_response(request, snap, prefix)
+
+
+def load_published_page(slug: str):
+    page_id = resolve_slug(slug)
+    return get_snapshot(page_id) if page_id is not None else None
+
+
+@app.get("/og/{name}")
+async def og_image(name: str):
+    slug, _, fmt = name.rpartition(".")
+    if fmt not in OG_FORMATS or not og_available():
+        raise HTTPException(status_code=404, detail="Not found")
+    page = await run_in_threadpool(load_published_page, slug)
+    if not page:
+        raise HTTPException(status_code=404, detail="Page not found")
+    path = await ensure_card(page, fmt)
+    return FileResponse(path, media_type=OG_FORMATS[fmt], headers={"Cache-Control": "public, max-age=86400"})
 
 
 @app.get("/r/{link_id}")
@@ -136,28 +255,32 @@ def redirect_link(link_id: int, request: Request):
     if not check_rate_limit(f"r:{ip}", limit=240, period_sec=60):
         raise HTTPException(status_code=429, detail="Too many redirect requests")
 
-    with get_conn() as conn:
-        link = conn.execute("SELECT * FROM links WHERE id=? AND is_active=1", (link_id,)).fetchone()
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found")
+    found = get_link(link_id)
+    if not found:
+        note_miss(ip)
+        raise HTTPException(status_code=404, detail="Link not found")
+    page_id, link = found
 
-    target = (link["url"] or "").strip()
+    target = (link.url or "").strip()
     if not valid_http_url(target):
         raise HTTPException(status_code=400, detail="Unsafe target URL")
 
-    record_click(link["page_id"], link_id, ip, request.headers.get("user-agent", ""))
+    if not is_bot(request):
+        record_click(page_id, link_id, ip, request.headers.get("user-agent", ""))
     return RedirectResponse(target, status_code=302)
 
 
 @app.get("/admin", response_class=HTMLResponse)
 def admin_dashboard(request: Request, _: bool = Depends(admin_auth)):
     prefix = prefix_of(request)
-    with get_conn() as conn:
+    with main_db_conn() as conn:
         users = conn.execute("SELECT * FROM users ORDER BY id DESC LIMIT 100").fetchall()
         pages = conn.execute("SELECT * FROM pages ORDER BY id DESC LIMIT 100").fetchall()
         vouchers = conn.execute("SELECT * FROM vouchers ORDER BY id DESC LIMIT 200").fetchall()
-        total_views = conn.execute("SELECT COUNT(*) c FROM analytics_events WHERE event_type='view'").fetchone()["c"]
-        total_clicks = conn.execute("SELECT COUNT(*) c FROM analytics_events WHERE event_type='click'").fetchone()["c"]
+    site = site_totals()
+    today = datetime.utcnow().date()
+    uniques_today = unique_visitors(ALL_PAGES, today.isoformat(), today.isoformat())
+    uniques_7d = unique_visitors(ALL_PAGES, (today - timedelta(days=6)).isoformat(), today.isoformat())
     return templates.TemplateResponse(
         "admin.html",
         {
@@ -166,8 +289,114 @@ def admin_dashboard(request: Request, _: bool = Depends(admin_auth)):
             "users": users,
             "pages": pages,
             "vouchers": vouchers,
-            "total_views": total_views,
-            "total_clicks": total_clicks,
+            "total_views": site["views"],
+            "total_clicks": site["clicks"],
+            "traffic": traffic_counters(),
+            "uniques_today": uniques_today,
+            "uniques_7d": uniques_7d,
+            "trending": trending_pages("24h", 10),
+            "dead_links": dead_link_report(50),
+            "slow_queries": slow_queries(20),
+            "data_as_of": report_as_of(),
+        },
+    )
+
+
+@app.get("/admin/metrics")
+def admin_metrics(_: bool = Depends(admin_auth)):
+    # counters other than dedup keys are per worker
+    return {
+        "worker": os.getpid(),
+        "traffic": traffic_counters(),
+        "compression": compression_stats(),
+        "admission": admission_stats(),
+        "slug_index": slug_index_size(),
+        "custom_domains": domain_index_size(),
+        "snapshots": snapshot_cache_size(),
+        "snapshot_loads": snapshot_flight_stats(),
+        "dedup": ingest_dedup.stats(),
+        "ingest": ingest_stats(),
+        "geoip_ranges": geoip_size(),
+        "uploads": upload_stats(),
+    }
+
+
+@app.get("/admin/api/dead-links")
+def admin_dead_links(limit: int = Query(500, ge=1, le=5000), _: bool = Depends(admin_auth)):
+    return [dict(r) for r in dead_link_report(limit)]
+
+
+@app.get("/admin/api/slow-queries")
+def admin_slow_queries(limit: int = Query(200, ge=1, le=1000), _: bool = Depends(admin_auth)):
+    return slow_queries(limit)
+
+
+@app.get("/admin/profile")
+def admin_profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SEC),
+    interval_ms: float = Query(5, ge=1, le=100),
+    idle: bool = False,
+    _: bool = Depends(admin_auth),
+):
+    # samples the worker that took this request; it runs in the threadpool,
+    # so the event loop and the other requests keep going and get sampled
+    try:
+        stacks, rounds = sample(seconds, interval_ms / 1000, idle)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    return Response(
+        folded(stacks),
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "X-Profile-Worker": str(os.getpid()),
+            "X-Profile-Samples": str(rounds),
+            "Content-Disposition": f'attachment; filename="web-{os.getpid()}.folded"',
+        },
+    )
+
+
+@app.get("/admin/api/pages/{page_id}/series")
+def admin_page_series(
+    page_id: int,
+    metric: str = "views",
+    bucket: str = "day",
+    days: int = 30,
+    link_id: Optional[int] = None,
+    _: bool = Depends(admin_auth),
+):
+    if metric not in EVENT_TYPES or bucket not in BUCKET_EXPR:
+        raise HTTPException(status_code=400, detail="Invalid metric or bucket")
+    if days < 1 or days > 366:
+        raise HTTPException(status_code=400, detail="Invalid range")
+    end = datetime.utcnow()
+    start = floor_bucket(end - timedelta(days=days), "day")
+    return {
+        "page_id": page_id,
+        "metric": metric,
+        "bucket": bucket,
+        "link_id": link_id,
+        "as_of": report_as_of(),
+        "points": series(page_id, metric, start, end, bucket, link_id),
+    }
+
+
+@app.get("/admin/export/events")
+def admin_export_events(
+    since_id: int = 0,
+    fmt: str = Query("ndjson", alias="format"),
+    limit: Optional[int] = None,
+    _: bool = Depends(admin_auth),
+):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format")
+    high_water = export_high_water()
+    filename = f"events-{since_id}-{high_water}.{fmt}"
+    return StreamingResponse(
+        iter_export(fmt, since_id, until_id=high_water, limit=limit),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={
+            "X-Export-High-Water": str(high_water),
+            "Content-Disposition": f'attachment; filename="{filename}"',
         },
     )
 
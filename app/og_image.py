@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import html
+import importlib.util
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app.config import BASE_URL, OG_CACHE_DIR, OG_FONT_PATH, OG_RENDER_WORKERS, UPLOAD_DIR
+
+OG_SIZE = (1200, 630)
+OG_FORMATS = {"png": "image/png", "webp": "image/webp"}
+# bump when the card layout changes so cached files are regenerated
+RENDER_VERSION = "1"
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
+    "/Library/Fonts/Arial.ttf",
+)
+
+_pool = None
+_inflight = {}
+
+
+def og_available() -> bool:
+    # optional, no preview cards without Pillow; the import itself is left to
+    # the render workers so it stays off the web process startup path
+    return importlib.util.find_spec("PIL") is not None
+
+
+def card_key(page) -> str:
+    raw = "\x1f".join([
+        RENDER_VERSION,
+        page["display_name"] or "",
+        page["avatar_path"] or "",
+        page["theme_color"] or "#0f172a",
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def og_image_url(page, prefix: str = "") -> str:
+    return f"{BASE_URL}{prefix}/og/{page['slug']}.png?v={card_key(page)[:12]}"
+
+
+def card_path(key: str, fmt: str) -> Path:
+    return Path(OG_CACHE_DIR) / key[:2] / f"{key}.{fmt}"
+
+
+def avatar_file(avatar_path: str):
+    if not avatar_path or not avatar_path.startswith("/uploads/"):
+        return None
+    path = Path(UPLOAD_DIR) / avatar_path[len("/uploads/"):]
+    return str(path) if path.is_file() else None
+
+
+def _font(size: int):
+    from PIL import ImageFont, features
+
+    layout = ImageFont.Layout.RAQM if features.check("raqm") else ImageFont.Layout.BASIC
+    for candidate in (OG_FONT_PATH, *FONT_CANDIDATES):
+        if candidate and os.path.exists(candidate):
+            return ImageFont.truetype(candidate, size, layout_engine=layout)
+    return ImageFont.load_default(size=size)
+
+
+def render_card(display_name: str, avatar: str, theme_color: str, fmt: str) -> bytes:
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", OG_SIZE, theme_color)
+    draw = ImageDraw.Draw(img)
+    w, h = OG_SIZE
+    draw.rounded_rectangle((60, 60, w - 60, h - 60), radius=40, fill="white")
+    y = 110
+    if avatar:
+        size = 220
+        face = Image.open(avatar).convert("RGB")
+        side = min(face.size)
+        face = face.crop(((face.width - side) // 2, (face.height - side) // 2, (face.width + side) // 2, (face.height + side) // 2))
+        face = face.resize((size, size))
+        mask = Image.new("L", (size, size), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, size, size), fill=255)
+        img.paste(face, ((w - size) // 2, y), mask)
+        y += size + 30
+    else:
+        y += 110
+    name = display_name or "Linkat"
+    font = _font(64)
+    while draw.textlength(name, font=font) > w - 200 and len(name) > 4:
+        name = name[:-2] + "…"
+    draw.text((w // 2, y), name, fill="#0f172a", font=font, anchor="ma")
+    draw.text((w // 2, h - 120), "Linkat", fill=theme_color, font=_font(36), anchor="ma")
+    out = io.BytesIO()
+    img.save(out, format="WEBP" if fmt == "webp" else "PNG", optimize=True)
+    return out.getvalue()
+
+
+def render_card_file(path: str, display_name: str, avatar: str, theme_color: str, fmt: str) -> str:
+    data = render_card(display_name, avatar, theme_color, fmt)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def get_pool():
+    global _pool
+    if OG_RENDER_WORKERS <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=OG_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def ensure_card(page, fmt: str) -> Path:
+    key = card_key(page)
+    path = card_path(key, fmt)
+    if path.exists():
+        return path
+    job = _inflight.get((key, fmt))
+    if job is None:
+        loop = asyncio.get_running_loop()
+        color = page["theme_color"] or "#0f172a"
+        name = html.unescape(page["display_name"] or "")
+        job = loop.run_in_executor(get_pool(), render_card_file, str(path), name, avatar_file(page["avatar_path"]), color, fmt)
+        _inflight[(key, fmt)] = job
+        job.add_done_callback(lambda _: _inflight.pop((key, fmt), None))
+    await asyncio.shield(job)
+    return path
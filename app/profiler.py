@@ -0,0 +1,107 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from app.config import PROFILE_DIR, PROFILE_MAX_SEC
+
+# leaf frames of threads parked on I/O or a queue; left out unless asked
+# for, so the graph shows where CPU went rather than who was waiting
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socketserver.py", "serve_forever"),
+}
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_busy = threading.Lock()
+_names = {}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_name(code) -> str:
+    name = _names.get(code)
+    if name is None:
+        path = code.co_filename
+        if path.startswith(_BASE_DIR):
+            path = path[len(_BASE_DIR):]
+        elif "site-packages/" in path:
+            path = path.split("site-packages/", 1)[1]
+        name = _names[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+    return name
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+
+def sample(seconds: float, interval: float = 0.005, idle: bool = False) -> tuple:
+    # statistical profile of every thread but this one: the stack of each is
+    # read every `interval` seconds. Returns (Counter of folded stacks, number
+    # of sampling rounds). Pure Python, so it works on a live process without
+    # restarting it under a profiler; cost is a few % of one core at 200 Hz.
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        rounds = 0
+        deadline = time.monotonic() + min(seconds, PROFILE_MAX_SEC)
+        while time.monotonic() < deadline:
+            threads = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not idle and _is_idle(frame)):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(threads.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(stack))] += 1
+            rounds += 1
+            time.sleep(interval)
+        return stacks, rounds
+    finally:
+        _busy.release()
+
+
+def folded(stacks: Counter) -> str:
+    # "root;caller;callee count" per line: flamegraph.pl, inferno and
+    # speedscope all read it
+    return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+
+def profile_to_file(seconds: float, prefix: str, out_dir: Optional[str] = None) -> str:
+    stacks, _ = sample(seconds)
+    out_dir = out_dir or PROFILE_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{prefix}-{os.getpid()}-{datetime.utcnow():%Y%m%d-%H%M%S}.folded")
+    with open(path, "w") as f:
+        f.write(folded(stacks))
+    return path
+
+
+def install_signal_trigger(prefix: str, seconds: float = 30):
+    # `kill -USR1 <pid>` profiles the process for `seconds` in a background
+    # thread and writes the folded stacks to PROFILE_DIR
+    def run():
+        try:
+            print(f"profile written: {profile_to_file(seconds, prefix)}", file=sys.stderr)
+        except ProfilerBusy:
+            print("profiler already running", file=sys.stderr)
+
+    def handle(signum, frame):
+        threading.Thread(target=run, name="profiler", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, handle)
@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from app.config import SLOW_QUERY_LOG_SIZE, SLOW_QUERY_MS
+from app.shared import SharedRing
+
+# every worker appends to the same ring, so /admin sees slow queries from
+# whichever process ran them
+_slow = SharedRing(SLOW_QUERY_LOG_SIZE, 4096)
+_state = {"threshold_ms": SLOW_QUERY_MS}
+# per-task query count, set by counting_queries(); asyncio tasks and
+# to_thread calls inherit it, so concurrent handlers don't mix counts
+_tally = ContextVar("query_tally", default=None)
+
+
+def params_shape(params) -> str:
+    # types only: values can be IPs, user agents or voucher codes
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    runs = []
+    for v in params:
+        name = type(v).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return "(" + ", ".join(name if n == 1 else f"{name} x{n}" for name, n in runs) + ")"
+
+
+def _plan(conn: sqlite3.Connection, sql: str, params) -> list:
+    try:
+        rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params if params is not None else ())
+        return [str(r[-1])[:120] for r in rows.fetchmany(20)]
+    except sqlite3.Error:
+        return []
+
+
+def _record(conn, sql: str, params, shape: str, ms: float):
+    entry = {
+        "at": datetime.utcnow().isoformat(timespec="milliseconds"),
+        "ms": round(ms, 1),
+        "db": getattr(conn, "db_name", ""),
+        "pid": os.getpid(),
+        "sql": " ".join(sql.split())[:1000],
+        "params": shape[:200],
+        "plan": _plan(conn, sql, params),
+    }
+    payload = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+    if len(payload) > _slow.capacity:
+        entry["plan"] = entry["plan"][:3]
+        payload = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+    _slow.append(payload)
+
+
+class TimedCursor(sqlite3.Cursor):
+    # only the execute call is timed: for a SELECT that is the work up to the
+    # first row, which is where a missing index or a lock wait shows up
+    def execute(self, sql, params=()):
+        tally = _tally.get()
+        if tally is not None:
+            tally[0] += 1
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            if ms >= _state["threshold_ms"]:
+                _record(self.connection, sql, params, params_shape(params), ms)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        tally = _tally.get()
+        if tally is not None:
+            tally[0] += 1
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            if ms >= _state["threshold_ms"]:
+                first = seq_of_params[0] if seq_of_params else None
+                _record(self.connection, sql, first, f"{len(seq_of_params)} x {params_shape(first)}", ms)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # the C shortcuts build a plain cursor, bypassing cursor() above
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def connect(path: str, **kwargs) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, factory=TimedConnection, **kwargs)
+    conn.db_name = os.path.basename(path.split("?", 1)[0])
+    return conn
+
+
+@contextmanager
+def counting_queries():
+    # yields a one-item list holding the number of statements run so far
+    tally = [0]
+    token = _tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _tally.reset(token)
+
+
+def slow_queries(limit: int = 200) -> list:
+    found = []
+    for payload in _slow.items():
+        try:
+            found.append(json.loads(payload))
+        except ValueError:
+            continue  # caught mid-write
+        if len(found) >= limit:
+            break
+    return found
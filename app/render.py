@@ -0,0 +1,209 @@
+import hashlib
+import html
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from app.config import APP_ENV, APP_NAME, BASE_URL, TEMPLATE_CACHE_DIR, STATIC_PAGE_MAX_AGE, PAGE_HTML_CACHE_MAX
+from app.og_image import og_image_url
+from app.singleflight import SingleFlight
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TEMPLATE_DIR = BASE_DIR / "templates"
+
+# marketing pages whose output depends only on (lang, prefix)
+STATIC_PAGES = {
+    "/": "site_home.html",
+    "/pricing": "site_pricing.html",
+    "/examples": "site_examples.html",
+    "/faq": "site_faq.html",
+    "/contact": "site_contact.html",
+}
+# pages built from live data are re-rendered after this many seconds
+STATIC_PAGE_TTL = {"/examples": 300}
+STATIC_PAGE_CACHE_MAX = 256
+
+# (path, lang, prefix) -> entry; the prefix comes from a request header, so
+# the least recently served entries make room for new ones
+_static_pages = OrderedDict()
+_static_pages_lock = threading.Lock()
+# (page id, page version, watermark, template or "json", prefix) -> body; an edit moves
+# the version, so stale bodies are never hit and just age out
+_page_html = OrderedDict()
+_page_html_lock = threading.Lock()
+_page_builds = SingleFlight()
+
+
+def build_env() -> Environment:
+    Path(TEMPLATE_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(str(TEMPLATE_DIR)),
+        autoescape=True,
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+        auto_reload=APP_ENV != "prod",
+    )
+
+
+templates = Jinja2Templates(env=build_env())
+
+
+def precompile_templates() -> int:
+    env = templates.env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def norm_lang(lang: str) -> str:
+    return "en" if lang == "en" else "ar"
+
+
+def render_static_page(path: str, lang: str, prefix: str, context: dict):
+    key = (path, lang, prefix)
+    with _static_pages_lock:
+        entry = _static_pages.get(key)
+        if entry and (entry["expires"] is None or entry["expires"] > time.monotonic()):
+            _static_pages.move_to_end(key)
+            return entry
+    if callable(context):
+        context = context()
+    html = templates.get_template(STATIC_PAGES[path]).render(lang=lang, prefix=prefix, path=path, **context)
+    body = html.encode("utf-8")
+    ttl = STATIC_PAGE_TTL.get(path)
+    entry = {
+        "body": body,
+        "etag": '"' + hashlib.sha1(body).hexdigest()[:20] + '"',
+        "expires": time.monotonic() + ttl if ttl else None,
+    }
+    with _static_pages_lock:
+        _static_pages[key] = entry
+        _static_pages.move_to_end(key)
+        while len(_static_pages) > STATIC_PAGE_CACHE_MAX:
+            _static_pages.popitem(last=False)
+    return entry
+
+
+def _base_etag(tag: str) -> str:
+    # weak comparison, and the per-encoding suffix CompressionMiddleware adds
+    tag = tag.strip().removeprefix("W/")
+    for suffix in ('-gzip"', '-br"'):
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    raw = request.headers.get("if-none-match") or ""
+    return raw.strip() == "*" or any(_base_etag(t) == etag for t in raw.split(","))
+
+
+def static_page_response(request: Request, path: str, lang: str, prefix: str, context: dict) -> Response:
+    entry = render_static_page(path, norm_lang(lang), prefix, context)
+    headers = {
+        "ETag": entry["etag"],
+        "Cache-Control": f"public, max-age={STATIC_PAGE_MAX_AGE}",
+    }
+    if etag_matches(request, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(entry["body"], media_type="text/html; charset=utf-8", headers=headers)
+
+
+def warm_static_pages(contexts: dict):
+    for path in STATIC_PAGES:
+        for lang in ("ar", "en"):
+            render_static_page(path, lang, "", contexts.get(path, {}))
+
+
+def clear_static_pages():
+    with _static_pages_lock:
+        _static_pages.clear()
+
+
+def _cached_page_body(key, build) -> bytes:
+    with _page_html_lock:
+        body = _page_html.get(key)
+        if body is not None:
+            _page_html.move_to_end(key)
+            return body
+    # concurrent misses for the same key wait for one render
+    return _page_builds.do(key, lambda: _store_page_body(key, build()))
+
+
+def _store_page_body(key, body: bytes) -> bytes:
+    with _page_html_lock:
+        _page_html[key] = body
+        while len(_page_html) > PAGE_HTML_CACHE_MAX:
+            _page_html.popitem(last=False)
+    return body
+
+
+def render_page(snap, prefix: str, template: str = "public_page.html") -> bytes:
+    def build():
+        return templates.get_template(template).render(
+            app_name=APP_NAME,
+            page=snap,
+            links=snap.links,
+            show_watermark=snap.watermark,
+            prefix=prefix,
+            page_url=f"{BASE_URL}{prefix}/u/{snap.slug}",
+            og_image=og_image_url(snap, prefix),
+        ).encode("utf-8")
+
+    return _cached_page_body((snap.id, snap.version, snap.watermark, template, prefix), build)
+
+
+def page_etag(snap, prefix: str, kind: str = "") -> str:
+    # the version moves on every page, link or plan change; a paid plan
+    # lapsing flips the watermark without one, so that goes in too
+    tag = f"{snap.id}.{snap.version}" + (".w" if snap.watermark else "")
+    if prefix or kind:
+        tag += "." + hashlib.sha1(f"{prefix}|{kind}".encode("utf-8")).hexdigest()[:8]
+    return f'"{tag}"'
+
+
+def page_response(request: Request, snap, prefix: str, template: str = "public_page.html") -> Response:
+    # no-cache: browsers revalidate every visit (so views still count) and
+    # get a 304 without a render while the page is unchanged
+    etag = page_etag(snap, prefix, "" if template == "public_page.html" else template)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(render_page(snap, prefix, template), media_type="text/html; charset=utf-8", headers=headers)
+
+
+def page_payload(snap, prefix: str) -> dict:
+    # text fields are stored html-escaped for the templates; API clients get them plain
+    text = lambda v: html.unescape(v) if v else v
+    return {
+        "id": snap.id,
+        "slug": snap.slug,
+        "version": snap.version,
+        "url": f"{BASE_URL}{prefix}/u/{snap.slug}",
+        "display_name": text(snap.display_name),
+        "bio": text(snap.bio),
+        "avatar_url": f"{BASE_URL}{prefix}{snap.avatar_path}" if snap.avatar_path else None,
+        "theme_color": snap.theme_color,
+        "featured_video_url": snap.featured_video_url,
+        "offer": {"title": text(snap.offer_title), "url": snap.offer_url} if snap.offer_title and snap.offer_url else None,
+        "links": [
+            {"id": l.id, "title": text(l.title), "url": l.url, "click_url": f"{BASE_URL}{prefix}/r/{l.id}"}
+            for l in snap.links
+        ],
+        "watermark": snap.watermark,
+        "og_image": og_image_url(snap, prefix),
+    }
+
+
+def render_page_json(snap, prefix: str) -> bytes:
+    def build():
+        return json.dumps(page_payload(snap, prefix), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return _cached_page_body((snap.id, snap.version, snap.watermark, "json", prefix), build)
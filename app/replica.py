@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.config import ANALYTICS_DIR, REPORTING_MODE, REPORT_DIR, REPORT_MAX_STALENESS_SEC
+from app.db import backup_database, utcnow
+
+_state = {"as_of": None, "mtime": None}
+_refresh_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # a refresh thread running in the launcher when it forks does not exist
+    # in the worker, so the lock it holds would never be released there
+    global _refresh_lock
+    _refresh_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def report_dir() -> str:
+    return REPORT_DIR or os.path.join(ANALYTICS_DIR, "report")
+
+
+def snapshot_path(path: str) -> str:
+    return os.path.join(report_dir(), os.path.basename(path))
+
+
+def _as_of_path() -> str:
+    return os.path.join(report_dir(), "as_of")
+
+
+def refresh_snapshot(paths: list):
+    # copy each file to a private name, then rename it over its old snapshot;
+    # readers holding the previous file keep a consistent view. The stamp is
+    # written last, so it never claims more than the copies hold.
+    os.makedirs(report_dir(), exist_ok=True)
+    as_of = utcnow()
+    for path in paths:
+        dest = snapshot_path(path)
+        tmp = f"{dest}.{os.getpid()}.new"
+        backup_database(tmp, src_path=path)
+        conn = sqlite3.connect(tmp)
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            conn.close()
+        os.replace(tmp, dest)
+    tmp = f"{_as_of_path()}.{os.getpid()}.new"
+    with open(tmp, "w") as f:
+        f.write(as_of)
+    os.replace(tmp, _as_of_path())
+
+
+def _snapshot_age() -> Optional[float]:
+    try:
+        return time.time() - os.stat(_as_of_path()).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _complete(paths: list) -> bool:
+    return _snapshot_age() is not None and all(os.path.exists(snapshot_path(p)) for p in paths)
+
+
+def _refresh_in_background(paths: list):
+    try:
+        refresh_snapshot(paths)
+    finally:
+        _refresh_lock.release()
+
+
+def ensure_snapshot(paths: list):
+    # paths: the files still taking writes; anything else is read in place
+    age = _snapshot_age()
+    if age is not None and age < REPORT_MAX_STALENESS_SEC and _complete(paths):
+        return
+    if not _complete(paths):
+        # nothing to serve for some file (first run, or a new month began)
+        with _refresh_lock:
+            if not _complete(paths):
+                refresh_snapshot(paths)
+        return
+    # stale but usable: serve it while one thread builds the next copy
+    if _refresh_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, args=(paths,), daemon=True).start()
+
+
+def wait_for_refresh(timeout: float):
+    if _refresh_lock.acquire(timeout=timeout):
+        _refresh_lock.release()
+
+
+def report_as_of() -> Optional[str]:
+    if not REPORTING_MODE:
+        return None
+    try:
+        mtime = os.stat(_as_of_path()).st_mtime
+    except FileNotFoundError:
+        return None
+    if _state["mtime"] != mtime:
+        with open(_as_of_path()) as f:
+            _state["as_of"] = f.read().strip()
+        _state["mtime"] = mtime
+    return _state["as_of"]
@@ -1,11 +1,12 @@
 import html
 import re
-import time
-from collections import defaultdict, deque
 from urllib.parse import urlparse
 
+from app.config import RATE_LIMIT_SLOTS
+from app.shared import SharedWindowCounter
 
-_rate = defaultdict(deque)
+# shared by all workers forked from the launcher
+_rate = SharedWindowCounter(RATE_LIMIT_SLOTS)
 
 
 def sanitize_text(v: str, max_len: int = 220) -> str:
@@ -34,11 +35,4 @@ def valid_http_url(url: str) -> bool:
 
 
 def check_rate_limit(key: str, limit: int = 120, period_sec: int = 60) -> bool:
-    now = time.time()
-    q = _rate[key]
-    while q and now - q[0] > period_sec:
-        q.popleft()
-    if len(q) >= limit:
-        return False
-    q.append(now)
-    return True
+    return _rate.add(key, period_sec, limit)
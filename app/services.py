@@ -1,10 +1,33 @@
 import random
 import string
 from datetime import datetime, timedelta
-from slugify import slugify
 
-from app.db import get_conn, utcnow
+from app.analytics import (
+    add_unique,
+    bump_country,
+    bump_link_click,
+    bump_rollup,
+    bump_trending,
+    top_countries,
+    top_links,
+    totals,
+    unique_visitors,
+    visitor_fingerprint,
+)
+from app.analytics_db import MonthClosed, ingest_conn, note_dropped
+from app.config import RESERVED_SLUGS
+from app.db import NEXT_PAGE_VERSION, get_conn, utcnow
+from app.replica import report_as_of
+from app.dedup import ingest_dedup
+from app.geoip import country_for_ip
+from app.slug_index import add_slug
+from app.snapshot import evict_snapshot
 from app.security import valid_http_url, sanitize_text
+from app.uploads import move_ref
+
+EDITABLE_PAGE_FIELDS = (
+    "display_name", "bio", "avatar_path", "theme_color", "featured_video_url", "offer_title", "offer_url",
+)
 
 
 def gen_code(n=10):
@@ -12,36 +35,110 @@ def gen_code(n=10):
     return "".join(random.choice(chars) for _ in range(n))
 
 
-def generate_unique_slug(name: str) -> str:
+def slug_base(name: str) -> str:
+    from slugify import slugify
+
     base = slugify(name or "")
     if not base:
         base = "u-" + "".join(random.choice(string.ascii_lowercase + string.digits) for _ in range(6))
-    slug = base[:40]
+    return base[:40]
+
+
+def allocate_slug(conn, name: str) -> str:
+    slug = slug_base(name)
+    stem = slug[:34]
+    # one range scan over the slug index covers the base and every stem-N candidate
+    rows = conn.execute(
+        "SELECT slug FROM pages WHERE slug=? OR (slug>? AND slug<?)",
+        (slug, stem + "-", stem + "."),
+    ).fetchall()
+    taken = {r["slug"] for r in rows}
+    if slug not in taken and slug not in RESERVED_SLUGS:
+        return slug
+    used = {int(s[len(stem) + 1:]) for s in taken if s.startswith(stem + "-") and s[len(stem) + 1:].isdigit()}
+    i = 2
+    while i in used or f"{stem}-{i}" in RESERVED_SLUGS:
+        i += 1
+    return f"{stem}-{i}"
+
+
+def generate_unique_slug(name: str) -> str:
     with get_conn() as conn:
-        i = 1
-        candidate = slug
-        while conn.execute("SELECT id FROM pages WHERE slug=?", (candidate,)).fetchone():
-            i += 1
-            candidate = f"{slug[:34]}-{i}"
-        return candidate
+        return allocate_slug(conn, name)
 
 
-def upsert_page_field(page_id: int, field: str, value):
+def publish_page(page_id: int) -> str:
     with get_conn() as conn:
-        conn.execute(f"UPDATE pages SET {field}=?, updated_at=? WHERE id=?", (value, utcnow(), page_id))
+        # hold the write lock so concurrent publishers can't pick the same slug
+        conn.execute("BEGIN IMMEDIATE")
+        page = conn.execute("SELECT slug, display_name, is_published FROM pages WHERE id=?", (page_id,)).fetchone()
+        if page is None:
+            raise ValueError("page_not_found")
+        slug = page["slug"] or allocate_slug(conn, page["display_name"])
+        conn.execute(
+            f"UPDATE pages SET slug=?, is_published=1, updated_at=?, version={NEXT_PAGE_VERSION} WHERE id=?",
+            (slug, utcnow(), page_id),
+        )
+        if not (page["slug"] and page["is_published"]):
+            conn.execute("INSERT INTO slug_log (slug, page_id, created_at) VALUES (?, ?, ?)", (slug, page_id, utcnow()))
+    add_slug(slug, page_id)
+    evict_snapshot(page_id)
+    return slug
 
 
-def add_link(page_id: int, title: str, url: str, platform: str = "custom"):
-    if not valid_http_url(url):
-        raise ValueError("invalid_url")
-    safe_title = sanitize_text(title, 80)
-    safe_url = (url or "").strip()
+def bump_page_version(conn, page_id: int):
+    conn.execute(f"UPDATE pages SET version={NEXT_PAGE_VERSION} WHERE id=?", (page_id,))
+
+
+def update_page(page_id: int, **fields) -> int:
+    # every field in one transaction and one version bump, so readers never
+    # see half an edit (an offer title without its URL); returns the version
+    unknown = set(fields) - set(EDITABLE_PAGE_FIELDS)
+    if unknown:
+        raise ValueError(f"not editable: {', '.join(sorted(unknown))}")
+    with get_conn() as conn:
+        if "avatar_path" in fields:
+            old = conn.execute("SELECT avatar_path FROM pages WHERE id=?", (page_id,)).fetchone()
+            move_ref(conn, old["avatar_path"] if old else None, fields["avatar_path"])
+        if fields:
+            assignments = "".join(f"{name}=?, " for name in fields)
+            conn.execute(
+                f"UPDATE pages SET {assignments}updated_at=?, version={NEXT_PAGE_VERSION} WHERE id=?",
+                (*fields.values(), utcnow(), page_id),
+            )
+        row = conn.execute("SELECT version FROM pages WHERE id=?", (page_id,)).fetchone()
+    evict_snapshot(page_id)
+    return row["version"] if row else 0
+
+
+def upsert_page_field(page_id: int, field: str, value) -> int:
+    return update_page(page_id, **{field: value})
+
+
+def add_links(page_id: int, items: list) -> int:
+    # items: (title, url, platform) tuples, appended in order in one
+    # transaction with a single version bump; returns how many were added
+    rows = []
+    for title, url, platform in items:
+        if not valid_http_url(url):
+            raise ValueError("invalid_url")
+        rows.append((sanitize_text(title, 80), (url or "").strip(), platform))
+    if not rows:
+        return 0
+    now = utcnow()
     with get_conn() as conn:
         max_pos = conn.execute("SELECT COALESCE(MAX(position),0) AS m FROM links WHERE page_id=?", (page_id,)).fetchone()["m"]
-        conn.execute(
+        conn.executemany(
             "INSERT INTO links (page_id, title, url, platform, position, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (page_id, safe_title, safe_url, platform, max_pos + 1, utcnow()),
+            [(page_id, title, url, platform, max_pos + i, now) for i, (title, url, platform) in enumerate(rows, start=1)],
         )
+        bump_page_version(conn, page_id)
+    evict_snapshot(page_id)
+    return len(rows)
+
+
+def add_link(page_id: int, title: str, url: str, platform: str = "custom"):
+    add_links(page_id, [(title, url, platform)])
 
 
 def list_links(page_id: int):
@@ -56,6 +153,8 @@ def remove_link(page_id: int, index: int):
     link_id = links[index - 1]["id"]
     with get_conn() as conn:
         conn.execute("UPDATE links SET is_active=0 WHERE id=?", (link_id,))
+        bump_page_version(conn, page_id)
+    evict_snapshot(page_id)
     return True
 
 
@@ -70,6 +169,8 @@ def reorder_link(page_id: int, from_pos: int, to_pos: int):
     with get_conn() as conn:
         for i, l in enumerate(arr, start=1):
             conn.execute("UPDATE links SET position=? WHERE id=?", (i, l["id"]))
+        bump_page_version(conn, page_id)
+    evict_snapshot(page_id)
     return True
 
 
@@ -90,6 +191,7 @@ def plan_limits(user_row):
             "custom_theme": False,
             "featured_video": False,
             "reorder": False,
+            "custom_domain": False,
         }
     if plan == "PRO_1":
         return {
@@ -99,6 +201,7 @@ def plan_limits(user_row):
             "custom_theme": True,
             "featured_video": False,
             "reorder": True,
+            "custom_domain": True,
         }
     return {
         "plan": "PRO_3",
@@ -107,52 +210,69 @@ def plan_limits(user_row):
         "custom_theme": True,
         "featured_video": True,
         "reorder": True,
+        "custom_domain": True,
     }
 
 
 def record_view(page_id: int, ip: str = "", ua: str = ""):
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT INTO analytics_events (page_id, link_id, event_type, ip, user_agent, created_at) VALUES (?, NULL, 'view', ?, ?, ?)",
-            (page_id, ip, ua, utcnow()),
-        )
+    visitor = visitor_fingerprint(ip, ua)
+    if ingest_dedup.seen("view", (page_id, 0, visitor)):
+        return
+    now = utcnow()
+    country = country_for_ip(ip)
+    try:
+        with ingest_conn(now) as conn:
+            conn.execute(
+                "INSERT INTO analytics_events (page_id, link_id, event_type, ip, user_agent, created_at, country) VALUES (?, NULL, 'view', ?, ?, ?, ?)",
+                (page_id, ip, ua, now, country),
+            )
+            bump_rollup(conn, page_id, None, "view", now)
+            bump_country(conn, page_id, "view", country, now)
+            add_unique(conn, page_id, visitor, now)
+            bump_trending(conn, page_id)
+    except MonthClosed:
+        # stamped in a month the rotation has already closed
+        note_dropped()
 
 
 def record_click(page_id: int, link_id: int, ip: str = "", ua: str = ""):
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT INTO analytics_events (page_id, link_id, event_type, ip, user_agent, created_at) VALUES (?, ?, 'click', ?, ?, ?)",
-            (page_id, link_id, ip, ua, utcnow()),
-        )
+    visitor = visitor_fingerprint(ip, ua)
+    if ingest_dedup.seen("click", (page_id, link_id, visitor)):
+        return
+    now = utcnow()
+    country = country_for_ip(ip)
+    try:
+        with ingest_conn(now) as conn:
+            conn.execute(
+                "INSERT INTO analytics_events (page_id, link_id, event_type, ip, user_agent, created_at, country) VALUES (?, ?, 'click', ?, ?, ?, ?)",
+                (page_id, link_id, ip, ua, now, country),
+            )
+            bump_rollup(conn, page_id, link_id, "click", now)
+            bump_country(conn, page_id, "click", country, now)
+            add_unique(conn, page_id, visitor, now)
+            bump_link_click(conn, page_id, link_id)
+    except MonthClosed:
+        # stamped in a month the rotation has already closed
+        note_dropped()
 
 
 def stats_for_user(user_id: int):
     with get_conn() as conn:
         page = conn.execute("SELECT * FROM pages WHERE user_id=?", (user_id,)).fetchone()
         if not page:
-            return {"views_total": 0, "clicks_total": 0, "views_7d": 0, "clicks_7d": 0, "top_links": []}
+            return {"views_total": 0, "clicks_total": 0, "views_7d": 0, "clicks_7d": 0, "uniques_7d": 0, "top_links": [], "countries_7d": [], "as_of": None}
         page_id = page["id"]
-        since = (datetime.utcnow() - timedelta(days=7)).isoformat()
-        views_total = conn.execute("SELECT COUNT(*) c FROM analytics_events WHERE page_id=? AND event_type='view'", (page_id,)).fetchone()["c"]
-        clicks_total = conn.execute("SELECT COUNT(*) c FROM analytics_events WHERE page_id=? AND event_type='click'", (page_id,)).fetchone()["c"]
-        views_7d = conn.execute("SELECT COUNT(*) c FROM analytics_events WHERE page_id=? AND event_type='view' AND created_at>=?", (page_id, since)).fetchone()["c"]
-        clicks_7d = conn.execute("SELECT COUNT(*) c FROM analytics_events WHERE page_id=? AND event_type='click' AND created_at>=?", (page_id, since)).fetchone()["c"]
-        top = conn.execute(
-            """
-            SELECT l.title, l.url, COUNT(a.id) c
-            FROM analytics_events a
-            JOIN links l ON l.id=a.link_id
-            WHERE a.page_id=? AND a.event_type='click'
-            GROUP BY l.id
-            ORDER BY c DESC
-            LIMIT 5
-            """,
-            (page_id,),
-        ).fetchall()
-        return {
-            "views_total": views_total,
-            "clicks_total": clicks_total,
-            "views_7d": views_7d,
-            "clicks_7d": clicks_7d,
-            "top_links": top,
-        }
+    all_time = totals(page_id)
+    since = datetime.utcnow() - timedelta(days=7)
+    last_7d = totals(page_id, since=since)
+    start_day = (since.date() + timedelta(days=1)).isoformat()
+    return {
+        "views_total": all_time["views"],
+        "clicks_total": all_time["clicks"],
+        "views_7d": last_7d["views"],
+        "clicks_7d": last_7d["clicks"],
+        "uniques_7d": unique_visitors(page_id, start_day, datetime.utcnow().date().isoformat()),
+        "top_links": top_links(page_id, 5),
+        "countries_7d": top_countries(page_id, start_day, "view", 5),
+        "as_of": report_as_of(),
+    }
@@ -0,0 +1,96 @@
+import mmap
+import struct
+import threading
+import time
+
+from app.hll import hash64
+
+# key hash, fixed window number, count in that window, count in the one before
+_WINDOW_SLOT = struct.Struct("<QIII")
+
+
+def shared_buffer(size: int) -> mmap.mmap:
+    # anonymous MAP_SHARED mapping: allocated at import, before the launcher
+    # forks, every worker writes to the same pages. Under a single process (or
+    # workers that import the app themselves) it is just private memory.
+    return mmap.mmap(-1, size)
+
+
+class SharedWindowCounter:
+    # per-key hit counts over a sliding window, kept in a fixed table of
+    # slots indexed by key hash. A slot holds the current and the previous
+    # fixed window; the previous one is weighted by how much of it the
+    # sliding window still covers. A key landing on a slot held by another
+    # key takes it over from zero, so collisions err towards allowing.
+    # Workers update slots without a cross-process lock: two workers bumping
+    # the same key at the same instant can lose a count.
+    def __init__(self, slots: int):
+        self.slots = max(slots, 1)
+        self._buf = shared_buffer(self.slots * _WINDOW_SLOT.size)
+        self._lock = threading.Lock()
+
+    def _load(self, key: str, period: int, now: float):
+        h = hash64(f"{period}|{key}")
+        offset = (h % self.slots) * _WINDOW_SLOT.size
+        stored, window, cur, prev = _WINDOW_SLOT.unpack_from(self._buf, offset)
+        w = int(now // period)
+        if stored != h or window < w - 1:
+            cur, prev = 0, 0
+        elif window == w - 1:
+            cur, prev = 0, cur
+        estimate = cur + prev * (1 - (now % period) / period)
+        return h, offset, w, cur, prev, estimate
+
+    def add(self, key: str, period: int, limit=None) -> bool:
+        now = time.time()
+        with self._lock:
+            h, offset, w, cur, prev, estimate = self._load(key, period, now)
+            if limit is not None and estimate >= limit:
+                return False
+            _WINDOW_SLOT.pack_into(self._buf, offset, h, w, cur + 1, prev)
+            return True
+
+    def count(self, key: str, period: int) -> float:
+        with self._lock:
+            return self._load(key, period, time.time())[-1]
+
+
+# sequence number of the entry, payload length
+_RING_ENTRY = struct.Struct("<QI")
+_RING_HEAD = struct.Struct("<Q")
+
+
+class SharedRing:
+    # the last `slots` payloads of at most slot_size bytes, newest first on
+    # read. Like the counter, writers in different workers don't lock each
+    # other: a racing pair can overwrite one entry, and a reader can catch a
+    # slot mid-write, so payloads should be checkable (JSON) and skipped when
+    # they don't parse.
+    def __init__(self, slots: int, slot_size: int):
+        self.slots = max(slots, 1)
+        self.slot_size = slot_size
+        self._buf = shared_buffer(_RING_HEAD.size + self.slots * slot_size)
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.slot_size - _RING_ENTRY.size
+
+    def append(self, payload: bytes):
+        payload = payload[:self.capacity]
+        with self._lock:
+            seq = _RING_HEAD.unpack_from(self._buf, 0)[0] + 1
+            _RING_HEAD.pack_into(self._buf, 0, seq)
+            offset = _RING_HEAD.size + (seq % self.slots) * self.slot_size
+            _RING_ENTRY.pack_into(self._buf, offset, seq, len(payload))
+            self._buf[offset + _RING_ENTRY.size:offset + _RING_ENTRY.size + len(payload)] = payload
+
+    def items(self) -> list:
+        entries = []
+        with self._lock:
+            for i in range(self.slots):
+                offset = _RING_HEAD.size + i * self.slot_size
+                seq, size = _RING_ENTRY.unpack_from(self._buf, offset)
+                if seq and size <= self.capacity:
+                    entries.append((seq, bytes(self._buf[offset + _RING_ENTRY.size:offset + _RING_ENTRY.size + size])))
+        return [payload for _, payload in sorted(entries, reverse=True)]
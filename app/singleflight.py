@@ -0,0 +1,60 @@
+import os
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # concurrent callers asking for the same key share one run of fn: the
+    # first caller runs it, the rest block until it finishes and get its
+    # result (or its exception). Nothing is kept once the call returns.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.led = 0
+        self.shared = 0
+        # a call running in the parent when it forks never finishes in the
+        # child, so waiters there would block forever
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.led += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def running(self, key) -> bool:
+        return key in self._calls
+
+    def stats(self) -> dict:
+        return {"led": self.led, "shared": self.shared, "in_flight": len(self._calls)}
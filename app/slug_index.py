@@ -0,0 +1,59 @@
+import threading
+import time
+from typing import Optional
+
+from app.config import SLUG_INDEX_REFRESH_SEC
+from app.db import get_conn
+
+# published slug -> page id; refreshed from slug_log so pages published by
+# the bot process show up without a per-request lookup
+_slugs = {}
+_state = {"seq": -1, "checked_at": 0.0}
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def load_slug_index():
+    with get_conn() as conn:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) s FROM slug_log").fetchone()["s"]
+        rows = conn.execute("SELECT slug, id FROM pages WHERE is_published=1 AND slug IS NOT NULL").fetchall()
+    with _lock:
+        _slugs.clear()
+        _slugs.update((r["slug"], r["id"]) for r in rows)
+        _state["seq"] = seq
+        _state["checked_at"] = time.monotonic()
+
+
+def refresh_slug_index():
+    if _state["seq"] < 0:
+        load_slug_index()
+        return
+    with get_conn() as conn:
+        rows = conn.execute("SELECT seq, slug, page_id FROM slug_log WHERE seq>? ORDER BY seq", (_state["seq"],)).fetchall()
+    with _lock:
+        for r in rows:
+            _slugs[r["slug"]] = r["page_id"]
+            _state["seq"] = max(_state["seq"], r["seq"])
+        _state["checked_at"] = time.monotonic()
+
+
+def resolve_slug(slug: str) -> Optional[int]:
+    page_id = _slugs.get(slug)
+    if page_id is not None:
+        return page_id
+    stale = _state["seq"] < 0 or time.monotonic() - _state["checked_at"] >= SLUG_INDEX_REFRESH_SEC
+    if stale and _refresh_lock.acquire(blocking=False):
+        try:
+            refresh_slug_index()
+        finally:
+            _refresh_lock.release()
+    return _slugs.get(slug)
+
+
+def add_slug(slug: str, page_id: int):
+    with _lock:
+        _slugs[slug] = page_id
+
+
+def slug_index_size() -> int:
+    return len(_slugs)
@@ -0,0 +1,268 @@
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.config import LINK_PAGE_CACHE_MAX, SNAPSHOT_CACHE_MAX, SNAPSHOT_REFRESH_SEC
+from app.db import get_conn, is_paid
+from app.singleflight import SingleFlight
+
+PAGE_FIELDS = (
+    "id", "slug", "version", "display_name", "bio", "avatar_path", "theme_color",
+    "featured_video_url", "offer_title", "offer_url", "updated_at",
+)
+LinkView = namedtuple("LinkView", ("id", "title", "url", "platform"))
+
+# page id -> PageSnapshot, moved to _stale when a newer page version shows
+# up; the stale copy is served only while another request reloads the page
+_snapshots = OrderedDict()
+_stale = OrderedDict()
+# link id -> page id; a link never moves to another page
+_link_pages = OrderedDict()
+_flights = SingleFlight()
+_state = {"version": -1, "checked_at": 0.0}
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+class PageSnapshot:
+    # what a public render needs from one version of a published page: its
+    # columns, active links in order and the plan flags. Built once per
+    # version and shared read-only by requests, the HTML cache and OG cards.
+    __slots__ = PAGE_FIELDS + ("links", "watermark", "stale_at")
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PageSnapshot is read-only")
+
+    def __getitem__(self, name):
+        # Row-style access, for code written against sqlite3.Row pages
+        return getattr(self, name)
+
+    def to_dict(self) -> dict:
+        d = {name: getattr(self, name) for name in PAGE_FIELDS}
+        d["links"] = [link._asdict() for link in self.links]
+        d["watermark"] = self.watermark
+        d["stale_at"] = self.stale_at
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "PageSnapshot":
+        links = tuple(LinkView(**link) for link in d["links"])
+        return cls(*(d[name] for name in PAGE_FIELDS), links, d["watermark"], d["stale_at"])
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "PageSnapshot":
+        return cls.from_dict(json.loads(blob))
+
+
+def _build(page, links, user) -> PageSnapshot:
+    paid = is_paid(user)
+    # a paid plan lapsing changes the page without a write, so the snapshot
+    # carries its own expiry
+    stale_at = datetime.fromisoformat(user["plan_expires_at"]).replace(tzinfo=timezone.utc).timestamp() if paid else None
+    return PageSnapshot(
+        *(page[name] for name in PAGE_FIELDS),
+        tuple(LinkView(l["id"], l["title"], l["url"], l["platform"]) for l in links),
+        not paid,
+        stale_at,
+    )
+
+
+def load_snapshots(conn, where: str, params) -> list:
+    pages = conn.execute(f"SELECT * FROM pages WHERE is_published=1 AND {where}", params).fetchall()
+    if not pages:
+        return []
+    marks = ",".join("?" * len(pages))
+    links = {}
+    for l in conn.execute(
+        f"SELECT id, page_id, title, url, platform FROM links WHERE page_id IN ({marks}) AND is_active=1 ORDER BY page_id, position ASC",
+        [p["id"] for p in pages],
+    ).fetchall():
+        links.setdefault(l["page_id"], []).append(l)
+    users = {
+        u["id"]: u
+        for u in conn.execute(
+            f"SELECT id, plan_type, plan_expires_at FROM users WHERE id IN ({marks})",
+            [p["user_id"] for p in pages],
+        ).fetchall()
+    }
+    return [_build(p, links.get(p["id"], ()), users.get(p["user_id"])) for p in pages]
+
+
+def load_snapshot(page_id: int) -> Optional[PageSnapshot]:
+    with get_conn() as conn:
+        found = load_snapshots(conn, "id=?", (page_id,))
+    return found[0] if found else None
+
+
+def refresh_snapshots():
+    # same delta polling as the slug index: pages whose version moved past
+    # the high-water mark since the last check drop out of the cache
+    with get_conn() as conn:
+        if _state["version"] < 0:
+            top = conn.execute("SELECT COALESCE(MAX(version), 0) v FROM pages").fetchone()["v"]
+            with _lock:
+                _snapshots.clear()
+                _stale.clear()
+                _state["version"] = top
+                _state["checked_at"] = time.monotonic()
+            return
+        rows = conn.execute("SELECT id, version FROM pages WHERE version>?", (_state["version"],)).fetchall()
+    with _lock:
+        for r in rows:
+            snap = _snapshots.get(r["id"])
+            if snap is not None and snap.version < r["version"]:
+                _retire(r["id"])
+            _state["version"] = max(_state["version"], r["version"])
+        _state["checked_at"] = time.monotonic()
+
+
+def _retire(page_id: int):
+    # caller holds _lock
+    snap = _snapshots.pop(page_id, None)
+    if snap is not None:
+        _stale[page_id] = snap
+        while len(_stale) > SNAPSHOT_CACHE_MAX:
+            _stale.popitem(last=False)
+
+
+def remember(snap: PageSnapshot):
+    with _lock:
+        current = _snapshots.get(snap.id)
+        if current is None or current.version <= snap.version:
+            _snapshots[snap.id] = snap
+            _snapshots.move_to_end(snap.id)
+            old = _stale.get(snap.id)
+            if old is not None and old.version <= snap.version:
+                del _stale[snap.id]
+        while len(_snapshots) > SNAPSHOT_CACHE_MAX:
+            _snapshots.popitem(last=False)
+
+
+def _maybe_refresh():
+    if time.monotonic() - _state["checked_at"] >= SNAPSHOT_REFRESH_SEC and _refresh_lock.acquire(blocking=False):
+        try:
+            refresh_snapshots()
+        finally:
+            _refresh_lock.release()
+
+
+def _cached(page_id: int) -> Optional[PageSnapshot]:
+    with _lock:
+        snap = _snapshots.get(page_id)
+        if snap is not None:
+            _snapshots.move_to_end(page_id)
+    if snap is not None and (snap.stale_at is None or snap.stale_at > time.time()):
+        return snap
+    return None
+
+
+def _previous(page_id: int) -> Optional[PageSnapshot]:
+    with _lock:
+        return _stale.get(page_id) or _snapshots.get(page_id)
+
+
+def _load(page_id: int) -> Optional[PageSnapshot]:
+    snap = load_snapshot(page_id)
+    if snap is None:
+        with _lock:
+            _snapshots.pop(page_id, None)
+            _stale.pop(page_id, None)
+        return None
+    remember(snap)
+    return snap
+
+
+def get_snapshot(page_id: int) -> Optional[PageSnapshot]:
+    # concurrent misses for a page share one load, so a page going viral
+    # right after an edit costs one query per version. While that load runs,
+    # requests that find the previous version get it instead of waiting.
+    _maybe_refresh()
+    snap = _cached(page_id)
+    if snap is not None:
+        return snap
+    key = ("page", page_id)
+    if _flights.running(key):
+        previous = _previous(page_id)
+        if previous is not None:
+            return previous
+    return _flights.do(key, lambda: _load(page_id))
+
+
+def _link_row(link_id: int):
+    with get_conn() as conn:
+        return conn.execute(
+            "SELECT id, page_id, title, url, platform, is_active FROM links WHERE id=?", (link_id,)
+        ).fetchone()
+
+
+def get_link(link_id: int) -> Optional[tuple]:
+    # (page id, LinkView) of an active link, or None. Links are read from
+    # their page's snapshot, so a redirect costs no query once the page is
+    # cached; links on unpublished pages still resolve from the row.
+    with _lock:
+        page_id = _link_pages.get(link_id)
+    row = None
+    if page_id is None:
+        row = _flights.do(("link", link_id), lambda: _link_row(link_id))
+        if row is None:
+            return None
+        page_id = row["page_id"]
+        with _lock:
+            _link_pages[link_id] = page_id
+            while len(_link_pages) > LINK_PAGE_CACHE_MAX:
+                _link_pages.popitem(last=False)
+    snap = get_snapshot(page_id)
+    if snap is not None:
+        for link in snap.links:
+            if link.id == link_id:
+                return page_id, link
+        return None
+    if row is None:
+        row = _flights.do(("link", link_id), lambda: _link_row(link_id))
+    if row is None or not row["is_active"]:
+        return None
+    return page_id, LinkView(row["id"], row["title"], row["url"], row["platform"])
+
+
+def get_snapshots(page_ids: dict) -> dict:
+    # slug -> page id in, slug -> snapshot out; whatever isn't cached is
+    # loaded with one slug IN (...) pass
+    _maybe_refresh()
+    found = {}
+    missing = []
+    for slug, page_id in page_ids.items():
+        snap = _cached(page_id)
+        if snap is not None:
+            found[slug] = snap
+        else:
+            missing.append(slug)
+    if missing:
+        with get_conn() as conn:
+            loaded = load_snapshots(conn, f"slug IN ({','.join('?' * len(missing))})", missing)
+        for snap in loaded:
+            remember(snap)
+            found[snap.slug] = snap
+    return found
+
+
+def evict_snapshot(page_id: int):
+    with _lock:
+        _retire(page_id)
+
+
+def snapshot_cache_size() -> int:
+    return len(_snapshots)
+
+
+def snapshot_flight_stats() -> dict:
+    return _flights.stats()
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from fastapi.staticfiles import StaticFiles
+
+from app.config import UPLOAD_DIR, UPLOAD_GC_GRACE_SEC
+from app.db import NEXT_PAGE_VERSION, get_conn, utcnow
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+PREFIX = "/uploads/"
+_HASHED = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+_SHARD = re.compile(r"^[0-9a-f]{2}$")
+# what the sweep may delete: hashed files and their crashed .tmp writes in
+# the shard directories, and avatars saved under the old names at the root
+_SWEPT_IN_SHARD = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}(\.\d+\.tmp)?$")
+_LEGACY = re.compile(r"^avatar_\d+_[^/]+\.jpg$")
+
+
+def upload_path(digest: str, ext: str) -> str:
+    # two levels of 256 directories keep each one small
+    return f"{PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def file_for(public_path: str) -> Path:
+    return Path(UPLOAD_DIR) / public_path[len(PREFIX):]
+
+
+def is_content_addressed(public_path: Optional[str]) -> bool:
+    return bool(public_path) and public_path.startswith(PREFIX) and bool(_HASHED.match(os.path.basename(public_path)))
+
+
+def store_upload(data: bytes, ext: str) -> str:
+    # named by the sha256 of the bytes: identical images share one file, and
+    # new content always gets a new URL, so a URL can be cached forever.
+    # Returns the public path; it holds no reference until a page points at it.
+    digest = hashlib.sha256(data).hexdigest()
+    public = upload_path(digest, ext.lower())
+    with get_conn() as conn:
+        # the row goes in first: a GC sweep deleting this file either
+        # finished before (the file is written again below) or sees a fresh
+        # created_at and leaves it alone
+        conn.execute(
+            "INSERT INTO uploads (path, refs, size, created_at) VALUES (?, 0, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET created_at=excluded.created_at",
+            (public, len(data), utcnow()),
+        )
+    dest = file_for(public)
+    if not dest.is_file():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, dest)
+    return public
+
+
+def move_ref(conn, old: Optional[str], new: Optional[str]):
+    # called in the transaction that repoints a page from old to new
+    if old == new:
+        return
+    if old:
+        conn.execute("UPDATE uploads SET refs=MAX(refs - 1, 0) WHERE path=?", (old,))
+    if new:
+        conn.execute("UPDATE uploads SET refs=refs + 1 WHERE path=?", (new,))
+
+
+def recount_refs() -> int:
+    # rebuilds every count from the pages table, for repair after manual edits
+    with get_conn() as conn:
+        return conn.execute(
+            "UPDATE uploads SET refs=(SELECT COUNT(*) FROM pages WHERE avatar_path=uploads.path)"
+        ).rowcount
+
+
+def adopt_legacy_uploads() -> int:
+    # moves avatars saved under the old avatar_<user>_<file>.jpg names to
+    # content-addressed ones; the old files are left for the sweep
+    with get_conn() as conn:
+        pages = conn.execute(
+            "SELECT id, avatar_path FROM pages WHERE avatar_path LIKE ? AND avatar_path NOT GLOB ?",
+            (f"{PREFIX}%", f"{PREFIX}[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*"),
+        ).fetchall()
+    moved = 0
+    for page in pages:
+        src = file_for(page["avatar_path"])
+        if not src.is_file():
+            continue
+        new = store_upload(src.read_bytes(), src.suffix or ".jpg")
+        with get_conn() as conn:
+            changed = conn.execute(
+                f"UPDATE pages SET avatar_path=?, version={NEXT_PAGE_VERSION} WHERE id=? AND avatar_path=?",
+                (new, page["id"], page["avatar_path"]),
+            ).rowcount
+            if changed:
+                move_ref(conn, None, new)
+                moved += 1
+    return moved
+
+
+def _unlink(path: Path) -> int:
+    try:
+        size = path.stat().st_size
+        path.unlink()
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _entries(path: Path, pattern, dirs: bool) -> list:
+    try:
+        with os.scandir(path) as it:
+            return [Path(e.path) for e in it if e.is_dir() == dirs and pattern.match(e.name)]
+    except FileNotFoundError:
+        return []
+
+
+def _sweepable(root: Path):
+    # only files this module could have written; anything else an operator
+    # keeps in UPLOAD_DIR (.gitkeep, notes, other tools' files) is left alone
+    yield from _entries(root, _LEGACY, False)
+    for first in _entries(root, _SHARD, True):
+        for second in _entries(first, _SHARD, True):
+            yield from _entries(second, _SWEPT_IN_SHARD, False)
+
+
+def gc_uploads(grace_sec: int = UPLOAD_GC_GRACE_SEC, now: Optional[datetime] = None) -> dict:
+    # deletes files no page refers to: rows whose count is zero, and upload
+    # files with no row at all (old names, crashed writes). Both only once older
+    # than the grace period, so an upload waiting for its page write survives.
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=grace_sec)
+    removed = 0
+    freed = 0
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        dead = [r["path"] for r in conn.execute(
+            "SELECT path FROM uploads WHERE refs=0 AND created_at<?", (cutoff.isoformat(),)
+        ).fetchall()]
+        for path in dead:
+            conn.execute("DELETE FROM uploads WHERE path=? AND refs=0", (path,))
+            freed += _unlink(file_for(path))
+            removed += 1
+        known = {r["path"] for r in conn.execute("SELECT path FROM uploads").fetchall()}
+        known.update(r["avatar_path"] for r in conn.execute(
+            "SELECT avatar_path FROM pages WHERE avatar_path LIKE ?", (f"{PREFIX}%",)
+        ).fetchall())
+    root = Path(UPLOAD_DIR)
+    for path in _sweepable(root):
+        public = PREFIX + path.relative_to(root).as_posix()
+        if public in known:
+            continue
+        try:
+            if datetime.utcfromtimestamp(path.stat().st_mtime) >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        freed += _unlink(path)
+        removed += 1
+    return {"removed": removed, "freed_bytes": freed}
+
+
+def upload_stats() -> dict:
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) files, COALESCE(SUM(size), 0) bytes, COALESCE(SUM(refs=0), 0) unreferenced FROM uploads"
+        ).fetchone()
+    return dict(row)
+
+
+class UploadFiles(StaticFiles):
+    # content-addressed files never change under their name
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if _HASHED.match(os.path.basename(str(full_path))):
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
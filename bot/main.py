@@ -1,44 +1,60 @@
 import asyncio
+from datetime import datetime, timedelta
 from pathlib import Path
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from dotenv import load_dotenv
+from aiogram.types import BufferedInputFile, Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 import os
 import re
 
 from app.config import WELCOME_TEXT, PAYMENT_METHODS_TEXT, BASE_URL, OPENAI_API_KEY, UPLOAD_DIR
-from openai import OpenAI
+from app.analytics import floor_bucket, series
+from app.charts import charts_available, render_bar_chart
+from app.analytics_db import init_analytics
+from app.profiler import install_signal_trigger
+from app.domains import DomainTaken, attach_domain, detach_domain, domain_for_page, normalize_host, txt_name, verify_domain, OWN_HOST
 from app.db import init_db, ensure_user, ensure_page, redeem_voucher_for_user, get_conn
+from app.link_health import link_warnings
 from app.security import sanitize_text, valid_http_url
+from app.uploads import store_upload
 from app.services import (
     add_link,
+    add_links,
     list_links,
     remove_link,
     reorder_link,
+    update_page,
     upsert_page_field,
-    generate_unique_slug,
+    publish_page,
     plan_limits,
     stats_for_user,
 )
 
-load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 UPLOAD_DIR = Path(UPLOAD_DIR)
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-bot = Bot(token=TOKEN)
 dp = Dispatcher()
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+_openai_client = None
+
+
+def get_openai_client():
+    # the openai SDK is slow to import, so it is only loaded once a prompt needs it
+    global _openai_client
+    if _openai_client is None and OPENAI_API_KEY:
+        from openai import OpenAI
+
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
 
 
 async def llm_text(prompt: str, fallback: str) -> str:
-    if not openai_client:
+    client = get_openai_client()
+    if not client:
         return fallback
     try:
-        resp = openai_client.chat.completions.create(
+        resp = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.8,
@@ -125,7 +141,7 @@ async def start(m: Message):
 @dp.message(Command("help"))
 async def help_cmd(m: Message):
     await m.answer(
-        "الأوامر: /create /edit /links /publish /stats /plan /redeem CODE /post /bio /lang",
+        "الأوامر: /create /edit /links /publish /stats /plan /redeem CODE /domain /post /bio /lang",
         reply_markup=main_menu_kb(),
     )
 
@@ -168,28 +184,36 @@ async def menu_to_edit(m: Message):
 @dp.message(Command("create"))
 async def create_start(m: Message, state: FSMContext):
     me(m)
+    await state.set_data({})
     await state.set_state(CreateWizard.name)
     await m.answer("ممتاز 👌 خلينا نبدأ بسرعة.\nاكتب اسم العرض (مثال: متجر سامر):", reply_markup=ReplyKeyboardRemove())
 
 
 @dp.message(CreateWizard.name)
 async def create_name(m: Message, state: FSMContext):
-    user, page = me(m)
-    upsert_page_field(page["id"], "display_name", sanitize_text(m.text or "", 60))
+    # name, bio and avatar are kept in the wizard state and saved together
+    # once the avatar step is done
+    await state.update_data(display_name=sanitize_text(m.text or "", 60))
     await state.set_state(CreateWizard.bio)
     await m.answer("اكتب نبذة قصيرة (سطر واحد يكفي):")
 
 
 @dp.message(CreateWizard.bio)
 async def create_bio(m: Message, state: FSMContext):
-    user, page = me(m)
-    upsert_page_field(page["id"], "bio", sanitize_text(m.text or "", 200))
+    await state.update_data(bio=sanitize_text(m.text or "", 200))
     await state.set_state(CreateWizard.avatar)
     await m.answer("إذا بدك صورة بعتلي صورة هلأ، أو اختار تخطي 👇", reply_markup=quick_choice_kb(["تخطي"]))
 
 
+async def save_profile(state: FSMContext, page_id: int, **fields):
+    data = await state.get_data()
+    update_page(page_id, **{k: data[k] for k in ("display_name", "bio") if k in data}, **fields)
+
+
 @dp.message(CreateWizard.avatar, Command("skip"))
 async def create_avatar_skip(m: Message, state: FSMContext):
+    user, page = me(m)
+    await save_profile(state, page["id"])
     await state.set_state(CreateWizard.links)
     await m.answer("ابعث روابطك بسهولة 👇\n- فيك تبعت الرابط لحاله (مثال: https://instagram.com/username)\n- أو: العنوان | الرابط\nلما تخلص اكتب: تم", reply_markup=quick_choice_kb(["تم"]))
 
@@ -206,10 +230,10 @@ async def create_avatar_skip_text(m: Message, state: FSMContext):
 async def create_avatar_photo(m: Message, state: FSMContext):
     user, page = me(m)
     photo = m.photo[-1]
-    file = await bot.get_file(photo.file_id)
-    path = UPLOAD_DIR / f"avatar_{user['id']}_{photo.file_id[-8:]}.jpg"
-    await bot.download_file(file.file_path, destination=path)
-    upsert_page_field(page["id"], "avatar_path", f"/uploads/{path.name}")
+    file = await m.bot.get_file(photo.file_id)
+    data = await m.bot.download_file(file.file_path)
+    avatar = await asyncio.to_thread(store_upload, data.getvalue(), ".jpg")
+    await save_profile(state, page["id"], avatar_path=avatar)
     await state.set_state(CreateWizard.links)
     await m.answer("تم حفظ الصورة ✅\nالآن ابعث روابطك (رابط فقط أو العنوان | الرابط)\nولما تخلص اكتب: تم", reply_markup=quick_choice_kb(["تم"]))
 
@@ -240,9 +264,9 @@ async def create_links_add(m: Message, state: FSMContext):
         await m.answer("ابعث رابط واحد أو أكثر، وكل رابط بسطر")
         return
 
-    added = 0
+    items = []
     for line in lines:
-        if added + len(links) >= limits["max_links"]:
+        if len(items) + len(links) >= limits["max_links"]:
             break
         if "|" in line:
             title, url = [x.strip() for x in line.split("|", 1)]
@@ -252,12 +276,10 @@ async def create_links_add(m: Message, state: FSMContext):
 
         if not valid_http_url(url):
             continue
-        try:
-            add_link(page["id"], title, url)
-            added += 1
-        except ValueError:
-            continue
+        items.append((title, url, "custom"))
 
+    # one transaction for the whole paste
+    added = add_links(page["id"], items)
     if added == 0:
         await m.answer("ما قدرت أضيف روابط من الرسالة. تأكد كل رابط يبدأ بـ http:// أو https://")
         return
@@ -292,8 +314,7 @@ async def create_offer_set(m: Message, state: FSMContext):
     if not valid_http_url(url):
         await m.answer("رابط العرض غير صالح")
         return
-    upsert_page_field(page["id"], "offer_title", sanitize_text(title, 80))
-    upsert_page_field(page["id"], "offer_url", url)
+    update_page(page["id"], offer_title=sanitize_text(title, 80), offer_url=url)
     await state.clear()
     await m.answer("تم حفظ العرض ✅\nالآن اضغط 📤 نشر", reply_markup=main_menu_kb())
 
@@ -304,9 +325,7 @@ async def publish_cmd(m: Message):
     if not page["display_name"]:
         await m.answer("أكمل البيانات أولاً عبر /create")
         return
-    slug = page["slug"] or generate_unique_slug(page["display_name"])
-    with get_conn() as conn:
-        conn.execute("UPDATE pages SET slug=?, is_published=1, updated_at=datetime('now') WHERE id=?", (slug, page["id"]))
+    slug = publish_page(page["id"])
     await m.answer(f"تم النشر ✅\n{BASE_URL}/u/{slug}", reply_markup=main_menu_kb())
 
 
@@ -314,11 +333,17 @@ async def publish_cmd(m: Message):
 async def links_cmd(m: Message, state: FSMContext):
     user, page = me(m)
     links = list_links(page["id"])
+    warnings = link_warnings(page["id"])
     text = "روابطك الحالية:\n"
     if not links:
         text += "(لا يوجد)\n"
     for i, l in enumerate(links, start=1):
-        text += f"{i}) {l['title']} -> {l['url']}\n"
+        mark = " ⚠️ لا يعمل" if l["url"] in warnings else ""
+        text += f"{i}) {l['title']} -> {l['url']}{mark}\n"
+    if page["offer_url"] in warnings:
+        text += f"⚠️ رابط العرض لا يعمل: {page['offer_url']}\n"
+    if warnings:
+        text += "الروابط المعلّمة ⚠️ لم تفتح عند آخر فحص، تأكد منها أو احذفها\n"
     text += "\nللإضافة السريعة: ابعث رابط مباشرة\nأو add العنوان | الرابط\nللحذف: remove رقم\nللترتيب (مدفوع): move من إلى\nللخروج: تم"
     await state.set_state(LinksWizard.menu)
     await m.answer(text, reply_markup=quick_choice_kb(["تم"]))
@@ -478,11 +503,64 @@ async def set_offer(m: Message, command: CommandObject):
     if not valid_http_url(u):
         await m.answer("رابط العرض غير صالح")
         return
-    upsert_page_field(page["id"], "offer_title", sanitize_text(t, 80))
-    upsert_page_field(page["id"], "offer_url", u)
+    update_page(page["id"], offer_title=sanitize_text(t, 80), offer_url=u)
     await m.answer("تم تحديث عرض اليوم")
 
 
+def domain_instructions(row) -> str:
+    return (
+        f"الدومين: {row['host']}\n"
+        f"1) من إعدادات الـ DNS أضف سجل CNAME للدومين يشير إلى {OWN_HOST}\n"
+        f"2) وأضف سجل TXT باسم {txt_name(row['host'])} وقيمته:\n{row['token']}\n"
+        "3) بعد ما تتفعّل السجلات اكتب: /domain verify"
+    )
+
+
+@dp.message(Command("domain"))
+async def domain_cmd(m: Message, command: CommandObject):
+    user, page = me(m)
+    arg = (command.args or "").strip()
+    row = domain_for_page(page["id"])
+    if not arg:
+        if not row:
+            await m.answer("اربط صفحتك بدومين خاص فيك (للباقات المدفوعة):\n/domain example.com\nللحذف: /domain remove")
+        elif row["verified_at"]:
+            await m.answer(f"صفحتك تعمل على: http://{row['host']} ✅\nللحذف: /domain remove")
+        else:
+            await m.answer(domain_instructions(row))
+        return
+    if arg.lower() == "remove":
+        host = detach_domain(page["id"])
+        await m.answer(f"تم فصل الدومين {host} ✅" if host else "ما في دومين مربوط")
+        return
+    if arg.lower() == "verify":
+        if not row:
+            await m.answer("اربط دومين أولاً: /domain example.com")
+            return
+        ok, error = await verify_domain(page["id"])
+        if ok:
+            await m.answer(f"تم التحقق ✅ صفحتك صارت على: http://{row['host']}")
+        else:
+            await m.answer(f"ما قدرنا نتحقق من {row['host']} ({error}). تأكد من سجل الـ DNS وجرب بعد شوي.")
+        return
+    if not plan_limits(user)["custom_domain"]:
+        await m.answer("الدومين الخاص متاح في الباقات المدفوعة فقط.")
+        return
+    if not page["slug"] or not page["is_published"]:
+        await m.answer("انشر صفحتك أولاً عبر /publish")
+        return
+    host = normalize_host(arg)
+    if not host:
+        await m.answer("الدومين غير صالح. مثال: /domain shop.example.com")
+        return
+    try:
+        row = attach_domain(page["id"], host)
+    except DomainTaken:
+        await m.answer("هذا الدومين مربوط بصفحة أخرى.")
+        return
+    await m.answer(domain_instructions(row))
+
+
 @dp.message(Command("redeem"))
 async def redeem_cmd(m: Message, command: CommandObject):
     user, page = me(m)
@@ -507,6 +585,13 @@ async def plan_cmd(m: Message):
     )
 
 
+def country_label(code: str) -> str:
+    if not code:
+        return "🌐 غير معروف"
+    # regional indicator pair renders as the flag
+    return "".join(chr(0x1F1E6 + ord(ch) - ord("A")) for ch in code) + f" {code}"
+
+
 @dp.message(Command("stats"))
 async def stats_cmd(m: Message):
     user, page = me(m)
@@ -516,11 +601,26 @@ async def stats_cmd(m: Message):
         f"إجمالي النقرات: {s['clicks_total']}",
         f"مشاهدات آخر 7 أيام: {s['views_7d']}",
         f"نقرات آخر 7 أيام: {s['clicks_7d']}",
+        f"زوار فريدون آخر 7 أيام (تقريبي): {s['uniques_7d']}",
         "Top 5 روابط:",
     ]
     for t in s["top_links"]:
         lines.append(f"- {t['title']} ({t['c']})")
+    if s["countries_7d"]:
+        lines.append("أكثر الدول زيارةً آخر 7 أيام:")
+        for c in s["countries_7d"]:
+            lines.append(f"- {country_label(c['country'])} ({c['c']})")
+    if s["as_of"]:
+        lines.append(f"البيانات حتى: {s['as_of'][:16].replace('T', ' ')} UTC")
     await m.answer("\n".join(lines))
+    if not charts_available():
+        return
+    end = datetime.utcnow()
+    points = series(page["id"], "views", floor_bucket(end - timedelta(days=29), "day"), end, "day")
+    if not any(p["count"] for p in points):
+        return
+    png = await asyncio.to_thread(render_bar_chart, points, "Views / day (30d)", page["theme_color"] or "#0f172a")
+    await m.answer_photo(BufferedInputFile(png, filename="stats.png"))
 
 
 @dp.message(Command("post"))
@@ -571,6 +671,10 @@ async def main():
     if not TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN is missing")
     init_db()
+    init_analytics()
+    install_signal_trigger("bot")
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    bot = Bot(token=TOKEN)
     await dp.start_polling(bot)
 
 
@@ -0,0 +1,23 @@
+import argparse
+from datetime import datetime
+
+from app.analytics_db import backup_analytics
+from app.db import backup_database
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Consistent online copy of the SQLite database and the analytics files")
+    parser.add_argument("--out", default=f"linkat-backup-{datetime.utcnow():%Y%m%d-%H%M%S}.db")
+    parser.add_argument("--analytics-out", default=None, help="directory, default <out>.analytics")
+    parser.add_argument("--skip-analytics", action="store_true")
+    args = parser.parse_args()
+    backup_database(args.out)
+    print(f"Backup written: {args.out}")
+    if not args.skip_analytics:
+        dest = args.analytics_out or f"{args.out}.analytics"
+        backup_analytics(dest)
+        print(f"Analytics backup written: {dest}")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import secrets
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from aiohttp import web
+
+TOKEN = "123456:BENCH-TOKEN"
+# simulated users get Telegram ids above this, seeded ones above twice it
+USER_ID_BASE = 9_000_000_000
+
+
+class FakeBotAPI:
+    # answers every Bot API method the handlers call with a plausible result,
+    # so aiogram's HTTP session, serialization and response parsing all run
+    def __init__(self):
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    def _message(self, form) -> dict:
+        msg = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(form.get("chat_id", 0)), "type": "private"},
+        }
+        if "text" in form:
+            msg["text"] = form["text"]
+        if "photo" in form:
+            msg["photo"] = [{"file_id": "bench", "file_unique_id": "bench", "width": 1, "height": 1}]
+        return msg
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        form = await request.post()
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method.startswith("send"):
+            result = self._message(form)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+class Pacer:
+    # spaces update starts 1/rate apart across all users; rate 0 = unpaced
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        at = max(self.next_at, now)
+        self.next_at = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+def user_script(i: int, code: str) -> list:
+    # one creator's session: the full /create wizard with a bulk link paste,
+    # publish, then stats and a voucher (paid users redeem first, so their
+    # paste is not cut at the free plan's link limit)
+    links = "\n".join([f"https://example.com/u{i}/{k}" for k in range(4)] + [f"Shop | https://shop.example.com/u{i}"])
+    script = ["/start", "/create", f"Bench Creator {i}", "نبذة قصيرة للتجربة", "تخطي", links, "تم",
+              f"عرض اليوم | https://example.com/u{i}/offer", "/publish", "/stats", "/plan"]
+    if code:
+        script.insert(1, f"/redeem {code}")
+    else:
+        script.append("/redeem NOSUCHCODE")
+    return script
+
+
+def percentile(values: list, q: float) -> float:
+    # values sorted ascending; nearest-rank
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def seed_db(n: int):
+    # grows the DB by n published pages of 3 links each before the run
+    from app.db import get_conn, utcnow
+
+    now = utcnow()
+    tag = secrets.token_hex(3)
+    with get_conn() as conn:
+        start = conn.execute("SELECT COALESCE(MAX(id), 0) m FROM users").fetchone()["m"]
+        base = USER_ID_BASE * 2 + start
+        conn.executemany(
+            "INSERT INTO users (tg_user_id, username, created_at) VALUES (?, ?, ?)",
+            [(base + k, f"seed{k}", now) for k in range(n)],
+        )
+        conn.execute(
+            "INSERT INTO pages (user_id, slug, display_name, is_published, created_at, updated_at) "
+            "SELECT id, ? || '-' || id, username, 1, ?, ? FROM users WHERE tg_user_id>=?",
+            (f"seed-{tag}", now, now, base),
+        )
+        conn.execute(
+            "INSERT INTO links (page_id, title, url, platform, position, created_at) "
+            "SELECT p.id, 'Link ' || k.n, 'https://example.com/' || p.id || '/' || k.n, 'website', k.n, ? "
+            "FROM pages p JOIN users u ON u.id=p.user_id JOIN (SELECT 1 n UNION ALL SELECT 2 UNION ALL SELECT 3) k "
+            "WHERE u.tg_user_id>=?",
+            (now, base),
+        )
+
+
+def first_free_id() -> int:
+    from app.db import get_conn
+
+    with get_conn() as conn:
+        top = conn.execute(
+            "SELECT MAX(tg_user_id) m FROM users WHERE tg_user_id>? AND tg_user_id<?", (USER_ID_BASE, USER_ID_BASE * 2)
+        ).fetchone()["m"]
+    return (top or USER_ID_BASE) + 1
+
+
+def make_vouchers(n: int) -> list:
+    from app.db import get_conn, utcnow
+
+    tag = secrets.token_hex(3).upper()
+    codes = [f"BENCH{tag}{k:06d}" for k in range(n)]
+    with get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO vouchers (code, plan_type, duration_days, created_at) VALUES (?, 'PRO_1', 30, ?)",
+            [(c, utcnow()) for c in codes],
+        )
+    return codes
+
+
+async def drive(users: int = 200, concurrency: int = 50, rate: float = 0, paid_share: float = 0.5) -> dict:
+    # feeds every simulated user's script through the bot's Dispatcher, one
+    # update at a time per user and `concurrency` users at once
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Chat, Message, Update, User
+
+    from app.querylog import counting_queries
+    from bot.main import dp
+
+    api = FakeBotAPI()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(await api.start())))
+
+    async def name_handler(handler, event, data):
+        slot = data.get("bench_slot")
+        if slot is not None:
+            slot["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
+
+    dp.message.middleware(name_handler)
+    paid = int(users * paid_share)
+    codes = make_vouchers(paid)
+    first_id = first_free_id()
+    update_ids = itertools.count(1)
+    latencies = defaultdict(list)
+    queries = defaultdict(int)
+    errors = Counter()
+    pacer = Pacer(rate)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def simulate(i: int):
+        uid = first_id + i
+        who = User(id=uid, is_bot=False, first_name=f"Bench {i}", username=f"bench{uid}")
+        chat = Chat(id=uid, type="private")
+        async with gate:
+            for text in user_script(i, codes[i] if i < paid else ""):
+                await pacer.wait()
+                n = next(update_ids)
+                update = Update(
+                    update_id=n,
+                    message=Message(message_id=n, date=datetime.now(), chat=chat, from_user=who, text=text),
+                )
+                slot = {}
+                with counting_queries() as tally:
+                    start = time.perf_counter()
+                    try:
+                        await dp.feed_update(bot, update, bench_slot=slot)
+                    except Exception as e:
+                        errors[type(e).__name__] += 1
+                    ms = (time.perf_counter() - start) * 1000
+                name = slot.get("handler", "(unhandled)")
+                latencies[name].append(ms)
+                queries[name] += tally[0]
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(simulate(i) for i in range(users)))
+    finally:
+        elapsed = time.perf_counter() - started
+        dp.message.middleware.unregister(name_handler)
+        await bot.session.close()
+        await api.stop()
+
+    total = sum(len(v) for v in latencies.values())
+    handlers = {}
+    for name, values in sorted(latencies.items(), key=lambda x: -sum(x[1])):
+        values.sort()
+        handlers[name] = {
+            "n": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2),
+            "queries_per_update": round(queries[name] / len(values), 1),
+        }
+    return {
+        "users": users,
+        "updates": total,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(total / elapsed, 1) if elapsed else 0.0,
+        "target_rate": rate,
+        "queries_per_update": round(sum(queries.values()) / total, 1) if total else 0.0,
+        "bot_api_calls": dict(api.calls),
+        "errors": dict(errors),
+        "handlers": handlers,
+    }
+
+
+def print_report(report: dict, pages: int):
+    rate = f"{report['target_rate']:g}/s" if report["target_rate"] else "unpaced"
+    print(f"== bot: {report['updates']} updates from {report['users']} users in {report['seconds']:.2f} s ({rate})")
+    print(f"throughput: {report['updates_per_sec']:.0f} updates/s, {report['queries_per_update']} queries/update, {pages} pages in DB")
+    print("bot api: " + ", ".join(f"{m} {n}" for m, n in sorted(report["bot_api_calls"].items())))
+    if report["errors"]:
+        print("errors: " + ", ".join(f"{e} {n}" for e, n in report["errors"].items()))
+    print(f"  {'handler':<26}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'q/upd':>7}")
+    for name, h in report["handlers"].items():
+        print(f"  {name:<26}{h['n']:>7}{h['p50_ms']:>9.2f}{h['p95_ms']:>9.2f}{h['p99_ms']:>9.2f}{h['max_ms']:>9.2f}{h['queries_per_update']:>7}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Throughput of the bot's handlers against a local fake Bot API")
+    parser.add_argument("--users", type=int, default=1000, help="simulated creators, one wizard session each")
+    parser.add_argument("--concurrency", type=int, default=100, help="users mid-session at once")
+    parser.add_argument("--rate", type=float, default=0, help="updates/s to feed; 0 = as fast as handled")
+    parser.add_argument("--paid-share", type=float, default=0.5, help="fraction of users redeeming a voucher")
+    parser.add_argument("--seed", type=int, default=0, help="published pages to add to the DB before the run")
+    parser.add_argument("--db", help="run against (and write to) this DB file instead of a scratch one")
+    parser.add_argument("--json", help="also write the report here")
+    parser.add_argument("--min-rate", type=float, default=0, help="exit 1 below this many updates/s")
+    args = parser.parse_args()
+
+    # a scratch data dir unless told otherwise: the run creates users,
+    # pages and vouchers. Set before app.config is first imported.
+    if args.db:
+        os.environ["DB_PATH"] = args.db
+    else:
+        scratch = tempfile.mkdtemp(prefix="linkat-bench-")
+        os.environ["DB_PATH"] = os.path.join(scratch, "linkat.db")
+        os.environ["ANALYTICS_DIR"] = os.path.join(scratch, "analytics")
+
+    from app.analytics_db import init_analytics
+    from app.db import get_conn, init_db
+
+    init_db()
+    init_analytics()
+    if args.seed:
+        seed_db(args.seed)
+    report = asyncio.run(drive(args.users, args.concurrency, args.rate, args.paid_share))
+    with get_conn() as conn:
+        pages = conn.execute("SELECT COUNT(*) c FROM pages").fetchone()["c"]
+    report["pages_in_db"] = pages
+    print_report(report, pages)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if report["errors"] or (args.min_rate and report["updates_per_sec"] < args.min_rate):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
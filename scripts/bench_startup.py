@@ -0,0 +1,63 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+TARGETS = ("app.main", "bot.main")
+
+
+def import_wall_time(module: str, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, env=env, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def import_profile(module: str, env: dict) -> list:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [x.strip() for x in line[len("import time:"):].split("|")]
+        rows.append((int(self_us), int(cumulative_us), name))
+    return rows
+
+
+def digest(rows: list, top: int) -> list:
+    # self time rolled up to the top-level package, which is what an
+    # import can actually be deferred at
+    by_package = defaultdict(int)
+    for self_us, _, name in rows:
+        by_package[name.strip().split(".")[0]] += self_us
+    return sorted(by_package.items(), key=lambda x: -x[1])[:top]
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Cold-start import time of the web and bot processes")
+    parser.add_argument("modules", nargs="*", default=list(TARGETS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12)
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "0"}
+    for module in args.modules:
+        import_wall_time(module, env)  # warm the bytecode and OS file caches
+        times = [import_wall_time(module, env) for _ in range(args.runs)]
+        rows = import_profile(module, env)
+        print(f"== {module}")
+        print(f"wall: median {statistics.median(times) * 1000:.0f} ms, min {min(times) * 1000:.0f} ms over {args.runs} runs")
+        print(f"imports: {len(rows)} modules, {sum(r[0] for r in rows) / 1000:.0f} ms self time")
+        for package, self_us in digest(rows, args.top):
+            print(f"  {self_us / 1000:8.1f} ms  {package}")
+
+
+if __name__ == '__main__':
+    run()
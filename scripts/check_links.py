@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import time
+
+from app.db import init_db
+from app.link_checker import sweep
+
+
+async def main(once: bool, idle_sec: int):
+    while True:
+        started = time.monotonic()
+        counts = await sweep()
+        if counts:
+            rate = counts["checked"] / max(time.monotonic() - started, 0.001)
+            print(f"Checked {counts['checked']} urls ({rate:.0f}/s): {counts}", flush=True)
+        if once:
+            return
+        await asyncio.sleep(idle_sec)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Check active links and offer urls, on a loop")
+    parser.add_argument("--once", action="store_true", help="one sweep over what is due, then exit")
+    parser.add_argument("--idle-sec", type=int, default=60)
+    args = parser.parse_args()
+    init_db()
+    asyncio.run(main(args.once, args.idle_sec))
+
+
+if __name__ == '__main__':
+    run()
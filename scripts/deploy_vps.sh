@@ -16,6 +16,8 @@ sudo git pull origin main
 
 sudo python3 -m venv .venv
 sudo .venv/bin/pip install -r requirements.txt
+sudo .venv/bin/python -m scripts.precompile_templates
+sudo .venv/bin/python -m scripts.precompress_static
 
 sudo mkdir -p /var/www/linkat/uploads
 sudo chown -R root:root /var/www/linkat
@@ -34,7 +36,9 @@ After=network.target
 User=root
 WorkingDirectory=$APP_DIR
 EnvironmentFile=$APP_DIR/.env
-ExecStart=$APP_DIR/.venv/bin/uvicorn app.main:app --host 127.0.0.1 --port $PORT
+ExecStart=$APP_DIR/.venv/bin/python -m scripts.serve --host 127.0.0.1 --port $PORT
+KillSignal=SIGTERM
+TimeoutStopSec=45
 Restart=always
 RestartSec=3
 
@@ -59,6 +63,71 @@ RestartSec=3
 WantedBy=multi-user.target
 EOF
 
+sudo tee /etc/systemd/system/linkat-linkcheck.service > /dev/null <<EOF
+[Unit]
+Description=Linkat link health checker
+After=network.target
+
+[Service]
+User=root
+WorkingDirectory=$APP_DIR
+EnvironmentFile=$APP_DIR/.env
+ExecStart=$APP_DIR/.venv/bin/python -m scripts.check_links
+Restart=always
+RestartSec=30
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo tee /etc/systemd/system/linkat-analytics-rotate.service > /dev/null <<EOF
+[Unit]
+Description=Linkat analytics partition close and retention
+
+[Service]
+Type=oneshot
+User=root
+WorkingDirectory=$APP_DIR
+EnvironmentFile=$APP_DIR/.env
+ExecStart=$APP_DIR/.venv/bin/python -m scripts.rotate_analytics
+EOF
+
+sudo tee /etc/systemd/system/linkat-analytics-rotate.timer > /dev/null <<EOF
+[Unit]
+Description=Daily Linkat analytics rotation
+
+[Timer]
+OnCalendar=*-*-* 03:30:00
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+EOF
+
+sudo tee /etc/systemd/system/linkat-uploads-gc.service > /dev/null <<EOF
+[Unit]
+Description=Linkat unreferenced upload cleanup
+
+[Service]
+Type=oneshot
+User=root
+WorkingDirectory=$APP_DIR
+EnvironmentFile=$APP_DIR/.env
+ExecStart=$APP_DIR/.venv/bin/python -m scripts.gc_uploads
+EOF
+
+sudo tee /etc/systemd/system/linkat-uploads-gc.timer > /dev/null <<EOF
+[Unit]
+Description=Daily Linkat upload cleanup
+
+[Timer]
+OnCalendar=*-*-* 04:00:00
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+EOF
+
 sudo tee /etc/nginx/sites-available/$DOMAIN > /dev/null <<EOF
 server {
     listen 80;
@@ -66,9 +135,15 @@ server {
 
     location /static/ {
         alias $APP_DIR/static/;
+        gzip_static on;
         expires 7d;
     }
 
+    location ~ "^/uploads/([0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+)\$" {
+        alias /var/www/linkat/uploads/\$1;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
     location /uploads/ {
         alias /var/www/linkat/uploads/;
         expires 7d;
@@ -82,6 +157,21 @@ server {
         proxy_set_header X-Forwarded-Proto \$scheme;
     }
 }
+
+# creators' custom domains: any other host goes to the app, which routes
+# verified ones to their page
+server {
+    listen 80 default_server;
+    server_name _;
+
+    location / {
+        proxy_pass http://127.0.0.1:$PORT;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
+    }
+}
 EOF
 
 sudo ln -sf /etc/nginx/sites-available/$DOMAIN /etc/nginx/sites-enabled/$DOMAIN
@@ -91,6 +181,9 @@ fi
 
 sudo systemctl daemon-reload
 sudo systemctl enable --now linkat-web
+sudo systemctl enable --now linkat-linkcheck
+sudo systemctl enable --now linkat-analytics-rotate.timer
+sudo systemctl enable --now linkat-uploads-gc.timer
 sudo nginx -t
 sudo systemctl reload nginx
 
@@ -0,0 +1,27 @@
+import argparse
+import sys
+
+from app.export import EXPORT_FORMATS, export_high_water, iter_export
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Stream analytics events since a cursor id")
+    parser.add_argument("--since-id", type=int, default=0)
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--out", default="-")
+    args = parser.parse_args()
+
+    high_water = export_high_water()
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    try:
+        for chunk in iter_export(args.format, args.since_id, until_id=high_water, limit=args.limit):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"high water id: {high_water}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    run()
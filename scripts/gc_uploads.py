@@ -0,0 +1,22 @@
+import argparse
+
+from app.config import UPLOAD_GC_GRACE_SEC
+from app.db import init_db
+from app.uploads import adopt_legacy_uploads, gc_uploads, recount_refs
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Delete uploaded files no page refers to")
+    parser.add_argument("--grace-sec", type=int, default=UPLOAD_GC_GRACE_SEC, help="keep anything younger than this")
+    parser.add_argument("--recount", action="store_true", help="rebuild reference counts from the pages table first")
+    args = parser.parse_args()
+    init_db()
+    adopted = adopt_legacy_uploads()
+    if args.recount:
+        recount_refs()
+    result = gc_uploads(args.grace_sec)
+    print(f"adopted: {adopted}; removed: {result['removed']} files, {result['freed_bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    run()
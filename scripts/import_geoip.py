@@ -0,0 +1,28 @@
+import argparse
+import csv
+import gzip
+
+from app.config import GEOIP_DB_PATH
+from app.geoip import build_ranges, write_table
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Build the IP-to-country range table from a CSV range file")
+    parser.add_argument("csv", nargs="+", help="start,end,CC[,...] or network/prefix,CC[,...] rows; .gz is fine")
+    parser.add_argument("--out", default=GEOIP_DB_PATH)
+    args = parser.parse_args()
+
+    def rows():
+        for path in args.csv:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", newline="", encoding="utf-8") as f:
+                yield from csv.reader(f)
+
+    v4, v6, skipped = build_ranges(rows())
+    write_table(args.out, v4, v6)
+    # running workers pick the new file up within GEOIP_RECHECK_SEC
+    print(f"{args.out}: {len(v4)} IPv4 and {len(v6)} IPv6 ranges, {skipped} rows skipped")
+
+
+if __name__ == '__main__':
+    run()
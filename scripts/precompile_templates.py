@@ -0,0 +1,10 @@
+from app.render import precompile_templates
+
+
+def run():
+    n = precompile_templates()
+    print(f"Precompiled {n} templates")
+
+
+if __name__ == '__main__':
+    run()
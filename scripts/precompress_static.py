@@ -0,0 +1,30 @@
+import gzip
+from pathlib import Path
+
+from app.compression import brotli
+
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+EXTENSIONS = {".css", ".js", ".svg", ".html", ".txt", ".json"}
+
+
+def write_if_stale(src: Path, dst: Path, data: bytes) -> bool:
+    if dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime:
+        return False
+    dst.write_bytes(data)
+    return True
+
+
+def run():
+    written = 0
+    for src in STATIC_DIR.rglob("*"):
+        if not src.is_file() or src.suffix not in EXTENSIONS:
+            continue
+        raw = src.read_bytes()
+        written += write_if_stale(src, src.with_name(src.name + ".gz"), gzip.compress(raw, compresslevel=9, mtime=0))
+        if brotli is not None:
+            written += write_if_stale(src, src.with_name(src.name + ".br"), brotli.compress(raw, quality=11))
+    print(f"Precompressed static files: {written} written")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,11 @@
+from app.analytics_db import report_paths
+from app.replica import refresh_snapshot, report_dir
+
+
+def run():
+    refresh_snapshot(report_paths())
+    print(f"Reporting snapshot refreshed: {report_dir()}")
+
+
+if __name__ == '__main__':
+    run()
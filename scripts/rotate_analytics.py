@@ -0,0 +1,17 @@
+import argparse
+
+from app.analytics_db import close_partitions, drop_partitions
+from app.config import ANALYTICS_RETENTION_MONTHS
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Close finished analytics months and drop the ones past retention")
+    parser.add_argument("--retention-months", type=int, default=ANALYTICS_RETENTION_MONTHS, help="0 keeps everything")
+    args = parser.parse_args()
+    closed = close_partitions()
+    dropped = drop_partitions(args.retention_months)
+    print(f"closed: {', '.join(closed) or '-'}; dropped: {', '.join(dropped) or '-'}")
+
+
+if __name__ == '__main__':
+    run()
@@ -11,6 +11,8 @@ def run():
             (u['id'], 'demo-linkat', 'Demo Linkat', 'صفحة تجريبية من Linkat', utcnow(), utcnow())
         )
         p = conn.execute("SELECT * FROM pages WHERE user_id=?", (u['id'],)).fetchone()
+        if not conn.execute("SELECT 1 FROM slug_log WHERE slug=?", (p['slug'],)).fetchone():
+            conn.execute("INSERT INTO slug_log (slug, page_id, created_at) VALUES (?,?,?)", (p['slug'], p['id'], utcnow()))
         existing = conn.execute("SELECT COUNT(*) c FROM links WHERE page_id=?", (p['id'],)).fetchone()['c']
         if existing == 0:
             conn.execute(
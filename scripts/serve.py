@@ -0,0 +1,116 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+from app.config import WEB_GRACEFUL_TIMEOUT, WEB_HOST, WEB_PORT, WEB_WORKERS
+from app.main import app, warm_up
+
+log = logging.getLogger("uvicorn.error")
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+
+def serve_worker(config: uvicorn.Config, sock: socket.socket):
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    # uvicorn's own handlers take over: SIGTERM stops accepting, waits up to
+    # timeout_graceful_shutdown for open requests, then runs the shutdown hook
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(config: uvicorn.Config, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            serve_worker(config, sock)
+        except BaseException:
+            log.exception("Worker crashed")
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
+    log.info("Started worker [%d]", pid)
+    return pid
+
+
+def stop_workers(workers: dict, timeout: float):
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + timeout
+    while workers and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in workers:
+        log.warning("Worker [%d] did not drain in time, killing it", pid)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Production web server: preloaded app, forked uvicorn workers")
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--graceful-timeout", type=int, default=WEB_GRACEFUL_TIMEOUT)
+    args = parser.parse_args()
+
+    config = uvicorn.Config(app, timeout_graceful_shutdown=args.graceful_timeout)
+    # schema, templates, slug index and marketing pages are built once here
+    # and inherited by every worker; so are the shared rate-limit and dedup
+    # tables, which is what makes them shared
+    warm_up()
+    app.state.preloaded = True
+    sock = bind(args.host, args.port)
+    log.info("Listening on http://%s:%d with %d workers [%d]", args.host, args.port, args.workers, os.getpid())
+    # move everything loaded so far out of the collector's reach, so workers
+    # don't copy the preloaded pages just by running a gc pass over them
+    gc.freeze()
+
+    stopping = []
+
+    def handle_exit(sig, frame):
+        stopping.append(sig)
+
+    signal.signal(signal.SIGTERM, handle_exit)
+    signal.signal(signal.SIGINT, handle_exit)
+
+    workers = {}
+    for _ in range(args.workers):
+        workers[spawn(config, sock)] = time.monotonic()
+    while not stopping:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if not pid:
+            time.sleep(0.2)
+            continue
+        started = workers.pop(pid, time.monotonic())
+        log.warning("Worker [%d] exited with %d, restarting", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < 1:
+            time.sleep(1)  # don't fork in a tight loop if workers die on startup
+        workers[spawn(config, sock)] = time.monotonic()
+
+    log.info("Draining %d workers", len(workers))
+    stop_workers(workers, args.graceful_timeout + 5)
+    sock.close()
+
+
+if __name__ == "__main__":
+    run()
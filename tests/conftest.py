@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_tmp = tempfile.mkdtemp(prefix="linkat-test-")
+os.environ.setdefault("DB_PATH", os.path.join(_tmp, "linkat.db"))
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+os.environ.setdefault("TEMPLATE_CACHE_DIR", os.path.join(_tmp, "template_cache"))
+os.environ.setdefault("OG_CACHE_DIR", os.path.join(_tmp, "og_cache"))
+os.environ.setdefault("ANALYTICS_DIR", os.path.join(_tmp, "analytics"))
+os.environ.setdefault("GEOIP_DB_PATH", os.path.join(_tmp, "geoip.bin"))
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from app.analytics_db import init_analytics  # noqa: E402
+from app.db import init_db  # noqa: E402
+
+init_db()
+init_analytics()
+
+from collections import namedtuple  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+
+import pytest  # noqa: E402
+
+from app.db import ensure_page, ensure_user, get_conn  # noqa: E402
+from app.services import add_links, publish_page, update_page  # noqa: E402
+
+MadePage = namedtuple("MadePage", ("user", "page_id", "slug"))
+
+
+@pytest.fixture
+def make_page():
+    # make_page(tg_id, "Name", links=[(title, url)], publish=True, paid=True,
+    # bio=...): a user with their page; slug is None unless published
+    def make(tg_id: int, name=None, links=(), publish=False, paid=False, **fields) -> MadePage:
+        user = ensure_user(tg_id, f"user{tg_id}")
+        page_id = ensure_page(user["id"])["id"]
+        if name is not None:
+            fields["display_name"] = name
+        if fields:
+            update_page(page_id, **fields)
+        if links:
+            add_links(page_id, [(title, url, "custom") for title, url in links])
+        if paid:
+            with get_conn() as conn:
+                conn.execute(
+                    "UPDATE users SET plan_type='PRO_1', plan_expires_at=? WHERE id=?",
+                    ((datetime.utcnow() + timedelta(days=30)).isoformat(), user["id"]),
+                )
+        return MadePage(user, page_id, publish_page(page_id) if publish else None)
+
+    return make
@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+
+from app import admission
+from app.admission import AdaptiveLimiter, AdmissionMiddleware, classify
+
+
+def test_classify():
+    assert classify("/r/12") == classify("/u/someone") == classify("/api/pages/x") == "critical"
+    assert classify("/") == classify("/pricing") == classify("/static/page.css") == "marketing"
+    assert classify("/admin/export/events") == "admin"
+    assert classify("/admin/metrics") is None and classify("/api/health") is None
+
+
+def test_higher_classes_served_first():
+    async def run():
+        lim = AdaptiveLimiter(initial=4, min_limit=1)
+        for _ in range(4):
+            assert await lim.acquire("critical")
+        marketing = asyncio.create_task(lim.acquire("marketing"))
+        await asyncio.sleep(0)
+        critical = asyncio.create_task(lim.acquire("critical"))
+        await asyncio.sleep(0)
+        assert not await lim.acquire("admin")  # waits its 0.1 s, then shed
+        lim.release("critical", None)
+        await asyncio.sleep(0.01)
+        assert critical.done() and not marketing.done()
+        lim.release("critical", None)
+        lim.release("critical", None)  # marketing may fill 3 of 4
+        assert await marketing
+        stats = lim.stats()["classes"]
+        assert stats["admin"]["shed"] == 1 and stats["marketing"]["queued"] == 1
+        assert stats["critical"]["inflight"] == 2 and stats["marketing"]["inflight"] == 1
+
+    asyncio.run(run())
+
+
+def test_limit_follows_latency(monkeypatch):
+    monkeypatch.setattr(admission, "WINDOW_SEC", 0)
+
+    async def run():
+        lim = AdaptiveLimiter(initial=20, min_limit=4, max_limit=100)
+
+        async def burst(latency):
+            for _ in range(20):
+                await lim.acquire("critical")
+            for _ in range(20):
+                lim.release("critical", latency)
+
+        for _ in range(5):
+            await burst(0.01)
+        grown = lim.limit
+        assert grown > 20
+        for _ in range(5):
+            await burst(0.2)
+        assert lim.limit < grown
+
+    asyncio.run(run())
+
+
+def test_middleware_sheds_with_retry_after():
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.3 if scope["path"] == "/admin/slow" else 0)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def run():
+        mw = AdmissionMiddleware(app, AdaptiveLimiter(initial=1, min_limit=1))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=mw), base_url="http://t") as client:
+            slow = asyncio.create_task(client.get("/admin/slow"))
+            await asyncio.sleep(0.05)
+            shed, redirect = await asyncio.gather(client.get("/admin/other"), client.get("/r/1"))
+            assert (await slow).status_code == 200
+        assert shed.status_code == 503 and shed.headers["retry-after"]
+        assert redirect.status_code == 200  # critical waits longer and gets the slot
+
+    asyncio.run(run())
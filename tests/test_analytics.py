@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from app import analytics
+from app.charts import render_bar_chart
+from app.analytics_db import ingest_conn
+from app.main import app
+from app.services import record_click, record_view, stats_for_user
+
+
+def insert_rollup(page_id, event_type, ts: datetime, count, link_id=0):
+    with ingest_conn(ts.isoformat()) as conn:
+        conn.execute(
+            "INSERT INTO analytics_hourly (page_id, event_type, bucket, link_id, count) VALUES (?, ?, ?, ?, ?)",
+            (page_id, event_type, analytics.hour_key(ts), link_id, count),
+        )
+
+
+def test_ingest_updates_rollups_and_totals(make_page):
+    user, page_id, _ = make_page(3101)
+    record_view(page_id, "1.1.1.1", "ua")
+    record_view(page_id, "1.1.1.2", "ua")
+    record_click(page_id, 77, "1.1.1.1", "ua")
+    s = stats_for_user(user["id"])
+    assert (s["views_total"], s["clicks_total"], s["views_7d"], s["clicks_7d"]) == (2, 1, 2, 1)
+
+
+def test_daily_series_zero_filled_and_cached(make_page):
+    page_id = make_page(3102).page_id
+    now = datetime(2026, 3, 10, 15, 30)
+    insert_rollup(page_id, "view", datetime(2026, 3, 8, 9), 4)
+    insert_rollup(page_id, "view", datetime(2026, 3, 8, 20), 1)
+    insert_rollup(page_id, "view", datetime(2026, 3, 10, 15), 2)
+    start = datetime(2026, 3, 7)
+    points = analytics.series(page_id, "views", start, now, "day", now=now)
+    assert [p["bucket"] for p in points] == ["2026-03-07", "2026-03-08", "2026-03-09", "2026-03-10"]
+    assert [p["count"] for p in points] == [0, 5, 0, 2]
+    # the open hour is read live, closed hours come from the cache
+    insert_rollup(page_id, "view", datetime(2026, 3, 8, 21), 100)
+    with ingest_conn("2026-03-10") as conn:
+        conn.execute("UPDATE analytics_hourly SET count=3 WHERE page_id=? AND bucket='2026-03-10T15'", (page_id,))
+    points = analytics.series(page_id, "views", start, now, "day", now=now)
+    assert [p["count"] for p in points] == [0, 5, 0, 3]
+
+
+def test_week_and_hour_of_day_buckets(make_page):
+    page_id = make_page(3103).page_id
+    insert_rollup(page_id, "click", datetime(2026, 3, 4, 9), 2, link_id=5)
+    insert_rollup(page_id, "click", datetime(2026, 3, 11, 9), 3, link_id=6)
+    now = datetime(2026, 3, 20)
+    weeks = analytics.series(page_id, "clicks", datetime(2026, 3, 2), now, "week", now=now)
+    assert weeks[:2] == [{"bucket": "2026-03-02", "count": 2}, {"bucket": "2026-03-09", "count": 3}]
+    hours = analytics.series(page_id, "clicks", datetime(2026, 3, 1), now, "hour_of_day", now=now)
+    assert len(hours) == 24 and hours[9]["count"] == 5
+    per_link = analytics.series(page_id, "clicks", datetime(2026, 3, 2), now, "week", link_id=6, now=now)
+    assert per_link[1]["count"] == 3 and per_link[0]["count"] == 0
+
+
+def test_series_api_and_chart(make_page):
+    page_id = make_page(3104).page_id
+    insert_rollup(page_id, "view", datetime.utcnow() - timedelta(days=1), 7)
+    c = TestClient(app)
+    r = c.get(f"/admin/api/pages/{page_id}/series?days=3", auth=("admin", "change-me"))
+    assert r.status_code == 200
+    assert sum(p["count"] for p in r.json()["points"]) == 7
+    assert c.get(f"/admin/api/pages/{page_id}/series?bucket=year", auth=("admin", "change-me")).status_code == 400
+    assert render_bar_chart(r.json()["points"], "Views")[:4] == b"\x89PNG"
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from app import analytics_db, services
+from app.analytics import bump_rollup, totals
+from app.analytics_db import ingest_conn, partition_conns, partitions
+from app.export import export_high_water, iter_event_chunks
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(analytics_db, "ANALYTICS_DIR", str(tmp_path / "analytics"))
+    return tmp_path
+
+
+def add_event(page_id: int, created_at: str, event_type: str = "view"):
+    with ingest_conn(created_at) as conn:
+        conn.execute(
+            "INSERT INTO analytics_events (page_id, link_id, event_type, ip, user_agent, created_at) VALUES (?, NULL, ?, '', '', ?)",
+            (page_id, event_type, created_at),
+        )
+        bump_rollup(conn, page_id, None, event_type, created_at)
+
+
+def test_events_land_in_their_month(store):
+    add_event(1, "2026-01-31T23:59:59")
+    add_event(1, "2026-02-01T00:00:00")
+    add_event(1, "2026-02-14T12:00:00")
+    assert partitions() == ["2026-01", "2026-02"]
+    assert totals(1)["views"] == 3
+    assert totals(1, since=datetime(2026, 2, 1))["views"] == 2
+    assert [m for m, _ in partition_conns("2026-02")] == ["2026-02"]
+
+
+def test_ids_increase_across_partitions_and_export_spans_them(store):
+    add_event(2, "2026-03-05T10:00:00")
+    add_event(2, "2026-04-05T10:00:00")
+    add_event(2, "2026-03-06T10:00:00")  # a late write to the older month
+    ids = [row[0] for chunk in iter_event_chunks(0) for row in chunk]
+    assert ids[0] < ids[1] < ids[2] and ids[2] >> 32 == (ids[0] >> 32) + 1
+    assert export_high_water() == ids[2]
+    assert [row[0] for chunk in iter_event_chunks(ids[0], limit=5) for row in chunk] == ids[1:]
+
+
+def test_close_and_drop(store):
+    add_event(3, "2025-11-10T10:00:00")
+    add_event(3, "2025-12-10T10:00:00")
+    add_event(3, "2026-01-10T10:00:00")
+    now = datetime(2026, 1, 15).timestamp()
+    assert analytics_db.close_partitions(now=now) == ["2025-11", "2025-12"]
+    assert analytics_db.is_closed("2025-11") and not analytics_db.is_closed("2026-01")
+    assert not os.path.exists(analytics_db.partition_path("2025-11") + "-wal")
+    assert totals(3)["views"] == 3
+    with pytest.raises(PermissionError):
+        add_event(3, "2025-11-10T11:00:00")
+    assert analytics_db.live_paths() == [analytics_db.totals_path(), analytics_db.partition_path("2026-01")]
+    assert analytics_db.drop_partitions(2, now=datetime(2026, 1, 15)) == ["2025-11"]
+    assert partitions() == ["2025-12", "2026-01"]
+    assert totals(3)["views"] == 2
+
+
+def test_migrates_tables_out_of_the_main_db(store, monkeypatch):
+    main = str(store / "legacy.db")
+    conn = sqlite3.connect(main)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE links (id INTEGER PRIMARY KEY, page_id INTEGER, title TEXT, url TEXT)")
+    conn.execute(
+        "CREATE TABLE analytics_events (id INTEGER PRIMARY KEY AUTOINCREMENT, page_id INTEGER NOT NULL, link_id INTEGER, "
+        "event_type TEXT NOT NULL, ip TEXT, user_agent TEXT, created_at TEXT NOT NULL)"
+    )
+    conn.executemany(
+        "INSERT INTO analytics_events (page_id, link_id, event_type, ip, user_agent, created_at) VALUES (?, ?, ?, '', '', ?)",
+        [(7, None, "view", "2025-05-01T10:00:00"), (7, 70, "click", "2025-05-02T10:00:00"), (7, None, "view", "2025-06-01T10:00:00")],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(analytics_db, "DB_PATH", main)
+    analytics_db.init_analytics()
+    analytics_db.init_analytics()  # nothing left to move the second time
+    assert partitions() == ["2025-05", "2025-06"]
+    assert totals(7) == {"views": 2, "clicks": 1}
+    with analytics_db.totals_conn() as conn:
+        assert [tuple(r) for r in conn.execute("SELECT link_id, clicks FROM link_clicks")] == [(70, 1)]
+    assert [row[0] for chunk in iter_event_chunks(0) for row in chunk] == [1, 2, 3]
+    conn = sqlite3.connect(main)
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name='analytics_events'").fetchone()
+    conn.close()
+    add_event(7, "2025-06-02T10:00:00")
+    assert export_high_water() == analytics_db.first_event_id("2025-06") + 1
+
+
+def test_ingest_connections_reused_per_month(store):
+    opened = analytics_db.ingest_stats()["opened"]
+    for i in range(5):
+        add_event(4, f"2026-02-0{i + 1}T10:00:00")
+    assert analytics_db.ingest_stats()["opened"] == opened + 1
+    add_event(4, "2026-03-01T00:00:00")
+    assert analytics_db.ingest_stats()["opened"] == opened + 2
+    # the February connection was let go, so nothing holds the month open
+    assert all(month != "2026-02" for _, month, _ in analytics_db._pool)
+    assert analytics_db.close_partitions(now=datetime(2026, 3, 15).timestamp()) == ["2026-02"]
+
+
+def test_event_in_closed_month_is_dropped(store, monkeypatch):
+    add_event(5, "2025-10-10T10:00:00")
+    add_event(5, "2026-01-10T10:00:00")
+    analytics_db.close_partitions(now=datetime(2026, 1, 15).timestamp())
+    dropped = analytics_db.ingest_stats()["dropped_closed_month"]
+    monkeypatch.setattr(services, "utcnow", lambda: "2025-10-31T23:59:59")
+    services.record_view(5, "3.3.3.3", "late")
+    assert analytics_db.ingest_stats()["dropped_closed_month"] == dropped + 1
+    assert totals(5)["views"] == 2
@@ -0,0 +1,44 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import add_link
+
+SHOP = [("Shop", "https://example.com/shop")]
+
+
+def test_page_json_with_strong_etag_and_304(make_page):
+    _, page_id, slug = make_page(4001, "Api Page", links=SHOP, publish=True, bio="Tom &amp; Jerry")
+    c = TestClient(app)
+    r = c.get(f"/api/pages/{slug}")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["slug"] == slug and data["bio"] == "Tom & Jerry"
+    assert [l["title"] for l in data["links"]] == ["Shop"]
+    assert data["links"][0]["click_url"].endswith(f"/r/{data['links'][0]['id']}")
+    etag = r.headers["etag"]
+    assert not etag.startswith("W/")
+    assert "max-age" in r.headers["cache-control"]
+    assert c.get(f"/api/pages/{slug}", headers={"If-None-Match": etag}).status_code == 304
+    add_link(page_id, "Blog", "https://example.com/blog")
+    r2 = c.get(f"/api/pages/{slug}", headers={"If-None-Match": etag})
+    assert r2.status_code == 200
+    assert len(r2.json()["links"]) == 2
+
+
+def test_batch_in_request_order_with_missing(make_page):
+    a = make_page(4002, "Batch A", links=SHOP, publish=True).slug
+    b = make_page(4003, "Batch B", links=SHOP, publish=True).slug
+    c = TestClient(app)
+    c.get(f"/api/pages/{a}")  # one cached, one loaded
+    r = c.get("/api/pages", params={"slugs": f"{b},nope-404,{a}"})
+    assert r.status_code == 200
+    data = r.json()
+    assert [p["slug"] for p in data["pages"]] == [b, a]
+    assert data["missing"] == ["nope-404"]
+    assert c.get("/api/pages", params={"slugs": f"{b},nope-404,{a}"}, headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+
+
+def test_unknown_slug_and_bad_batch():
+    c = TestClient(app)
+    assert c.get("/api/pages/nope-missing").status_code == 404
+    assert c.get("/api/pages", params={"slugs": ""}).status_code == 400
@@ -0,0 +1,13 @@
+import asyncio
+
+from scripts.bench_bot import drive, user_script
+
+
+def test_bench_drives_every_update_through_the_bot():
+    report = asyncio.run(drive(users=6, concurrency=3, paid_share=0.5))
+    assert report["errors"] == {}
+    assert report["updates"] == 3 * len(user_script(0, "CODE")) + 3 * len(user_script(0, ""))
+    assert "(unhandled)" not in report["handlers"]
+    assert report["handlers"]["publish_cmd"]["n"] == 6
+    assert report["bot_api_calls"]["sendMessage"] >= report["updates"]
+    assert report["queries_per_update"] > 0
@@ -0,0 +1,91 @@
+import gzip
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import compression
+from app.compression import PrecompressedStaticFiles, compress, compression_stats, pick_encoding
+from app.main import app
+
+
+def test_pick_encoding():
+    assert pick_encoding('gzip, deflate, br') == 'br'
+    assert pick_encoding('gzip;q=1.0, br;q=0') == 'gzip'
+    assert pick_encoding('identity') is None
+
+
+def test_compressed_body_cache():
+    body = b'<p>hello</p>' * 200
+    before = compression_stats()['hits']
+    first = compress(body, 'gzip')
+    assert compress(body, 'gzip') is first
+    assert compression_stats()['hits'] == before + 1
+    assert gzip.decompress(first) == body
+
+
+def test_html_response_compressed_with_vary():
+    c = TestClient(app)
+    r = c.get('/?lang=en', headers={'Accept-Encoding': 'gzip'})
+    assert r.headers['content-encoding'] == 'gzip'
+    assert 'accept-encoding' in r.headers['vary'].lower()
+    assert r.headers['etag'].endswith('-gzip"')
+    assert c.get('/?lang=en', headers={'Accept-Encoding': 'gzip', 'If-None-Match': r.headers['etag']}).status_code == 304
+    plain = c.get('/?lang=en', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in plain.headers
+    assert 'accept-encoding' in plain.headers['vary'].lower()
+    assert plain.text == r.text
+
+
+def test_precompressed_static_sibling(tmp_path):
+    css = b'body{color:red}' * 100
+    (tmp_path / 'a.css').write_bytes(css)
+    (tmp_path / 'a.css.gz').write_bytes(gzip.compress(css))
+    static_app = FastAPI()
+    static_app.mount('/static', PrecompressedStaticFiles(directory=str(tmp_path)), name='static')
+    c = TestClient(static_app)
+    r = c.get('/static/a.css', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['content-encoding'] == 'gzip'
+    assert r.headers['content-type'].startswith('text/css')
+    assert r.content == css
+    assert c.get('/static/a.css.gz.missing').status_code == 404
+
+
+def test_cache_bounded_by_bytes(monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESS_CACHE_BYTES', 64 * 1024)
+    for i in range(40):
+        compress(os.urandom(4096), 'gzip')  # incompressible: ~4 KB each
+    assert compression_stats()['bytes'] <= 64 * 1024
+    big = os.urandom(16 * 1024)
+    compress(big, 'gzip')
+    assert compress(big, 'gzip') is not compress(big, 'gzip')  # over an eighth of the budget: not kept
+
+
+def test_untagged_bodies_not_cached():
+    body = b'{"n": 1}' * 200
+    before = compression_stats()
+    compress(body, 'gzip', cache=False)
+    after = compression_stats()
+    assert after['uncached'] == before['uncached'] + 1 and after['entries'] <= before['entries']
+
+
+def test_not_modified_carries_encoded_etag():
+    c = TestClient(app)
+    r = c.get('/?lang=en', headers={'Accept-Encoding': 'gzip'})
+    again = c.get('/?lang=en', headers={'Accept-Encoding': 'gzip', 'If-None-Match': r.headers['etag']})
+    assert again.status_code == 304 and again.headers['etag'] == r.headers['etag']
+    plain = c.get('/?lang=en', headers={'Accept-Encoding': 'identity'})
+    again = c.get('/?lang=en', headers={'Accept-Encoding': 'identity', 'If-None-Match': plain.headers['etag']})
+    assert again.status_code == 304 and again.headers['etag'] == plain.headers['etag']
+
+
+def test_precompressed_falls_back_to_next_encoding(tmp_path):
+    css = b'body{color:blue}' * 100
+    (tmp_path / 'b.css').write_bytes(css)
+    (tmp_path / 'b.css.gz').write_bytes(gzip.compress(css))
+    static_app = FastAPI()
+    static_app.mount('/static', PrecompressedStaticFiles(directory=str(tmp_path)), name='static')
+    r = TestClient(static_app).get('/static/b.css', headers={'Accept-Encoding': 'br, gzip'})
+    assert r.headers['content-encoding'] == 'gzip'
+    assert r.content == css
@@ -0,0 +1,54 @@
+import os
+
+from app.analytics_db import partition_conns
+from app.dedup import SharedDedup, ingest_dedup
+from app.services import record_click, record_view
+
+
+def test_repeat_within_window_suppressed():
+    d = SharedDedup(window_sec=60, max_keys=1000)
+    assert not d.seen("view", "a")
+    assert d.seen("view", "a")
+    assert not d.seen("view", "b")
+    assert d.stats()["suppressed"] == {"view": 1}
+
+
+def test_memory_bounded_by_slot_count():
+    d = SharedDedup(window_sec=60, max_keys=10)
+    for i in range(100):
+        d.seen("view", i)
+    assert d.stats()["keys"] <= 10
+    assert not d.seen("view", 0)
+
+
+def test_table_shared_with_forked_worker():
+    d = SharedDedup(window_sec=60, max_keys=1000)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if not d.seen("view", "from-child") else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert d.seen("view", "from-child")
+
+
+def test_disabled_with_zero_window():
+    d = SharedDedup(window_sec=0, max_keys=10)
+    assert not d.seen("view", "a")
+    assert not d.seen("view", "a")
+
+
+def test_refresh_storm_writes_one_event(make_page):
+    page_id = make_page(3301).page_id
+    before = dict(ingest_dedup.stats()["suppressed"])
+    for _ in range(5):
+        record_view(page_id, "7.7.7.7", "ua")
+        record_click(page_id, 9, "7.7.7.7", "ua")
+    record_view(page_id, "8.8.8.8", "ua")
+    counts = {}
+    for _, conn in partition_conns():
+        for r in conn.execute("SELECT event_type, COUNT(*) c FROM analytics_events WHERE page_id=? GROUP BY event_type", (page_id,)):
+            counts[r["event_type"]] = counts.get(r["event_type"], 0) + r["c"]
+    assert counts == {"view": 2, "click": 1}
+    after = ingest_dedup.stats()["suppressed"]
+    assert after["view"] - before.get("view", 0) == 4
+    assert after["click"] - before.get("click", 0) == 4
@@ -0,0 +1,94 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import domains
+from app.domains import (
+    DomainTaken,
+    attach_domain,
+    detach_domain,
+    domain_for_page,
+    normalize_host,
+    refresh_domain_index,
+    txt_name,
+    verify_domain,
+)
+from app.main import app
+
+SHOP = [("Shop", "https://example.com/shop")]
+
+
+def dns(records: dict) -> httpx.MockTransport:
+    # a DNS-over-HTTPS resolver answering TXT queries from records
+    def answer(request):
+        name = request.url.params["name"]
+        found = [{"name": name, "type": 16, "data": f'"{v}"'} for v in records.get(name, [])]
+        return httpx.Response(200, json={"Status": 0 if found else 3, "Answer": found})
+
+    return httpx.MockTransport(answer)
+
+
+def verify(page_id: int, records: dict = None) -> tuple:
+    if records is None:
+        row = domain_for_page(page_id)
+        records = {txt_name(row["host"]): [row["token"]]}
+    return asyncio.run(verify_domain(page_id, transport=dns(records)))
+
+
+def test_normalize_host():
+    assert normalize_host("https://Shop.Example.com/path") == "shop.example.com"
+    assert normalize_host("bücher.example") == "xn--bcher-kva.example"
+    assert normalize_host("localhost") is None
+    assert normalize_host("127.0.0.1") is None
+    assert normalize_host(f"x.{domains.OWN_HOST}.com") == f"x.{domains.OWN_HOST}.com"
+
+
+def test_verified_domain_serves_the_page(make_page):
+    _, page_id, slug = make_page(4901, "Domain 4901", links=SHOP, publish=True, paid=True)
+    attach_domain(page_id, "creator-4901.example")
+    c = TestClient(app)
+    assert c.get("/", headers={"host": "creator-4901.example"}).status_code == 200  # not routed yet: main site
+    assert verify(page_id) == (True, None)
+    refresh_domain_index()
+    r = c.get("/", headers={"host": "creator-4901.example:80"})
+    assert r.status_code == 200 and "Domain 4901" in r.text
+    assert r.headers["etag"] == c.get(f"/u/{slug}").headers["etag"]
+    link_id = r.text.split("/r/", 1)[1].split('"', 1)[0]
+    assert c.get(f"/r/{link_id}", headers={"host": "creator-4901.example"}, follow_redirects=False).status_code == 302
+    assert c.get("/admin", headers={"host": "creator-4901.example"}).status_code == 404
+    detach_domain(page_id)
+    refresh_domain_index()
+    assert "Domain 4901" not in c.get("/", headers={"host": "creator-4901.example"}).text
+
+
+def test_claims_and_failed_verification(make_page):
+    first = make_page(4902, "Domain 4902", links=SHOP, publish=True, paid=True).page_id
+    second = make_page(4903, "Domain 4903", links=SHOP, publish=True, paid=True).page_id
+    claim = attach_domain(first, "contested.example")
+    other = attach_domain(second, "contested.example")  # a second claim leaves the first in place
+    assert domain_for_page(first)["token"] == claim["token"] != other["token"]
+    # the domain's DNS carries the first page's token: the second cannot win it
+    records = {"_linkat.contested.example": [claim["token"]]}
+    assert verify(second, records) == (False, "token_missing")
+    assert verify(first, records) == (True, None)
+    assert domain_for_page(second) is None
+    with pytest.raises(DomainTaken):
+        attach_domain(second, "contested.example")
+    attach_domain(second, "elsewhere.example")
+    assert verify(second, {"_linkat.elsewhere.example": ["someone else"]}) == (False, "token_missing")
+    down = httpx.MockTransport(lambda request: httpx.Response(502))
+    assert asyncio.run(verify_domain(second, transport=down)) == (False, "dns_error")
+
+
+def test_split_txt_values():
+    assert domains._txt_values([{"type": 16, "data": '"abc" "def"'}, {"type": 5, "data": "x."}]) == ["abcdef"]
+
+
+def test_lapsed_plan_falls_back_to_main_site(make_page):
+    _, page_id, slug = make_page(4904, "Domain 4904", links=SHOP, publish=True)
+    attach_domain(page_id, "free-4904.example")
+    assert verify(page_id) == (True, None)
+    refresh_domain_index()
+    r = TestClient(app).get("/", headers={"host": "free-4904.example"}, follow_redirects=False)
+    assert r.status_code == 302 and r.headers["location"].endswith(f"/u/{slug}")
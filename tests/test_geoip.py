@@ -0,0 +1,83 @@
+import os
+
+from app import geoip
+from app.config import GEOIP_DB_PATH
+from app.analytics_db import partition_conns
+from app.services import record_click, record_view, stats_for_user
+
+ROWS = [
+    ["ip_from", "ip_to", "country_code", "country_name"],
+    ["1.0.0.0", "1.0.0.255", "AU", "Australia"],
+    ["1.0.1.0", "1.0.3.255", "CN", "China"],
+    ["16777216", "16777471", "AU", "Australia"],  # overlaps the first row
+    ["3232235520", "3232301055", "-", "-"],  # 192.168.0.0/16, unassigned
+    ["5.0.0.0/16", "SY", "Syria"],
+    ["5.1.0.0", "5.1.255.255", "sy", "Syria"],
+    ["2001:db8::", "2001:db8::ffff", "DE", "Germany"],
+    ["2a00::/12", "NL"],
+    ["281470698652416", "281470698652671", "JP", "Japan"],  # ::ffff:1.2.3.0-255
+]
+
+
+def build(path=GEOIP_DB_PATH, rows=ROWS):
+    v4, v6, skipped = geoip.build_ranges(rows)
+    geoip.write_table(path, v4, v6)
+    geoip.load_geoip(path)
+    return v4, v6, skipped
+
+
+def test_build_merges_and_skips():
+    v4, v6, skipped = geoip.build_ranges(ROWS)
+    assert skipped == 3
+    assert (0x05000000, 0x0501FFFF, "SY") in v4  # CIDR and range rows merged
+    assert (0x01020300, 0x010203FF, "JP") in v4  # mapped IPv6 folded into IPv4
+    assert [r[2] for r in v6] == ["DE", "NL"]
+
+
+def test_lookup():
+    build()
+    cases = {
+        "1.0.0.0": "AU", "1.0.0.255": "AU", "1.0.2.7": "CN", "1.0.4.0": None,
+        "0.0.0.1": None, "5.1.9.9": "SY", "192.168.1.1": None, "1.2.3.4": "JP",
+        "::ffff:1.0.0.9": "AU", "2001:db8::1": "DE", "2001:db8::1:0": None,
+        "2a0f:ffff::1": "NL", "fe80::1%eth0": None, "not-an-ip": None, "": None,
+    }
+    for ip, code in cases.items():
+        assert geoip.country_for_ip(ip) == code, ip
+
+
+def test_missing_or_broken_file_disables_lookup(tmp_path):
+    geoip.load_geoip(str(tmp_path / "none.bin"))
+    assert geoip.country_for_ip("1.0.0.1") is None
+    broken = tmp_path / "broken.bin"
+    broken.write_bytes(b"LKGEOIP1" + b"\x05" * 20)
+    geoip.load_geoip(str(broken))
+    assert geoip.geoip_size() == 0
+
+
+def test_replaced_file_is_remapped(tmp_path):
+    path = str(tmp_path / "geo.bin")
+    build(path, [["9.0.0.0", "9.0.0.255", "US"]])
+    assert geoip.country_for_ip("9.0.0.1") == "US"
+    geoip.write_table(path, [(0x09000000, 0x090000FF, "CA")], [])
+    os.utime(path, ns=(1, 1))  # same-second rewrite on coarse-mtime filesystems
+    geoip.load_geoip()
+    assert geoip.country_for_ip("9.0.0.1") == "CA"
+
+
+def test_ingest_stores_country_and_stats_breakdown(make_page):
+    build()
+    user, page_id, _ = make_page(4201)
+    record_view(page_id, "1.0.0.1", "a")
+    record_view(page_id, "1.0.0.2", "a")
+    record_view(page_id, "1.0.1.1", "a")
+    record_view(page_id, "10.0.0.1", "a")
+    record_click(page_id, 900421, "2001:db8::5", "a")
+    rows = [
+        r
+        for _, conn in partition_conns()
+        for r in conn.execute("SELECT event_type, country FROM analytics_events WHERE page_id=? ORDER BY id", (page_id,))
+    ]
+    assert [tuple(r) for r in rows] == [("view", "AU"), ("view", "AU"), ("view", "CN"), ("view", None), ("click", "DE")]
+    countries = stats_for_user(user["id"])["countries_7d"]
+    assert [(c["country"], c["c"]) for c in countries] == [("AU", 2), ("", 1), ("CN", 1)]
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from app.analytics import ALL_PAGES, unique_visitors
+from app.hll import STANDARD_ERROR, HyperLogLog
+from app.services import record_click, record_view
+
+
+def test_estimate_within_error_bound():
+    sketch = HyperLogLog()
+    for i in range(20000):
+        sketch.add(f"visitor-{i}")
+    assert abs(sketch.count() - 20000) / 20000 < 3 * STANDARD_ERROR
+    small = HyperLogLog()
+    for i in range(50):
+        small.add(f"v{i}")
+    assert abs(small.count() - 50) <= 2
+
+
+def test_merge_and_roundtrip():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        a.add(f"x{i}")
+        b.add(f"x{i + 1500}")
+    restored = HyperLogLog.from_bytes(a.to_bytes())
+    assert restored.registers == a.registers
+    union = restored.merge(b).count()
+    assert abs(union - 4500) / 4500 < 3 * STANDARD_ERROR
+
+
+def test_ingest_updates_persisted_sketches(make_page):
+    page_id = make_page(3201).page_id
+    for _ in range(3):
+        record_view(page_id, "5.5.5.5", "phone")
+    record_click(page_id, 1, "5.5.5.5", "phone")
+    record_view(page_id, "6.6.6.6", "laptop")
+    today = datetime.utcnow().date().isoformat()
+    assert unique_visitors(page_id, today, today) == 2
+    assert unique_visitors(ALL_PAGES, today, today) >= 2
+    assert unique_visitors(page_id, "2000-01-01", "2000-01-02") == 0
@@ -0,0 +1,56 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app import render
+from app.analytics import bump_trending, top_links, trending_pages
+from app.analytics_db import ingest_conn
+from app.db import utcnow
+from app.main import app
+from app.services import add_link, list_links, record_click, stats_for_user
+
+
+def clear_counters(*link_ids):
+    # other tests click made-up link ids; one may equal a link created here
+    with ingest_conn(utcnow()) as conn:
+        conn.executemany("DELETE FROM link_clicks WHERE link_id=?", [(i,) for i in link_ids])
+
+
+def test_top_links_from_counters(make_page):
+    user, page_id, _ = make_page(3401, "Top Links", publish=True)
+    add_link(page_id, "A", "https://a.example.com")
+    add_link(page_id, "B", "https://b.example.com")
+    a, b = list_links(page_id)
+    clear_counters(a["id"], b["id"])
+    for i in range(3):
+        record_click(page_id, b["id"], f"9.9.9.{i}", "ua")
+    record_click(page_id, a["id"], "9.9.9.1", "ua")
+    assert [(r["title"], r["c"]) for r in top_links(page_id)] == [("B", 3), ("A", 1)]
+    assert stats_for_user(user["id"])["top_links"][0]["title"] == "B"
+
+
+def test_trending_decays_by_period(make_page):
+    old = make_page(3402, "Old Hit", publish=True).page_id
+    fresh = make_page(3403, "Fresh Hit", publish=True).page_id
+    now = time.time()
+    with ingest_conn(utcnow()) as conn:
+        for _ in range(10):
+            bump_trending(conn, old, now - 3 * 86400)
+        for _ in range(3):
+            bump_trending(conn, fresh, now)
+    day = [t["page_id"] for t in trending_pages("24h", 50, now=now) if t["page_id"] in (old, fresh)]
+    week = [t["page_id"] for t in trending_pages("7d", 50, now=now) if t["page_id"] in (old, fresh)]
+    assert day == [fresh, old]
+    assert week == [old, fresh]
+    score = [t["score"] for t in trending_pages("24h", 50, now=now) if t["page_id"] == fresh][0]
+    assert abs(score - 3) < 0.01
+
+
+def test_examples_page_lists_trending(make_page):
+    page_id = make_page(3404, "Examples Star", publish=True).page_id
+    with ingest_conn(utcnow()) as conn:
+        for _ in range(1000):
+            bump_trending(conn, page_id)
+    render.clear_static_pages()
+    r = TestClient(app).get("/examples")
+    assert "Examples Star" in r.text
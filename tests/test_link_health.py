@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import link_checker
+from app.db import get_conn, utcnow
+from app.link_health import dead_link_report, link_warnings, next_check, sync_urls
+
+
+class StandIn(BaseHTTPRequestHandler):
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def handle_one(self, method):
+        StandIn.seen.append((method, self.path, self.headers.get("If-None-Match")))
+        with StandIn.lock:
+            StandIn.active += 1
+            StandIn.peak = max(StandIn.peak, StandIn.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.05)
+            if self.path == "/ok":
+                if self.headers.get("If-None-Match") == '"v1"':
+                    return self.reply(304)
+                return self.reply(200, {"ETag": '"v1"'})
+            if self.path == "/nohead":
+                return self.reply(405 if method == "HEAD" else 200)
+            if self.path == "/moved":
+                return self.reply(301, {"Location": "/ok"})
+            if self.path == "/gone":
+                return self.reply(404)
+            if self.path == "/flaky":
+                return self.reply(500)
+            return self.reply(200)
+        finally:
+            with StandIn.lock:
+                StandIn.active -= 1
+
+    def reply(self, code, headers=None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.handle_one("HEAD")
+
+    def do_GET(self):
+        self.handle_one("GET")
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    monkeypatch.setattr(link_checker, "LINK_CHECK_ALLOW_PRIVATE", True)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StandIn.seen, StandIn.peak = [], 0
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def page_with_links(make_page):
+    def make(tg_id: int, urls: list) -> int:
+        page_id = make_page(tg_id).page_id
+        with get_conn() as conn:
+            for i, url in enumerate(urls, start=1):
+                conn.execute(
+                    "INSERT INTO links (page_id, title, url, position, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (page_id, f"L{i}", url, i, utcnow()),
+                )
+        sync_urls()
+        # only the stand-in's urls are due, nothing from other tests hits the network
+        with get_conn() as conn:
+            conn.execute("UPDATE url_health SET next_check_at='9999' WHERE url NOT LIKE 'http://127.0.0.1:%'")
+        return page_id
+
+    return make
+
+
+def test_sweep_classifies_and_revalidates(stand_in, page_with_links):
+    urls = {name: f"{stand_in}/{name}" for name in ("ok", "nohead", "moved", "gone", "flaky")}
+    page_id = page_with_links(4101, list(urls.values()))
+    counts = asyncio.run(link_checker.sweep())
+    assert counts["checked"] == 5
+    with get_conn() as conn:
+        states = {r["url"]: r for r in conn.execute("SELECT * FROM url_health WHERE url LIKE ?", (stand_in + "%",)).fetchall()}
+    assert states[urls["ok"]]["state"] == "ok" and states[urls["ok"]]["etag"] == '"v1"'
+    assert states[urls["nohead"]]["state"] == "ok"
+    assert ("GET", "/nohead", None) in StandIn.seen
+    assert states[urls["moved"]]["state"] == "ok"
+    assert states[urls["gone"]]["state"] == "dead"
+    assert states[urls["flaky"]]["state"] == "error" and states[urls["flaky"]]["failures"] == 1
+
+    warned = link_warnings(page_id)
+    assert urls["gone"] in warned and urls["flaky"] not in warned
+    assert urls["gone"] in {r["url"] for r in dead_link_report(1000)}
+
+    with get_conn() as conn:
+        conn.execute("UPDATE url_health SET next_check_at='' WHERE url=?", (urls["ok"],))
+    asyncio.run(link_checker.sweep())
+    assert ("HEAD", "/ok", '"v1"') in StandIn.seen
+    with get_conn() as conn:
+        assert conn.execute("SELECT state FROM url_health WHERE url=?", (urls["ok"],)).fetchone()["state"] == "ok"
+
+
+def test_per_host_limit(stand_in, page_with_links):
+    page_with_links(4102, [f"{stand_in}/slow/{i}" for i in range(12)])
+    limiter = link_checker.HostLimiter(2)
+    counts = asyncio.run(link_checker.sweep(limiter=limiter))
+    assert counts["ok"] == 12
+    assert limiter.peak["127.0.0.1"] == 2
+    assert StandIn.peak <= 2
+
+
+def test_backoff_grows_until_interval():
+    now = datetime(2024, 1, 1)
+    delays = [(next_check("error", n, now) - now).total_seconds() for n in (1, 2, 3, 30)]
+    assert delays[0] < delays[1] < delays[2] <= delays[3]
+    assert delays[3] == (next_check("dead", 40, now) - now).total_seconds()
+
+
+def test_private_targets_refused(monkeypatch):
+    monkeypatch.setattr(link_checker, "LINK_CHECK_ALLOW_PRIVATE", False)
+
+    async def go():
+        async with link_checker.make_client() as client:
+            return await link_checker.check_url(client, link_checker.HostLimiter(2), "http://127.0.0.1:9/x", None)
+
+    assert asyncio.run(go())["error"] == "unsafe target"
@@ -0,0 +1,57 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import og_image
+from app.main import app, load_published_page
+
+
+def test_og_card_rendered_once_and_cached(monkeypatch, make_page):
+    monkeypatch.setattr(og_image, "OG_RENDER_WORKERS", 1)
+    slug = make_page(3001, "Card Owner", publish=True).slug
+    c = TestClient(app)
+    r = c.get(f"/og/{slug}.png")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    assert r.content[:8] == b"\x89PNG\r\n\x1a\n"
+    path = og_image.card_path(og_image.card_key(load_published_page(slug)), "png")
+    rendered_at = path.stat().st_mtime_ns
+    assert c.get(f"/og/{slug}.png").content == r.content
+    assert path.stat().st_mtime_ns == rendered_at  # served from the file, not rendered again
+    html = c.get(f"/u/{slug}").text
+    assert f"/og/{slug}.png?v=" in html
+    assert c.get(f"/og/{slug}.webp").headers["content-type"] == "image/webp"
+    og_image.shutdown_pool()
+
+
+def test_concurrent_requests_share_one_render(monkeypatch, make_page):
+    monkeypatch.setattr(og_image, "OG_RENDER_WORKERS", 0)  # render in-process so calls can be counted
+    calls = []
+    render = og_image.render_card_file
+
+    def counted(*args):
+        calls.append(args[0])
+        return render(*args)
+
+    monkeypatch.setattr(og_image, "render_card_file", counted)
+    slug = make_page(3002, "Busy Card", publish=True).slug
+    page = load_published_page(slug)
+
+    async def burst():
+        return await asyncio.gather(*(og_image.ensure_card(page, "png") for _ in range(5)))
+
+    paths = asyncio.run(burst())
+    assert len(set(paths)) == 1 and len(calls) == 1
+    asyncio.run(og_image.ensure_card(page, "png"))
+    assert len(calls) == 1
+
+
+def test_og_card_key_changes_with_inputs():
+    page = {"display_name": "A", "avatar_path": None, "theme_color": "#112233", "slug": "a"}
+    changed = dict(page, theme_color="#445566")
+    assert og_image.card_key(page) != og_image.card_key(changed)
+    assert og_image.card_key(page) == og_image.card_key(dict(page, slug="b"))
+
+
+def test_og_unknown_slug_404():
+    assert TestClient(app).get("/og/missing-slug.png").status_code == 404
@@ -0,0 +1,71 @@
+import os
+import signal
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app import profiler
+from app.main import app
+
+AUTH = ("admin", "change-me")
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_sample_sees_busy_thread_and_skips_idle():
+    stop = threading.Event()
+    busy = threading.Thread(target=spin, args=(stop,), name="busy")
+    idle = threading.Thread(target=stop.wait, name="idle")
+    busy.start()
+    idle.start()
+    try:
+        stacks, rounds = profiler.sample(0.2, interval=0.002)
+    finally:
+        stop.set()
+        busy.join()
+        idle.join()
+    assert rounds > 10
+    lines = profiler.folded(stacks).splitlines()
+    assert any(line.startswith("busy;") and "spin (tests/test_profiler.py:" in line for line in lines)
+    assert not any(line.startswith("idle;") for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_profile_endpoint():
+    c = TestClient(app)
+    assert c.get("/admin/profile?seconds=0.1").status_code == 401
+    r = c.get("/admin/profile?seconds=0.1&interval_ms=2&idle=1", auth=AUTH)
+    assert r.status_code == 200
+    assert r.headers["x-profile-worker"] == str(os.getpid())
+    assert int(r.headers["x-profile-samples"]) > 0
+    assert r.text.strip()
+    assert c.get("/admin/profile?seconds=600", auth=AUTH).status_code == 422
+
+
+def test_one_profile_at_a_time():
+    with profiler._busy:
+        try:
+            profiler.sample(0.01)
+        except profiler.ProfilerBusy:
+            pass
+        else:
+            raise AssertionError("second profile started")
+        assert TestClient(app).get("/admin/profile?seconds=0.01", auth=AUTH).status_code == 409
+
+
+def test_signal_trigger_writes_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    previous = signal.getsignal(signal.SIGUSR1)
+    try:
+        profiler.install_signal_trigger("test", seconds=0.05)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        deadline = time.monotonic() + 5
+        while not list(tmp_path.glob("test-*.folded")) and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    assert list(tmp_path.glob(f"test-{os.getpid()}-*.folded"))
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+from app import querylog
+from app.db import get_conn
+from app.main import app
+
+AUTH = ("admin", "change-me")
+
+
+def test_params_shape():
+    assert querylog.params_shape((1, 2, 3, "a", None)) == "(int x3, str, NoneType)"
+    assert querylog.params_shape({"slug": "x"}) == "{slug: str}"
+    assert querylog.params_shape(None) == "()"
+
+
+def test_slow_query_logged_with_plan(monkeypatch):
+    monkeypatch.setitem(querylog._state, "threshold_ms", 0)
+    with get_conn() as conn:
+        conn.execute("SELECT * FROM pages WHERE slug=?", ("secret-slug",)).fetchall()
+        conn.cursor().executemany("UPDATE pages SET bio=bio WHERE id=?", [(1,), (2,)])
+    monkeypatch.setitem(querylog._state, "threshold_ms", 10_000)
+    entries = querylog.slow_queries(10)
+    update, select = entries[0], entries[1]
+    assert select["sql"] == "SELECT * FROM pages WHERE slug=?"
+    assert select["params"] == "(str)" and "secret-slug" not in str(select)
+    assert any("USING INDEX" in line for line in select["plan"])
+    assert select["db"] == "linkat.db"
+    assert update["params"] == "2 x (int)"
+    r = TestClient(app).get("/admin/api/slow-queries?limit=2", auth=AUTH)
+    assert [e["sql"] for e in r.json()] == [update["sql"], select["sql"]]
+    assert "Slow queries" in TestClient(app).get("/admin", auth=AUTH).text
+
+
+def test_fast_queries_not_logged():
+    before = len(querylog.slow_queries())
+    with get_conn() as conn:
+        conn.execute("SELECT 1").fetchone()
+    assert len(querylog.slow_queries()) == before
+
+
+def test_counting_queries():
+    with querylog.counting_queries() as tally:
+        with get_conn() as conn:
+            conn.execute("CREATE TEMP TABLE t (x)")
+            conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,)])
+        assert tally[0] == 2
+    with get_conn() as conn:
+        conn.execute("SELECT 1")
+    assert tally[0] == 2
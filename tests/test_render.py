@@ -0,0 +1,62 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app import render
+from app.main import app
+from app.render import _cached_page_body, precompile_templates
+
+
+def test_precompile_templates():
+    assert precompile_templates() >= 7
+
+
+def test_marketing_page_cached_with_etag():
+    c = TestClient(app)
+    r1 = c.get('/pricing?lang=en')
+    r2 = c.get('/pricing?lang=en')
+    assert r1.status_code == 200
+    assert r1.text == r2.text
+    assert r1.headers['etag'] == r2.headers['etag']
+    assert 'max-age' in r1.headers['cache-control']
+    r3 = c.get('/pricing?lang=en', headers={'If-None-Match': r1.headers['etag']})
+    assert r3.status_code == 304
+
+
+def test_junk_prefixes_do_not_pin_the_static_cache(monkeypatch):
+    monkeypatch.setattr(render, "STATIC_PAGE_CACHE_MAX", 4)
+    render.clear_static_pages()
+    c = TestClient(app)
+    for i in range(10):
+        assert c.get('/faq', headers={'X-Forwarded-Prefix': f'/junk-{i}'}).status_code == 200
+    assert len(render._static_pages) == 4
+    r = c.get('/faq?lang=en')
+    assert ('/faq', 'en', '') in render._static_pages
+    assert c.get('/faq?lang=en', headers={'If-None-Match': r.headers['etag']}).status_code == 304
+    render.clear_static_pages()
+
+
+def test_marketing_page_compressed():
+    c = TestClient(app)
+    r = c.get('/faq', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['content-encoding'] == 'gzip'
+    assert 'FAQ' in r.text
+
+
+def test_concurrent_page_builds_coalesce():
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return b"body"
+
+    bodies = []
+    threads = [threading.Thread(target=lambda: bodies.append(_cached_page_body(("coalesce", 1), build))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(builds) == 1 and bodies == [b"body"] * 10
@@ -0,0 +1,54 @@
+from app import analytics_db, replica
+from app.analytics import totals
+from app.db import ensure_user
+from app.services import record_view
+
+
+def reporting(monkeypatch, tmp_path):
+    monkeypatch.setattr(analytics_db, "REPORTING_MODE", True)
+    monkeypatch.setattr(replica, "REPORTING_MODE", True)
+    monkeypatch.setattr(replica, "REPORT_DIR", str(tmp_path / "report"))
+    monkeypatch.setattr(replica, "REPORT_MAX_STALENESS_SEC", 3600)
+
+
+def test_reports_read_snapshot_until_refresh(make_page, monkeypatch, tmp_path):
+    reporting(monkeypatch, tmp_path)
+    page_id = make_page(3601).page_id
+    record_view(page_id, "4.4.4.1", "ua")
+    assert totals(page_id)["views"] == 1
+    as_of = replica.report_as_of()
+    assert as_of
+    record_view(page_id, "4.4.4.2", "ua")
+    assert totals(page_id)["views"] == 1
+    replica.refresh_snapshot(analytics_db.live_paths())
+    assert totals(page_id)["views"] == 2
+    assert replica.report_as_of() >= as_of
+
+
+def test_snapshot_is_read_only(monkeypatch, tmp_path):
+    reporting(monkeypatch, tmp_path)
+    with analytics_db.totals_conn() as conn:
+        try:
+            conn.execute("DELETE FROM link_clicks")
+        except Exception as e:
+            assert "readonly" in str(e)
+        else:
+            raise AssertionError("snapshot accepted a write")
+
+
+def test_live_mode_has_no_as_of():
+    assert replica.report_as_of() is None
+
+
+def test_admin_lists_read_the_snapshot(monkeypatch, tmp_path):
+    reporting(monkeypatch, tmp_path)
+    ensure_user(3602, "before")
+    with analytics_db.main_db_conn() as conn:
+        names = {r["username"] for r in conn.execute("SELECT username FROM users")}
+    assert "before" in names
+    ensure_user(3603, "after")
+    with analytics_db.main_db_conn() as conn:
+        assert conn.execute("SELECT 1 FROM users WHERE username='after'").fetchone() is None
+    replica.refresh_snapshot(analytics_db.report_paths())
+    with analytics_db.main_db_conn() as conn:
+        assert conn.execute("SELECT 1 FROM users WHERE username='after'").fetchone()
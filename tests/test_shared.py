@@ -0,0 +1,43 @@
+import os
+
+from app.security import check_rate_limit
+from app.shared import SharedRing, SharedWindowCounter
+
+
+def test_limit_applies_within_window():
+    c = SharedWindowCounter(64)
+    assert all(c.add("ip", 60, limit=3) for _ in range(3))
+    assert not c.add("ip", 60, limit=3)
+    assert c.add("other", 60, limit=3)
+    assert c.count("ip", 60) >= 3
+
+
+def test_counts_shared_with_forked_worker():
+    c = SharedWindowCounter(64)
+    pid = os.fork()
+    if pid == 0:
+        c.add("ip", 60)
+        c.add("ip", 60)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    c.add("ip", 60)
+    assert c.count("ip", 60) >= 3
+
+
+def test_check_rate_limit():
+    assert all(check_rate_limit("t:shared", limit=2, period_sec=60) for _ in range(2))
+    assert not check_rate_limit("t:shared", limit=2, period_sec=60)
+
+
+def test_ring_keeps_newest_and_is_shared():
+    ring = SharedRing(3, 32)
+    pid = os.fork()
+    if pid == 0:
+        ring.append(b"from child")
+        os._exit(0)
+    os.waitpid(pid, 0)
+    for i in range(3):
+        ring.append(f"entry {i}".encode())
+    assert ring.items() == [b"entry 2", b"entry 1", b"entry 0"]
+    ring.append(b"x" * 100)
+    assert ring.items()[0] == b"x" * ring.capacity
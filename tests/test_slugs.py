@@ -0,0 +1,57 @@
+import pytest
+
+from app import slug_index
+from app.db import get_conn, utcnow
+from app.services import allocate_slug, generate_unique_slug, publish_page
+
+
+def test_allocator_fills_first_free_suffix(make_page):
+    for tg_id, slug in [(2801, "store"), (2802, "store-2"), (2803, "store-4")]:
+        pid = make_page(tg_id, "Store").page_id
+        with get_conn() as conn:
+            conn.execute("UPDATE pages SET slug=? WHERE id=?", (slug, pid))
+    assert generate_unique_slug("Store") == "store-3"
+
+
+def test_reserved_slugs_are_skipped():
+    with get_conn() as conn:
+        assert allocate_slug(conn, "Admin") == "admin-2"
+
+
+def test_publish_allocates_and_indexes(make_page):
+    pid = make_page(2810, "Fresh Bakery").page_id
+    slug = publish_page(pid)
+    assert slug == "fresh-bakery"
+    assert publish_page(pid) == slug
+    assert slug_index.resolve_slug(slug) == pid
+    other = make_page(2811, "Fresh Bakery").page_id
+    assert publish_page(other) == "fresh-bakery-2"
+
+
+def test_publishing_a_missing_page_fails_cleanly(make_page):
+    with pytest.raises(ValueError, match="page_not_found"):
+        publish_page(999999)
+    # the write lock was released with the failed transaction
+    assert publish_page(make_page(2812, "After Missing").page_id) == "after-missing"
+
+
+def test_index_picks_up_pages_published_elsewhere(make_page, monkeypatch):
+    slug_index.load_slug_index()
+    assert slug_index.resolve_slug("elsewhere") is None
+    pid = make_page(2820, "Elsewhere").page_id
+    with get_conn() as conn:
+        conn.execute("UPDATE pages SET slug='elsewhere', is_published=1 WHERE id=?", (pid,))
+        conn.execute("INSERT INTO slug_log (slug, page_id, created_at) VALUES ('elsewhere', ?, ?)", (pid, utcnow()))
+    monkeypatch.setattr(slug_index, "SLUG_INDEX_REFRESH_SEC", 0)
+    assert slug_index.resolve_slug("elsewhere") == pid
+
+
+def test_public_page_uses_index(make_page):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    pid = make_page(2830, "Index Page").page_id
+    slug = publish_page(pid)
+    c = TestClient(app)
+    assert c.get(f"/u/{slug}").status_code == 200
+    assert c.get("/u/no-such-page-xyz").status_code == 404
@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import snapshot
+from app.db import NEXT_PAGE_VERSION, get_conn
+from app.main import app
+from app.render import render_page
+from app.services import add_links, remove_link, reorder_link, update_page, upsert_page_field
+
+LINKS = [("First", "https://example.com/1"), ("Second", "https://example.com/2")]
+
+
+def test_snapshot_fields_links_and_roundtrip(make_page):
+    _, page_id, slug = make_page(3901, "Snap", links=LINKS, publish=True)
+    snap = snapshot.get_snapshot(page_id)
+    assert snap.slug == slug and snap["display_name"] == "Snap"
+    assert [l.title for l in snap.links] == ["First", "Second"]
+    assert snap.watermark is True
+    assert snapshot.get_snapshot(page_id) is snap
+    copy = snapshot.PageSnapshot.from_bytes(snap.to_bytes())
+    assert copy.to_dict() == snap.to_dict()
+
+
+def test_every_write_moves_the_version(make_page):
+    page_id = make_page(3902, "Versioned", links=LINKS, publish=True).page_id
+    v1 = snapshot.get_snapshot(page_id).version
+    reorder_link(page_id, 2, 1)
+    snap = snapshot.get_snapshot(page_id)
+    assert snap.version > v1
+    assert [l.title for l in snap.links] == ["Second", "First"]
+
+
+def test_write_from_another_process_is_picked_up(monkeypatch, make_page):
+    _, page_id, slug = make_page(3903, "Before", links=LINKS, publish=True)
+    c = TestClient(app)
+    assert "Before" in c.get(f"/u/{slug}").text
+    with get_conn() as conn:
+        conn.execute(f"UPDATE pages SET display_name='After', version={NEXT_PAGE_VERSION} WHERE id=?", (page_id,))
+    monkeypatch.setattr(snapshot, "SNAPSHOT_REFRESH_SEC", 0)
+    assert "After" in c.get(f"/u/{slug}").text
+
+
+def test_rendered_html_cached_per_version(make_page):
+    page_id = make_page(3904, "Html", links=LINKS, publish=True).page_id
+    snap = snapshot.get_snapshot(page_id)
+    assert render_page(snap, "") is render_page(snap, "")
+    assert render_page(snap, "/x") is not render_page(snap, "")
+
+
+def slow_loads(monkeypatch):
+    calls = []
+    real = snapshot.load_snapshot
+
+    def load(page_id):
+        calls.append(page_id)
+        time.sleep(0.05)
+        return real(page_id)
+
+    monkeypatch.setattr(snapshot, "load_snapshot", load)
+    return calls
+
+
+def in_threads(n, fn):
+    results = [None] * n
+
+    def run(i):
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_misses_share_one_load(monkeypatch, make_page):
+    page_id = make_page(3905, "Viral", links=LINKS, publish=True).page_id
+    snapshot.evict_snapshot(page_id)
+    snapshot._stale.pop(page_id, None)
+    calls = slow_loads(monkeypatch)
+    snaps = in_threads(20, lambda: snapshot.get_snapshot(page_id))
+    assert calls == [page_id]
+    assert all(s is snaps[0] for s in snaps)
+
+
+def test_previous_version_served_while_reloading(monkeypatch, make_page):
+    page_id = make_page(3906, "Old", links=LINKS, publish=True).page_id
+    old = snapshot.get_snapshot(page_id)
+    upsert_page_field(page_id, "display_name", "New")
+    calls = slow_loads(monkeypatch)
+    leader = threading.Thread(target=snapshot.get_snapshot, args=(page_id,))
+    leader.start()
+    time.sleep(0.01)
+    assert snapshot.get_snapshot(page_id) is old
+    leader.join()
+    assert calls == [page_id]
+    assert snapshot.get_snapshot(page_id).display_name == "New"
+
+
+def test_redirects_read_links_from_the_snapshot(make_page):
+    page_id = make_page(3907, "Redirects", links=LINKS, publish=True).page_id
+    first, second = snapshot.get_snapshot(page_id).links
+    assert snapshot.get_link(first.id) == (page_id, first)
+    c = TestClient(app)
+    r = c.get(f"/r/{second.id}", follow_redirects=False)
+    assert r.status_code == 302 and r.headers["location"] == "https://example.com/2"
+    remove_link(page_id, 2)
+    assert c.get(f"/r/{second.id}", follow_redirects=False).status_code == 404
+    assert snapshot.get_link(10**9) is None
+
+
+def test_links_of_unpublished_pages_still_redirect(make_page):
+    page_id = make_page(3908, links=[("Draft", "https://example.com/draft")]).page_id
+    with get_conn() as conn:
+        link_id = conn.execute("SELECT id FROM links WHERE page_id=?", (page_id,)).fetchone()["id"]
+    r = TestClient(app).get(f"/r/{link_id}", follow_redirects=False)
+    assert r.status_code == 302 and r.headers["location"] == "https://example.com/draft"
+
+
+def test_update_page_is_one_version_bump(make_page):
+    page_id = make_page(3909, "Multi", links=LINKS, publish=True).page_id
+    v1 = snapshot.get_snapshot(page_id).version
+    v2 = update_page(page_id, offer_title="Deal", offer_url="https://example.com/deal")
+    snap = snapshot.get_snapshot(page_id)
+    assert snap.version == v2 == v1 + 1
+    assert (snap.offer_title, snap.offer_url) == ("Deal", "https://example.com/deal")
+    assert add_links(page_id, [("A", "https://example.com/a", "custom"), ("B", "https://example.com/b", "custom")]) == 2
+    snap = snapshot.get_snapshot(page_id)
+    assert snap.version == v2 + 1
+    assert [l.title for l in snap.links] == ["First", "Second", "A", "B"]
+    with pytest.raises(ValueError):
+        update_page(page_id, is_published=0)
+
+
+def test_public_page_revalidates_on_version(make_page):
+    _, page_id, slug = make_page(3910, "Etag", links=LINKS, publish=True)
+    c = TestClient(app)
+    r = c.get(f"/u/{slug}")
+    etag = r.headers["etag"]
+    assert etag.startswith(f'"{page_id}.{snapshot.get_snapshot(page_id).version}.w')
+    assert c.get(f"/u/{slug}", headers={"If-None-Match": etag}).status_code == 304
+    upsert_page_field(page_id, "bio", "changed")
+    r = c.get(f"/u/{slug}", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and "changed" in r.text and r.headers["etag"] != etag
@@ -0,0 +1,62 @@
+from fastapi.testclient import TestClient
+
+from app import traffic
+from app.analytics_db import partition_conns
+from app.main import app
+from app.shared import SharedWindowCounter
+
+BROWSER = "Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36"
+
+
+def count_events(page_id: int) -> int:
+    return sum(
+        conn.execute("SELECT COUNT(*) c FROM analytics_events WHERE page_id=?", (page_id,)).fetchone()["c"]
+        for _, conn in partition_conns()
+    )
+
+
+def test_classify_user_agent():
+    assert traffic.classify_user_agent("TelegramBot (like TwitterBot)") == "preview"
+    assert traffic.classify_user_agent("WhatsApp/2.23.20.0") == "preview"
+    assert traffic.classify_user_agent("facebookexternalhit/1.1") == "preview"
+    assert traffic.classify_user_agent("Mozilla/5.0 (compatible; Googlebot/2.1)") == "crawler"
+    assert traffic.classify_user_agent("Pinterestbot/1.0 (+http://www.pinterest.com/bot.html)") == "preview"
+    assert traffic.classify_user_agent("Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)") == "crawler"
+    assert traffic.classify_user_agent(BROWSER) == "human"
+    # in-app browsers and phone models that only look like bots
+    assert traffic.classify_user_agent(BROWSER + " Viber/20.3.0") == "human"
+    assert traffic.classify_user_agent("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148 [Pinterest/iOS]") == "human"
+    assert traffic.classify_user_agent("Mozilla/5.0 (Linux; Android 13; CUBOT X30) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36") == "human"
+    assert traffic.classify_user_agent("") == "human"
+
+
+def test_preview_bot_gets_og_page_without_analytics(make_page):
+    _, page_id, slug = make_page(2901, "Preview Me", publish=True)
+    c = TestClient(app)
+    r = c.get(f"/u/{slug}", headers={"User-Agent": "TelegramBot (like TwitterBot)"})
+    assert r.status_code == 200
+    assert 'property="og:title"' in r.text
+    assert count_events(page_id) == 0
+    c.get(f"/u/{slug}", headers={"User-Agent": BROWSER})
+    assert count_events(page_id) == 1
+
+
+def test_slug_enumeration_is_shed(monkeypatch):
+    monkeypatch.setattr(traffic, "ABUSE_MISS_LIMIT", 3)
+    monkeypatch.setattr(traffic, "_misses", SharedWindowCounter(64))
+    c = TestClient(app)
+    for i in range(3):
+        assert c.get(f"/u/nope-{i}", headers={"User-Agent": BROWSER}).status_code == 404
+    r = c.get("/u/nope-x", headers={"User-Agent": BROWSER})
+    assert r.status_code == 429
+    assert traffic.traffic_counters()["shed"] >= 1
+
+
+def test_api_enumeration_is_shed(monkeypatch):
+    monkeypatch.setattr(traffic, "ABUSE_MISS_LIMIT", 3)
+    monkeypatch.setattr(traffic, "_misses", SharedWindowCounter(64))
+    c = TestClient(app)
+    for i in range(3):
+        assert c.get(f"/api/pages/nope-{i}", headers={"User-Agent": BROWSER}).status_code == 404
+    assert c.get("/api/pages/nope-x", headers={"User-Agent": BROWSER}).status_code == 429
+    assert c.get("/u/nope-x", headers={"User-Agent": BROWSER}).status_code == 429
@@ -0,0 +1,73 @@
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app import uploads
+from app.config import UPLOAD_DIR
+from app.db import get_conn
+from app.main import app
+from app.services import update_page
+from app.uploads import gc_uploads, store_upload
+
+
+def refs(path: str) -> int:
+    with get_conn() as conn:
+        return conn.execute("SELECT refs FROM uploads WHERE path=?", (path,)).fetchone()["refs"]
+
+
+def test_content_addressed_and_deduplicated():
+    a = store_upload(b"same image", ".JPG")
+    assert a == store_upload(b"same image", ".jpg")
+    name = os.path.basename(a)
+    assert a == f"/uploads/{name[:2]}/{name[2:4]}/{name}" and name.endswith(".jpg")
+    assert uploads.file_for(a).read_bytes() == b"same image"
+    r = TestClient(app).get(a)
+    assert r.status_code == 200 and r.headers["cache-control"] == uploads.IMMUTABLE
+
+
+def test_refs_follow_page_edits_and_gc_keeps_referenced(make_page):
+    first, second = make_page(4801).page_id, make_page(4802).page_id
+    a = store_upload(b"avatar a", ".jpg")
+    b = store_upload(b"avatar b", ".jpg")
+    update_page(first, avatar_path=a)
+    update_page(second, avatar_path=a)
+    assert refs(a) == 2
+    update_page(first, avatar_path=b)
+    update_page(first, bio="no avatar change")
+    assert (refs(a), refs(b)) == (1, 1)
+    update_page(second, avatar_path=None)
+    assert refs(a) == 0
+    assert gc_uploads(now=datetime.utcnow())["removed"] == 0  # still inside the grace period
+    gc_uploads(now=datetime.utcnow() + timedelta(days=2))
+    assert not uploads.file_for(a).exists() and uploads.file_for(b).exists()
+    # uploading the same bytes again brings the file back
+    assert store_upload(b"avatar a", ".jpg") == a and uploads.file_for(a).exists()
+
+
+def test_legacy_avatars_adopted_and_swept(make_page):
+    page_id = make_page(4803).page_id
+    legacy = Path(UPLOAD_DIR) / "avatar_1_ABCDEFGH.jpg"
+    legacy.parent.mkdir(parents=True, exist_ok=True)
+    legacy.write_bytes(b"legacy avatar")
+    with get_conn() as conn:
+        conn.execute("UPDATE pages SET avatar_path=? WHERE id=?", ("/uploads/avatar_1_ABCDEFGH.jpg", page_id))
+    assert uploads.adopt_legacy_uploads() == 1
+    with get_conn() as conn:
+        path = conn.execute("SELECT avatar_path FROM pages WHERE id=?", (page_id,)).fetchone()["avatar_path"]
+    assert uploads.is_content_addressed(path) and refs(path) == 1
+    gc_uploads(now=datetime.utcnow() + timedelta(days=2))
+    assert not legacy.exists() and uploads.file_for(path).exists()
+
+
+def test_gc_leaves_files_it_did_not_write():
+    root = Path(UPLOAD_DIR)
+    keep = [root / ".gitkeep", root / "notes.txt", root / "ab" / "README", root / "other" / "ab" / "cd" / ("0" * 64 + ".jpg")]
+    orphan = root / "ab" / "cd" / ("a" * 64 + ".jpg")
+    for path in keep + [orphan]:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+    gc_uploads(now=datetime.utcnow() + timedelta(days=2))
+    assert all(path.exists() for path in keep)
+    assert not orphan.exists()